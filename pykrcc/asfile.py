@@ -0,0 +1,342 @@
+import hashlib
+import mmap
+import os
+import re
+from dataclasses import dataclass
+
+# Sections whose lines are separate variables
+DATA_SECTIONS = ('.TRANS', '.JOINTS', '.REALS', '.STRINGS')
+
+_HEADER = re.compile(r'^(\.[A-Za-z_]+)\s*(.*)$')
+_PROGRAM = re.compile(r'^([^\s(]+)')
+
+
+@dataclass
+class Unit:
+    """
+    Part of an AS file which can be loaded on its own.
+
+    kind is 'program' for a .PROGRAM block, 'variable' for a line of a data section
+    and 'section' for any other block.
+    """
+    kind: str
+    section: str
+    name: str
+    text: str
+
+    @property
+    def key(self) -> str:
+        if self.kind == 'variable':
+            return f'{self.section} {self.name}'
+        return self.name
+
+    def digest(self) -> str:
+        return unit_hash(self.text)
+
+
+def unit_hash(text: str) -> str:
+    """
+    Hash of the AS source which ignores line breaks, indentation and blank lines.
+
+    Args:
+        text (str): AS source.
+
+    Returns:
+        str: Hex digest.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for line in text.splitlines():
+        line = ' '.join(line.split())
+        if line:
+            h.update(line.encode(errors='replace') + b'\n')
+    return h.hexdigest()
+
+
+def parse_units(text: str) -> list:
+    """
+    Splits the AS source into programs, variables and other sections.
+
+    Comment lines ('.*') outside of the blocks are dropped.
+
+    Args:
+        text (str): Content of an .as file or of the save output.
+
+    Returns:
+        list: Units in the order of the file.
+    """
+    units = []
+    block = None
+    lines = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if block is None:
+            m = _HEADER.match(stripped)
+            if m is None or stripped.startswith('.*'):
+                continue
+            section = m.group(1).upper()
+            if section == '.END':
+                continue
+            if section == '.PROGRAM':
+                name = _PROGRAM.match(m.group(2))
+                block = Unit('program', section, name.group(1) if name else '', '')
+            else:
+                block = Unit('section', section, section, '')
+            lines = [line]
+        elif stripped.upper() == '.END':
+            # Data sections are replaced by their variables
+            if block.section not in DATA_SECTIONS:
+                lines.append(line)
+                block.text = '\n'.join(lines) + '\n'
+                units.append(block)
+            block = None
+        elif block.section in DATA_SECTIONS:
+            if stripped:
+                units.append(Unit('variable', block.section, stripped.split()[0], line + '\n'))
+        else:
+            lines.append(line)
+    return units
+
+
+def join_units(units: list) -> str:
+    """
+    Builds a loadable AS source from the units.
+
+    Variables are grouped under the headers of their sections.
+
+    Args:
+        units (list): Units to join.
+
+    Returns:
+        str: AS source.
+    """
+    parts = []
+    variables = {}
+    for unit in units:
+        if unit.kind == 'variable':
+            variables.setdefault(unit.section, []).append(unit.text)
+        else:
+            parts.append(unit.text)
+    for section, lines in variables.items():
+        parts.append(section + '\n' + ''.join(lines) + '.END\n')
+    return ''.join(parts)
+
+
+@dataclass
+class IndexEntry:
+    """
+    Location of a unit in an indexed AS file.
+
+    start and end are byte offsets of the lines of the unit, including the header
+    and .END lines of programs and sections.
+    """
+    kind: str
+    section: str
+    name: str
+    start: int
+    end: int
+
+    @property
+    def key(self) -> str:
+        if self.kind == 'variable':
+            return f'{self.section} {self.name}'
+        return self.name
+
+    @property
+    def size(self) -> int:
+        return self.end - self.start
+
+
+_LINE = re.compile(rb'[^\n]*(?:\n|\Z)')
+_INDEX_HEADER = re.compile(rb'^[ \t]*(\.[A-Za-z_]+)[ \t]*([^\s(]*)[^\n]*(?:\n|\Z)', re.M)
+
+
+class ASIndex:
+    """
+    Index of the programs, variables and sections of an AS file.
+
+    The file is memory-mapped and only scanned for the header and .END lines (and
+    the lines of the data sections), so single units of a large backup can be
+    extracted, compared or loaded without reading or decoding the rest of it.
+    """
+
+    def __init__(self, fname: str) -> None:
+        """
+        Initializes a new instance of the ASIndex class and indexes the file.
+
+        Args:
+            fname (str): Name of the AS file.
+
+        Raises:
+            FileNotFoundError: If the file does not exist.
+        """
+        self.fname = fname
+        self.__file = open(fname, 'rb')
+        size = os.fstat(self.__file.fileno()).st_size
+        # Empty files can't be mapped
+        self.__data = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self.entries = []
+        self.__keys = {}
+        self.__scan()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if isinstance(self.__data, mmap.mmap):
+            self.__data.close()
+        self.__file.close()
+
+    def __scan(self) -> None:
+        data = self.__data
+        pos = 0
+        while True:
+            m = _INDEX_HEADER.search(data, pos)
+            if m is None:
+                break
+            section = m.group(1).decode().upper()
+            pos = m.end()
+            if section == '.END':
+                continue
+            end = _INDEX_HEADER.search(data, pos)
+            while end is not None and end.group(1).upper() != b'.END':
+                end = _INDEX_HEADER.search(data, end.end())
+            body_end = end.start() if end is not None else len(data)
+            block_end = end.end() if end is not None else len(data)
+            if section in DATA_SECTIONS:
+                for line in _LINE.finditer(data, pos, body_end):
+                    name = line.group().split(None, 1)
+                    if name:
+                        self.__add(IndexEntry('variable', section, name[0].decode(errors='replace'), line.start(), line.end()))
+            elif section == '.PROGRAM':
+                self.__add(IndexEntry('program', section, m.group(2).decode(errors='replace'), m.start(), block_end))
+            else:
+                self.__add(IndexEntry('section', section, section, m.start(), block_end))
+            pos = block_end
+
+    def __add(self, entry: IndexEntry) -> None:
+        self.entries.append(entry)
+        self.__keys[entry.key] = entry
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.__keys
+
+    def __getitem__(self, key: str) -> IndexEntry:
+        return self.__keys[key]
+
+    def keys(self) -> list:
+        return list(self.__keys)
+
+    def programs(self) -> list:
+        return [e.name for e in self.entries if e.kind == 'program']
+
+    def view(self, key: str) -> memoryview:
+        """
+        Returns the bytes of the unit without copying them.
+
+        Args:
+            key (str): Program name, section name or '<section> <variable>'.
+
+        Returns:
+            memoryview: Raw bytes of the unit.
+        """
+        entry = self.__keys[key]
+        return memoryview(self.__data)[entry.start:entry.end]
+
+    def text(self, key: str) -> str:
+        """
+        Returns the source of the unit.
+
+        Args:
+            key (str): Program name, section name or '<section> <variable>'.
+
+        Returns:
+            str: Source of the unit with '\\n' line breaks.
+        """
+        entry = self.__keys[key]
+        return self.__data[entry.start:entry.end].decode(errors='replace').replace('\r\n', '\n')
+
+    def digest(self, key: str) -> str:
+        return unit_hash(self.text(key))
+
+    def diff(self, other) -> tuple:
+        """
+        Compares the units with another index.
+
+        Args:
+            other (ASIndex): Index to compare with.
+
+        Returns:
+            tuple: Lists of the keys which are only in this index, only in the other and which differ.
+        """
+        added = [k for k in self.__keys if k not in other]
+        removed = [k for k in other.keys() if k not in self]
+        changed = [k for k in self.__keys if k in other and self.digest(k) != other.digest(k)]
+        return added, removed, changed
+
+    def select(self, keys: list = None) -> list:
+        """
+        Returns the entries of the keys in the order of the file.
+
+        Args:
+            keys (list, optional): Keys of the units. Defaults to all the units.
+
+        Raises:
+            KeyError: If a key is not in the index.
+        """
+        if keys is None:
+            return list(self.entries)
+        selected = {id(self.__keys[k]) for k in keys}
+        return [e for e in self.entries if id(e) in selected]
+
+    def iter_blocks(self, entries: list, max_chars: int) -> iter:
+        """
+        Packs the lines of the entries into load blocks.
+
+        Lines are copied from the mapped file only, variables are grouped under the
+        headers of their sections. Blocks follow the same rules as frames.iter_blocks.
+
+        Args:
+            entries (list): Entries to load, see select().
+            max_chars (int): Maximum size of a block.
+
+        Yields:
+            bytes: Blocks with '\\n' line breaks.
+        """
+        data = self.__data
+        block = bytearray()
+
+        def pieces():
+            section = None
+            for entry in entries:
+                if entry.kind == 'variable':
+                    if section != entry.section:
+                        if section is not None:
+                            yield b'.END\n'
+                        section = entry.section
+                        yield section.encode() + b'\n'
+                elif section is not None:
+                    yield b'.END\n'
+                    section = None
+                pos = entry.start
+                while pos < entry.end:
+                    nl = data.find(b'\n', pos, entry.end)
+                    line_end = entry.end if nl < 0 else nl + 1
+                    yield data[pos:line_end]
+                    pos = line_end
+            if section is not None:
+                yield b'.END\n'
+
+        for line in pieces():
+            if line.endswith(b'\r\n'):
+                line = line[:-2] + b'\n'
+            elif not line.endswith(b'\n'):
+                line += b'\n'
+            if block and len(block) + len(line) + 2 >= max_chars:
+                yield bytes(block)
+                block = bytearray()
+            block += line
+        if block:
+            yield bytes(block)
@@ -0,0 +1,698 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import asyncio
+import socket
+import time
+
+from .frames import SaveParser, SourceReader
+from .frames import SAVE_START, LOAD_START, LOAD_EOF, TRANSFER_END
+from .loadplan import LoadPlan
+from .matcher import TerminatorMatcher
+from .metrics import Metrics
+from .query import ReadPlan
+from .pykrcc import CMD_TERMINATORS, CMD_REPLIES, AS_TERMINATORS, AS_REPLIES, AS_END, AS_BLOCK_ACK, BLOCK_SIZE
+from .telnet import TelnetParser, IAC, DO, WILL, SB, SE, ECHO, TTYPE
+
+
+class AsyncKRCC:
+    """
+    Asyncio client for communication with Kawasaki robot controllers.
+
+    Mirrors the pykrcc class on top of asyncio streams, so one event loop can
+    serve many controllers without a thread per connection.
+    """
+
+    def __init__(self, login: str = 'as', ip: str = None, port: int = 23, timeout: int = 20, tcp_nodelay: bool = False,
+                 metrics: Metrics = None) -> None:
+        """
+        Initializes a new instance of the AsyncKRCC class.
+
+        The connection is not established here, await connect() to open it.
+
+        Args:
+            login (str, optional): Login string. Defaults to 'as'.
+            ip (str, optional): IP address of the robot. Defaults to None.
+            port (int, optional): Port number. Defaults to 23.
+            timeout (int, optional): Timeout in seconds. Defaults to 20.
+            tcp_nodelay (bool, optional): TCP_NODELAY option. Defaults to False.
+            metrics (Metrics, optional): Metrics to collect the statistics of the session to. Defaults to a new Metrics labeled with the address.
+        """
+        # Initialize parameters
+        self.__login = login
+        self.__ip = ip
+        self.__port = port
+        self.TimeoutValue = timeout
+        self.__tcp_nodelay = tcp_nodelay
+
+        # Initialize internal data
+        self.IsConnected = False
+        self.__reader = None
+        self.__writer = None
+        self.__eof = False
+        self.__parser = TelnetParser(self.__process_options)
+        self.__cmd_terminators = TerminatorMatcher(CMD_TERMINATORS)
+        self.__as_terminators = TerminatorMatcher(AS_TERMINATORS)
+        # Index of the terminator which ended the last read, -1 on timeout
+        self.LastTerminator = -1
+        # Maximum size of a load block
+        self.BlockSize = BLOCK_SIZE
+        # Time given to every load block of a controller which does not acknowledge them, in seconds
+        self.BlockPace = 0.05
+        # Duration of the phases of the last load in seconds
+        self.LoadTiming = {}
+        # Duration of the phases of the last connection in seconds
+        self.ConnectTiming = {}
+        if metrics is None:
+            metrics = Metrics({'controller': f'{ip}:{port}'})
+        self.metrics = metrics
+
+        self.cmdInquiry = self.default_cmd_inquiry
+        self.asInquiry = self.default_as_inquiry
+        self.progress = self.default_progress
+
+    async def __aenter__(self):
+        if not self.IsConnected:
+            await self.connect()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.disconnect()
+
+    def __process_options(self, cmd: bytes, opt: bytes) -> None:
+        """
+        Handles telnet options.
+
+        We need to respond to some options to make the telnet connection work.
+        """
+        IS = b'\00'
+        if cmd == WILL and opt == ECHO:
+            # We want to echo the characters we type
+            self.__writer.write(IAC + DO + opt)
+        elif cmd == DO and opt == TTYPE:
+            # We want to send the terminal type
+            self.__writer.write(IAC + WILL + TTYPE)
+        elif cmd == SB:
+            # This is a suboption
+            self.__writer.write(IAC + SB + TTYPE + IS + 'VT100'.encode() + IS + IAC + SE)
+        elif cmd == SE:
+            # This is a suboption end
+            pass
+        else: logger.error('Unexpected telnet negotiation')
+
+    async def __fill(self, timeout: float) -> bool:
+        """
+        Reads the next chunk from the stream into the cooked buffer.
+
+        Args:
+            timeout (float): Time to wait for data in seconds.
+
+        Returns:
+            bool: False if nothing arrived before the timeout or the stream ended.
+        """
+        if self.__eof:
+            return False
+        try:
+            # A zero timeout would cancel the read before it picks up the buffered data
+            data = await asyncio.wait_for(self.__reader.read(4096), max(timeout, 0.001))
+        except asyncio.TimeoutError:
+            return False
+        if not data:
+            self.__eof = True
+            return False
+        self.__parser.feed(data)
+        return True
+
+    def __take(self, end: int) -> bytes:
+        cooked = self.__parser.cooked
+        response = bytes(cooked[:end])
+        del cooked[:end]
+        return response
+
+    async def __write(self, *data: bytes) -> int:
+        """
+        Writes the data to the connection.
+
+        Several chunks are joined and sent at once, so the frames which don't wait
+        for a reply in between go out in one packet.
+
+        Args:
+            data (bytes): The data to write.
+
+        Returns:
+            int: The number of bytes written.
+        """
+        data = data[0] if len(data) == 1 else b''.join(data)
+        self.__writer.write(data.replace(IAC, IAC + IAC))
+        await self.__writer.drain()
+        self.metrics.inc('writes_total')
+        self.metrics.inc('bytes_sent_total', len(data))
+        logger.debug(data)
+        return len(data)
+
+    async def __read_until(self, match: bytes, timeout: float = None) -> bytes:
+        """
+        Reads from the connection until a match is found.
+
+        Args:
+            match (bytes): The match to search for.
+            timeout (float, optional): The timeout in seconds. Defaults to None.
+
+        Returns:
+            bytes: The data read from the connection.
+        """
+        _, _, response = await self.__read_until_many(TerminatorMatcher([match]), timeout)
+        return response
+
+    async def __read_until_many(self, matches: TerminatorMatcher, timeout: float = None) -> tuple:
+        """
+        Reads from the connection until one of the matches is found.
+
+        The index of the match is stored to LastTerminator.
+
+        Args:
+            matches (TerminatorMatcher): The matches to search for.
+            timeout (float, optional): The timeout in seconds. Defaults to None.
+
+        Returns:
+            tuple: Index of the match (-1 on timeout), the match and the data read.
+        """
+        if timeout is None:
+            timeout = self.TimeoutValue
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        pos = 0
+        self.LastTerminator = -1
+        while True:
+            cooked = self.__parser.cooked
+            found = matches.search(cooked, pos)
+            if found is not None:
+                index, _, end = found
+                self.LastTerminator = index
+                response = self.__take(end)
+                self.metrics.inc('bytes_received_total', len(response))
+                logger.debug(response)
+                return index, matches.terminators[index], response
+            pos = matches.resume(len(cooked))
+            if not await self.__fill(deadline - loop.time()):
+                break
+        if self.__eof and not self.__parser.cooked:
+            raise EOFError('telnet connection closed')
+        response = self.__take(len(self.__parser.cooked))
+        self.metrics.inc('bytes_received_total', len(response))
+        self.metrics.inc('timeouts_total')
+        logger.debug(response)
+        return -1, None, response
+
+    def __read_buffered(self) -> bytes:
+        """
+        Takes the data which has already been received, without waiting for more.
+
+        Returns:
+            bytes: The data read from the connection.
+        """
+        response = self.__take(len(self.__parser.cooked))
+        self.metrics.inc('bytes_received_total', len(response))
+        logger.debug(response)
+        return response
+
+    async def __start_save(self, prog: str = None, qual: str = None) -> bool:
+        """
+        Sends the save command and requests the data transfer.
+
+        Args:
+            prog (str, optional): Program name. Defaults to None.
+            qual (str, optional): Qualifier. Defaults to None.
+
+        Returns:
+            bool: True if the transfer was started, False if save/load is already in progress.
+        """
+        _prog = ''
+        if prog is not None:
+            _prog = '=' + prog
+        _qual = ''
+        if qual is not None:
+            _qual = qual
+
+        await self.__write(f'save{_qual} file.as{_prog}\r\n'.encode())
+        response = await self.__read_until(b'.as', 1)
+        # Check if save/load is in progress
+        if b'LOAD in progress' in response:
+            logger.error('SAVE/LOAD in progress')
+            return False
+        await self.__write(SAVE_START)
+        return True
+
+    async def __iter_save_lines(self):
+        """
+        Streams the source code lines of the started save.
+
+        The frames are read as they arrive until the parser has seen the end record.
+
+        Yields:
+            bytes: Source code lines without line breaks.
+
+        Raises:
+            TimeoutError: If the data stopped before the end of the transfer.
+        """
+        parser = SaveParser(logger.debug)
+        while not parser.ended:
+            t_frame = time.perf_counter()
+            data_block = await self.__read_until(b'\x17')
+            if not data_block.endswith(b'\x17'):
+                raise TimeoutError('Save stopped before the end of the transfer')
+            # Take the frames which have already arrived too
+            data_block = data_block + self.__read_buffered()
+            self.metrics.observe('save_frame_seconds', time.perf_counter() - t_frame)
+            for line in parser.feed(data_block):
+                yield line
+        for line in parser.close():
+            yield line
+        await self.__write(TRANSFER_END, b'\r\n', TRANSFER_END)
+        await self.__read_until(b'>')
+
+    async def iter_save(self, prog: str = None, qual: str = None):
+        """
+        Reads the source code of the program from the controller line by line.
+
+        Args:
+            prog (str, optional): Program name. Defaults to None.
+            qual (str, optional): Qualifier. Defaults to None.
+
+        Yields:
+            str: Source code lines without line breaks.
+
+        Raises:
+            ConnectionError: If not connected.
+            RuntimeError: If save/load is already in progress.
+            TimeoutError: If the controller stopped sending before the end of the transfer.
+        """
+        if not self.IsConnected:
+            raise ConnectionError('Not connected')
+        if not await self.__start_save(prog, qual):
+            raise RuntimeError('SAVE/LOAD in progress')
+        async for line in self.__iter_save_lines():
+            yield line.decode()
+
+    async def connect(self, login: str = None, ip: str = None, port: int = None, timeout: int = None, tcp_nodelay: bool = None) -> int:
+        """
+        Tries to establish connection to the robot and login.
+
+        Arguments left as None keep the values given to the constructor.
+
+        Args:
+            login (str, optional): Login string. Defaults to None.
+            ip (str, optional): IP address of the robot. Defaults to None.
+            port (int, optional): Port number. Defaults to None.
+            timeout (int, optional): Timeout in seconds. Defaults to None.
+            tcp_nodelay (bool, optional): TCP_NODELAY option. Defaults to None.
+
+        Returns:
+            int: 0 if connected successfully,
+            -1 if connection could not be established,
+            -2 if timeout occurred while trying to login,
+            -3 if an unexpected error occurred while trying to login.
+        """
+        if login is not None:
+            self.__login = login
+        if ip is not None:
+            self.__ip = ip
+        if port is not None:
+            self.__port = port
+        if timeout is not None:
+            self.TimeoutValue = timeout
+        if tcp_nodelay is not None:
+            self.__tcp_nodelay = tcp_nodelay
+
+        timing = {}
+        self.ConnectTiming = timing
+        t_start = time.perf_counter()
+        # Trying to establish connection
+        try:
+            logger.debug(f'Connecting to robot with {self.__ip}:{self.__port}')
+            self.__reader, self.__writer = await asyncio.wait_for(
+                asyncio.open_connection(self.__ip, self.__port), self.TimeoutValue)
+            sock = self.__writer.get_extra_info('socket')
+            if sock is not None:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, self.__tcp_nodelay)
+            self.__eof = False
+            self.__parser.reset()
+            logger.debug('Connected successfully')
+        except Exception as e:
+            logger.error(f'Failed to connect to robot: {e}')
+            return -1
+        t_connected = time.perf_counter()
+        timing['connect'] = t_connected - t_start
+        # Trying to login
+        try:
+            logger.debug('Trying to login')
+            # Telnet options are negotiated while waiting for the login prompt
+            index, _, _ = await self.__read_until_many(TerminatorMatcher([b'login: ']))
+            if index < 0:
+                raise TimeoutError()
+            t_prompt = time.perf_counter()
+            timing['negotiation'] = t_prompt - t_connected
+            await self.__write(self.__login.encode() + b'\r\n')
+            index, _, _ = await self.__read_until_many(TerminatorMatcher([b'>']))
+            if index < 0:
+                raise TimeoutError()
+            t_login = time.perf_counter()
+            timing['login'] = t_login - t_prompt
+            timing['total'] = t_login - t_start
+        except TimeoutError:
+            logger.error('Timeout while trying to login')
+            return -2
+        except Exception as e:
+            logger.error(f'Unexpected error while trying to login: {e}')
+            return -3
+        self.IsConnected = True
+        self.metrics.observe('connect_seconds', timing['total'])
+        logger.debug(f'Connect timing: {timing}')
+        return 0
+
+    async def disconnect(self) -> bool:
+        """
+        Disconnects from the robot.
+
+        Returns:
+            bool: True if disconnected successfully, False if not.
+        """
+        if not self.IsConnected:
+            logger.info('Robot is already disconnected')
+            return True
+        try:
+            self.__writer.close()
+            await self.__writer.wait_closed()
+        except Exception as e:
+            logger.error(f'Failed to close connection: {e}')
+            return False
+        self.IsConnected = False
+        logger.info('Robot disconnected')
+        return True
+
+    def name(self) -> str:
+        """
+        Name of the connection.
+
+        Returns:
+            str: Name of the connection in format 'TCP <login>@<ip>, <port>, <timeout>{,TCP_NODELAY}'.
+        """
+        return f'TCP {self.__login}@{self.__ip}, {self.__port}, {self.TimeoutValue}{"," if not self.__tcp_nodelay else "TCP_NODELAY"}'
+
+    async def command(self, cmd: str = None, timeout: int = None) -> tuple:
+        """
+        Sends a command to the robot controller and returns the response.
+
+        Args:
+            cmd (str, optional): Command string. Defaults to None.
+            timeout (int, optional): Time to wait for each part of the response in seconds. Defaults to None (5 s).
+
+        Returns:
+            tuple: The return code and the response string.
+            Return code is 0 if the command was sent successfully,
+            -1 if no prompt or inquiry arrived before the timeout,
+            -2 if not connected or an error occurred.
+        """
+        if not self.IsConnected:
+            return (-2, 'Not connected')
+        if cmd is None:
+            cmd = ''
+        response_ret = b''
+        metrics = self.metrics
+        metrics.inc('commands_total')
+        t_start = time.perf_counter()
+        wait = 5 if timeout is None else timeout
+        try:
+            await self.__write(cmd.encode() + b'\r\n')
+            index, _, response = await self.__read_until_many(self.__cmd_terminators, wait)
+            response_ret = response_ret + response
+            inquiries = 0
+            while True:
+                if index < 0:
+                    raise TimeoutError()
+                request = self.cmdInquiry(response)
+                if request is None:
+                    break
+                inquiries += 1
+                await self.__write(request)
+                index, _, response = await self.__read_until_many(self.__cmd_terminators, wait)
+                response_ret = response_ret + response
+            if inquiries:
+                metrics.inc('command_inquiries_total', inquiries)
+            metrics.observe('command_seconds', time.perf_counter() - t_start)
+            return (0, response_ret.decode())
+
+        except TimeoutError:
+            logger.warning('Timeout while reading')
+            metrics.inc('command_errors_total')
+            return (-1, 'Timeout while reading')
+        except Exception as e:
+            logger.error(f'Unexpected error: {e}')
+            metrics.inc('command_errors_total')
+            return (-2, 'Unexpected error')
+
+    async def read_many(self, queries, timeout: int = None) -> tuple:
+        """
+        Reads several AS values with as few commands as possible.
+
+        Args:
+            queries (list or ReadPlan): AS expressions, or (expression, kind) tuples with kind
+                'real', 'int', 'sig', 'trans' or 'joint'. Strings starting with 'SIG(' are signals,
+                strings starting with '#' are joint poses, other strings are reals.
+            timeout (int, optional): Timeout in seconds. Defaults to None.
+
+        Returns:
+            tuple: The return code and the dict of the values keyed by the expressions.
+            Return code is 0 if the values were read successfully,
+            -1 if timeout occurred,
+            -2 if not connected or an error occurred,
+            -3 if the response could not be parsed, the response is returned instead of the values.
+        """
+        plan = queries if isinstance(queries, ReadPlan) else ReadPlan(queries)
+        responses = []
+        for cmd in plan.commands:
+            code, response = await self.command(cmd, timeout)
+            if code != 0:
+                return (code, response)
+            responses.append(response)
+        try:
+            return (0, plan.parse(responses))
+        except ValueError as e:
+            logger.error(f'Failed to parse the values: {e}')
+            return (-3, '\n'.join(responses))
+
+    def default_cmd_inquiry(self, as_msg: bytearray, index: int = None) -> bytearray:
+        """
+        Default inquiry function for commands.
+
+        Returns the appropriate response to the terminator which ended the message.
+
+        Args:
+            as_msg (bytearray): The message from the robot.
+            index (int, optional): Index of the terminator in CMD_TERMINATORS. Defaults to LastTerminator.
+        """
+        if index is None:
+            index = self.LastTerminator
+        if index < 0:
+            return b''
+        return CMD_REPLIES[index]
+
+    def default_as_inquiry(self, as_msg: bytearray, index: int = None) -> bytearray:
+        """
+        Default inquiry function for save/load commands.
+
+        Returns the appropriate response to the terminator which ended the message.
+
+        Args:
+            as_msg (bytearray): The message from the robot.
+            index (int, optional): Index of the terminator in AS_TERMINATORS. Defaults to LastTerminator.
+        """
+        if index is None:
+            index = self.LastTerminator
+        if index < 0:
+            return None
+        return AS_REPLIES[index]
+
+    def default_progress(self, val: int, total: int) -> None:
+        """
+        Default progress function.
+
+        Simply logs the progress.
+
+        Args:
+            val (int): Current progress value.
+            total (int): Total progress value.
+        """
+        logger.info(f'Progress: {val}/{total}')
+        return
+
+    async def __wait_as_event(self, timeout: float, events: tuple) -> int:
+        """
+        Reads the save/load responses and answers the inquiries until one of the events.
+
+        Args:
+            timeout (float): The timeout of a single read.
+            events (tuple): Indexes of AS_TERMINATORS to wait for.
+
+        Returns:
+            int: Index of the event, -1 if nothing matched before the timeout.
+        """
+        while True:
+            index, _, response = await self.__read_until_many(self.__as_terminators, timeout)
+            request = self.asInquiry(response)
+            if request is not None:
+                await self.__write(request)
+            if index < 0 or index in events:
+                return index
+
+    async def load(self, fname, qual: str = None) -> int:
+        """
+        Loads a file into the controller.
+
+        Every block waits for the acknowledgement of the controller, the idle timeouts
+        are used only if the controller stops responding. The duration of the phases
+        is stored to LoadTiming.
+
+        The source is packed into blocks while it is sent, see pykrcc.load().
+
+        Args:
+            fname (str or bytes or iterable or LoadPlan): Name of the file to load, the AS source
+                or its lines, or its prepared plan.
+            qual (str, optional): Qualifier string. Defaults to None.
+
+        Returns:
+            int: Return code. 0 if the file was loaded successfully,
+            -1 if timeout occurred,
+            -2 if save/load is already in progress,
+            -3 if not connected or the file does not exist,
+            -4 if an error occurred.
+        """
+        # Check connection
+        if not self.IsConnected:
+            logger.error('Not connected')
+            return -3
+        # Get qualifier
+        _qual = b''
+        if qual is not None:
+            _qual = qual.encode()
+        timing = {}
+        self.LoadTiming = timing
+        t_start = t_phase = time.perf_counter()
+        # Load file
+        source = None
+        try:
+            if isinstance(fname, LoadPlan):
+                file_size = fname.size
+                payloads = zip(fname.sizes, fname.frames)
+            else:
+                source = SourceReader(fname)
+                file_size = source.size
+                payloads = source.frames(self.BlockSize)
+            logger.debug(f'File size: {file_size}')
+        except FileNotFoundError:
+            logger.error(f'File not found: {fname}')
+            return -3
+        except Exception as e:
+            logger.error(f'Unexpected error: {e}')
+            if source is not None:
+                source.close()
+            return -4
+        t_now = time.perf_counter()
+        timing['prepare'], t_phase = t_now - t_phase, t_now
+        # Load data to controller
+        try:
+            await self.__write(b'load' + _qual + b' file' + b'\r\n')
+            _, _, response = await self.__read_until_many(self.__as_terminators, 2)
+            # Check if load is in progress
+            if b'LOAD in progress' in response:
+                logger.error('SAVE/LOAD in progress')
+                return -2
+            await self.__write(LOAD_START)
+            response = await self.__read_until(b'\x17')
+            t_now = time.perf_counter()
+            timing['start'], t_phase = t_now - t_phase, t_now
+
+            loaded_size = 0
+            acked = True
+            index = AS_BLOCK_ACK
+            for size, frame in payloads:
+                if index == AS_END:
+                    logger.error('Load ended by the controller before all the data was sent')
+                    return -4
+                loaded_size = loaded_size + size
+                self.progress(loaded_size, file_size)
+                t_block = time.perf_counter()
+                await self.__write(frame)
+                index = await self.__wait_as_event(1 if acked else self.BlockPace, (AS_BLOCK_ACK, AS_END))
+                if index < 0 and acked:
+                    # The controller does not acknowledge the blocks, the rest is paced by time
+                    logger.warning('Load block not acknowledged, pacing the blocks by time')
+                    acked = False
+                elif acked:
+                    self.metrics.observe('load_block_seconds', time.perf_counter() - t_block)
+            self.progress(loaded_size, loaded_size if file_size is None else file_size)
+            t_now = time.perf_counter()
+            timing['transfer'], t_phase = t_now - t_phase, t_now
+            # Answer the pending inquiries and take the late acknowledgements
+            ended = index == AS_END
+            if not ended:
+                ended = await self.__wait_as_event(0, (AS_END,)) == AS_END
+            t_now = time.perf_counter()
+            timing['drain'], t_phase = t_now - t_phase, t_now
+            if ended:
+                await self.__write(LOAD_EOF, b'\r\n', TRANSFER_END)
+            else:
+                await self.__write(LOAD_EOF, b'\r\n')
+                if await self.__wait_as_event(self.TimeoutValue, (AS_END,)) < 0:
+                    raise TimeoutError('End of the load not received')
+                await self.__write(TRANSFER_END)
+            response = await self.__read_until(b'>')
+            t_now = time.perf_counter()
+            timing['finish'] = t_now - t_phase
+            timing['total'] = t_now - t_start
+            self.metrics.observe('load_seconds', timing['total'])
+            logger.debug(f'Load timing: {timing}')
+            return 0
+        except TimeoutError:
+            logger.warning('Timeout while reading')
+            return -1
+        except Exception as e:
+            logger.error(f'Unexpected error: {e}')
+            return -4
+        finally:
+            if source is not None:
+                source.close()
+
+    async def save(self, fname: str, prog: str = None, qual: str = None) -> int:
+        """
+        Saves the source code of the program to file.
+
+        Args:
+            fname (str): Name of the file to save the data to.
+            prog (str, optional): Program name. Defaults to None.
+            qual (str, optional): Qualifier. Defaults to None.
+
+        Returns:
+            int: 0 if saved successfully,
+            -1 if timeout occurred,
+            -2 if not connected or save/load is already in progress,
+            -4 if an error occurred.
+        """
+        if not self.IsConnected:
+            logger.error('Not connected')
+            return -2
+        t_start = time.perf_counter()
+        try:
+            with open(fname, 'w') as f:
+                if not await self.__start_save(prog, qual):
+                    return -2
+                async for line in self.__iter_save_lines():
+                    f.write(line.decode() + '\n')
+            self.metrics.observe('save_seconds', time.perf_counter() - t_start)
+            return 0
+        except TimeoutError:
+            logger.warning('Timeout while reading')
+            return -1
+        except Exception as e:
+            logger.error(f'Unexpected error: {e}')
+            return -4
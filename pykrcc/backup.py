@@ -0,0 +1,229 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+import zlib
+
+from .fleet import Fleet
+
+_HEADER = re.compile(r'^\s*\.([A-Za-z_]+)\s*(\S*)')
+
+
+def iter_chunks(lines):
+    """
+    Groups the lines of the save output into chunks of whole programs and sections.
+
+    Lines between the blocks form chunks of their own, so joining the chunks gives
+    back the original text.
+
+    Args:
+        lines (iterable): Lines without line breaks, e.g. from iter_save().
+
+    Yields:
+        tuple: Name of the chunk ('.PROGRAM name', '.TRANS', ... or '' for the lines between blocks) and its text.
+    """
+    name = ''
+    block = []
+    in_block = False
+    for line in lines:
+        m = _HEADER.match(line)
+        word = m.group(1).upper() if m else None
+        if not in_block and word is not None and word != 'END' and not line.lstrip().startswith('.*'):
+            if block:
+                yield name, '\n'.join(block) + '\n'
+            name = f'.{word} {m.group(2)}' if word == 'PROGRAM' else f'.{word}'
+            block = [line]
+            in_block = True
+            continue
+        block.append(line)
+        if in_block and word == 'END':
+            yield name, '\n'.join(block) + '\n'
+            name = ''
+            block = []
+            in_block = False
+    if block:
+        yield name, '\n'.join(block) + '\n'
+
+
+class BackupStore:
+    """
+    Content-addressed store of compressed chunks with a manifest per robot and run.
+
+    Chunks are stored once under their hash, a run only writes the chunks which
+    are not in the store yet and its manifest.
+    """
+
+    def __init__(self, root: str, level: int = 6) -> None:
+        """
+        Initializes a new instance of the BackupStore class.
+
+        Args:
+            root (str): Directory of the store, created if needed.
+            level (int, optional): zlib compression level. Defaults to 6.
+        """
+        self.root = root
+        self.level = level
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        os.makedirs(os.path.join(root, 'manifests'), exist_ok=True)
+
+    def __object(self, digest: str) -> str:
+        return os.path.join(self.root, 'objects', digest[:2], digest[2:])
+
+    def __write(self, fname: str, data: bytes) -> None:
+        # Write to a temporary file first, so a crash never leaves a broken object
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(fname))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, fname)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def put(self, data: bytes) -> tuple:
+        """
+        Stores a chunk.
+
+        Args:
+            data (bytes): Content of the chunk.
+
+        Returns:
+            tuple: Hash of the chunk and True if it was new.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        fname = self.__object(digest)
+        if os.path.exists(fname):
+            return digest, False
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        self.__write(fname, zlib.compress(data, self.level))
+        return digest, True
+
+    def get(self, digest: str) -> bytes:
+        with open(self.__object(digest), 'rb') as f:
+            return zlib.decompress(f.read())
+
+    def __manifest(self, robot: str, run: str) -> str:
+        return os.path.join(self.root, 'manifests', robot.replace(':', '_'), run + '.json')
+
+    def write_manifest(self, robot: str, run: str, manifest: dict) -> str:
+        fname = self.__manifest(robot, run)
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        self.__write(fname, json.dumps(manifest, indent=1).encode())
+        return fname
+
+    def read_manifest(self, robot: str, run: str = None) -> dict:
+        """
+        Reads the manifest of a run.
+
+        Args:
+            robot (str): Name of the robot ('<ip>:<port>').
+            run (str, optional): Name of the run. Defaults to the last run.
+
+        Raises:
+            FileNotFoundError: If there is no such run.
+        """
+        if run is None:
+            runs = self.runs(robot)
+            if not runs:
+                raise FileNotFoundError(f'No backup of {robot}')
+            run = runs[-1]
+        with open(self.__manifest(robot, run)) as f:
+            return json.load(f)
+
+    def runs(self, robot: str) -> list:
+        """
+        Returns the names of the runs of the robot, oldest first.
+        """
+        path = os.path.dirname(self.__manifest(robot, 'x'))
+        if not os.path.isdir(path):
+            return []
+        return sorted(f[:-5] for f in os.listdir(path) if f.endswith('.json'))
+
+    def restore(self, robot: str, fname: str, run: str = None) -> str:
+        """
+        Writes the saved file of a run.
+
+        Args:
+            robot (str): Name of the robot ('<ip>:<port>').
+            fname (str): Name of the file to write.
+            run (str, optional): Name of the run. Defaults to the last run.
+
+        Returns:
+            str: Name of the written file.
+        """
+        manifest = self.read_manifest(robot, run)
+        with open(fname, 'wb') as f:
+            for chunk in manifest['chunks']:
+                f.write(self.get(chunk['digest']))
+        return fname
+
+
+class BackupEngine:
+    """
+    Saves many controllers in parallel into a BackupStore.
+
+    The save output is streamed line by line and stored chunk by chunk, so a
+    controller never needs more memory than its largest program. The manifest is
+    written only after the save ended with its end record, chunks of an incomplete
+    save are left in the store unreferenced.
+    """
+
+    def __init__(self, store: BackupStore, specs: list, max_workers: int = 8, timeout: float = None) -> None:
+        """
+        Initializes a new instance of the BackupEngine class.
+
+        Args:
+            store (BackupStore): Store of the backups.
+            specs (list): Connection specs as ConnectionSpec or dicts.
+            max_workers (int, optional): Maximum number of controllers saved at the same time. Defaults to 8.
+            timeout (float, optional): Time limit for one controller in seconds. Defaults to None.
+        """
+        self.store = store
+        self.fleet = Fleet(specs, max_workers, timeout)
+
+    def __backup(self, session, spec, run: str) -> tuple:
+        manifest = {'robot': spec.name, 'run': run, 'time': time.time(), 'chunks': []}
+        size = 0
+        new = 0
+        new_bytes = 0
+        try:
+            for name, text in iter_chunks(session.iter_save()):
+                data = text.encode()
+                digest, created = self.store.put(data)
+                manifest['chunks'].append({'name': name, 'digest': digest, 'size': len(data)})
+                size += len(data)
+                if created:
+                    new += 1
+                    new_bytes += len(data)
+        except RuntimeError:
+            return (-2, 'SAVE/LOAD in progress')
+        except ConnectionError:
+            return (-2, 'Not connected')
+        except TimeoutError:
+            # The save did not end with its end record, the snapshot is incomplete
+            logger.error(f'{spec.name}: save incomplete, no manifest written')
+            return (-1, 'Timeout while reading')
+        manifest.update(size=size, new_chunks=new, new_bytes=new_bytes)
+        fname = self.store.write_manifest(spec.name, run, manifest)
+        logger.info(f'{spec.name}: {len(manifest["chunks"])} chunks, {new} new ({new_bytes} of {size} bytes)')
+        return (0, fname)
+
+    def run(self, run: str = None, timeout: float = None):
+        """
+        Backs up every controller.
+
+        Args:
+            run (str, optional): Name of the run. Defaults to the current time ('YYYYmmdd-HHMMSS').
+            timeout (float, optional): Time limit for one controller in seconds. Defaults to the engine timeout.
+
+        Returns:
+            FleetReport: Results with the names of the manifests.
+        """
+        if run is None:
+            run = time.strftime('%Y%m%d-%H%M%S')
+        return self.fleet.run(lambda session, spec: self.__backup(session, spec, run), 'backup', timeout)
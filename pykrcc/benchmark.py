@@ -0,0 +1,268 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import argparse
+import importlib.metadata
+import itertools
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from .pykrcc import pykrcc, BLOCK_SIZE
+
+
+def percentile(values: list, q: float) -> float:
+    """
+    Percentile with linear interpolation between the closest ranks.
+
+    Args:
+        values (list): Measured values.
+        q (float): Percentile in range 0..100.
+
+    Returns:
+        float: The percentile, None for no values.
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * q / 100
+    f = int(k)
+    c = min(f + 1, len(values) - 1)
+    return values[f] + (values[c] - values[f]) * (k - f)
+
+
+def make_program(size: int) -> str:
+    """
+    Generates AS source of about the given size in bytes.
+
+    Args:
+        size (int): Size of the source.
+
+    Returns:
+        str: AS source with programs of 100 lines each.
+    """
+    lines = []
+    total = 0
+    prog = 0
+    while total < size:
+        head = f'.PROGRAM bench{prog}()\n'
+        lines.append(head)
+        total += len(head)
+        for i in range(100):
+            line = f'  LMOVE pos{i} ; step {i}\n'
+            lines.append(line)
+            total += len(line)
+        lines.append('.END\n')
+        total += 5
+        prog += 1
+    return ''.join(lines)
+
+
+class _Simulator:
+    """
+    Controller simulator running in a separate process, so it doesn't affect the measurements.
+    """
+
+    def __init__(self, latency: float = 0.0, load: str = None) -> None:
+        cmd = [sys.executable, '-m', 'pykrcc.simulator', '--port', '0', '--latency', str(latency)]
+        if load is not None:
+            cmd += ['--load', load]
+        env = dict(os.environ)
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env['PYTHONPATH'] = root + os.pathsep + env.get('PYTHONPATH', '')
+        self.process = subprocess.Popen(cmd, stdout=subprocess.PIPE, env=env, text=True)
+        line = self.process.stdout.readline()
+        m = re.search(r'(\S+):(\d+)$', line.strip())
+        if m is None:
+            self.process.kill()
+            raise RuntimeError(f'Simulator failed to start: {line!r}')
+        self.host, self.port = m.group(1), int(m.group(2))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.process.kill()
+        self.process.wait()
+
+
+def _measure(operation, repeat: int) -> dict:
+    """
+    Runs the operation and collects the wall time, CPU time and peak memory.
+
+    The timed runs are done without tracemalloc, its overhead would be in the times.
+    The peak memory is taken from one more run with tracing.
+
+    Args:
+        operation (callable): Returns the number of bytes transferred or None.
+        repeat (int): Number of timed runs.
+
+    Returns:
+        dict: Measurements.
+    """
+    samples = []
+    transferred = 0
+    errors = 0
+    cpu_start = time.thread_time()
+    for _ in range(repeat):
+        t_start = time.perf_counter()
+        ret = operation()
+        samples.append(time.perf_counter() - t_start)
+        if ret is None or ret < 0:
+            errors += 1
+        else:
+            transferred += ret
+    cpu = time.thread_time() - cpu_start
+    # Separate pass for the memory
+    tracemalloc.start()
+    try:
+        operation()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    wall = sum(samples)
+    return {
+        'runs': repeat,
+        'errors': errors,
+        'wall_s': wall,
+        'p50_s': percentile(samples, 50),
+        'p95_s': percentile(samples, 95),
+        'p99_s': percentile(samples, 99),
+        'mean_s': wall / repeat if repeat else None,
+        'throughput_Bps': transferred / wall if wall and transferred else None,
+        'cpu_s': cpu,
+        'peak_mem_bytes': peak,
+    }
+
+
+def bench_command(latency: float, tcp_nodelay: bool, repeat: int) -> dict:
+    """
+    Measures the round trip time of command().
+    """
+    with _Simulator(latency) as sim:
+        session = pykrcc(ip=sim.host, port=sim.port, timeout=10, tcp_nodelay=tcp_nodelay)
+        def operation():
+            code, response = session.command('id')
+            return len(response) if code == 0 else -1
+        result = _measure(operation, repeat)
+        session.disconnect()
+    return result
+
+
+def bench_save(size: int, latency: float, tcp_nodelay: bool, repeat: int, workdir: str) -> dict:
+    """
+    Measures the throughput of save().
+    """
+    source = os.path.join(workdir, f'source_{size}.as')
+    with open(source, 'w') as f:
+        f.write(make_program(size))
+    target = os.path.join(workdir, 'saved.as')
+    with _Simulator(latency, source) as sim:
+        session = pykrcc(ip=sim.host, port=sim.port, timeout=10, tcp_nodelay=tcp_nodelay)
+        def operation():
+            code = session.save(target)
+            return os.path.getsize(target) if code == 0 else code
+        result = _measure(operation, repeat)
+        session.disconnect()
+    return result
+
+
+def bench_load(size: int, block_size: int, latency: float, tcp_nodelay: bool, repeat: int, workdir: str) -> dict:
+    """
+    Measures the throughput of load().
+    """
+    source = os.path.join(workdir, f'source_{size}.as')
+    with open(source, 'w') as f:
+        f.write(make_program(size))
+    file_size = os.path.getsize(source)
+    with _Simulator(latency) as sim:
+        session = pykrcc(ip=sim.host, port=sim.port, timeout=10, tcp_nodelay=tcp_nodelay)
+        session.BlockSize = block_size
+        session.progress = lambda val, total: None
+        def operation():
+            code = session.load(source, '/Q')
+            return file_size if code == 0 else code
+        result = _measure(operation, repeat)
+        session.disconnect()
+    return result
+
+
+def run(sizes: list = (10000, 100000, 1000000), block_sizes: list = (BLOCK_SIZE,), latencies: list = (0.0, 0.001),
+        nodelay: list = (False, True), command_repeat: int = 200, transfer_repeat: int = 3, operations: list = ('command', 'save', 'load')) -> dict:
+    """
+    Runs the benchmark matrix against the controller simulator.
+
+    Args:
+        sizes (list, optional): Program sizes for save and load in bytes.
+        block_sizes (list, optional): Load block sizes.
+        latencies (list, optional): Reply delays of the simulator in seconds.
+        nodelay (list, optional): TCP_NODELAY options.
+        command_repeat (int, optional): Number of commands per measurement. Defaults to 200.
+        transfer_repeat (int, optional): Number of saves/loads per measurement. Defaults to 3.
+        operations (list, optional): Operations to measure. Defaults to all.
+
+    Returns:
+        dict: Benchmark environment and the list of results.
+    """
+    try:
+        version = importlib.metadata.version('pykrcc')
+    except importlib.metadata.PackageNotFoundError:
+        version = None
+    report = {
+        'meta': {
+            'pykrcc': version,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        },
+        'results': [],
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        for latency, tcp_nodelay in itertools.product(latencies, nodelay):
+            params = {'latency': latency, 'tcp_nodelay': tcp_nodelay}
+            if 'command' in operations:
+                result = bench_command(latency, tcp_nodelay, command_repeat)
+                report['results'].append({'operation': 'command', **params, **result})
+                logger.info(f'command {params}: p50 {result["p50_s"] * 1000:.3f} ms')
+            for size in sizes:
+                if 'save' in operations:
+                    result = bench_save(size, latency, tcp_nodelay, transfer_repeat, workdir)
+                    report['results'].append({'operation': 'save', 'size': size, **params, **result})
+                    logger.info(f'save {size} {params}: {result["throughput_Bps"] or 0:.0f} B/s')
+                if 'load' in operations:
+                    for block_size in block_sizes:
+                        result = bench_load(size, block_size, latency, tcp_nodelay, transfer_repeat, workdir)
+                        report['results'].append({'operation': 'load', 'size': size, 'block_size': block_size, **params, **result})
+                        logger.info(f'load {size}/{block_size} {params}: {result["throughput_Bps"] or 0:.0f} B/s')
+    return report
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description='pykrcc benchmark against the controller simulator')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000], help='program sizes in bytes')
+    parser.add_argument('--block-sizes', type=int, nargs='+', default=[BLOCK_SIZE], help='load block sizes')
+    parser.add_argument('--latencies', type=float, nargs='+', default=[0.0, 0.001], help='simulator reply delays in seconds')
+    parser.add_argument('--nodelay', choices=['on', 'off', 'both'], default='both', help='TCP_NODELAY option')
+    parser.add_argument('--command-repeat', type=int, default=200)
+    parser.add_argument('--transfer-repeat', type=int, default=3)
+    parser.add_argument('--operations', nargs='+', choices=['command', 'save', 'load'], default=['command', 'save', 'load'])
+    parser.add_argument('--out', default='bench.json', help='JSON file for the results')
+    args = parser.parse_args(argv)
+    logging.basicConfig()
+    logger.setLevel(logging.INFO)
+    nodelay = {'on': [True], 'off': [False], 'both': [False, True]}[args.nodelay]
+    report = run(args.sizes, args.block_sizes, args.latencies, nodelay, args.command_repeat, args.transfer_repeat, args.operations)
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Results written to {args.out}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,104 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import threading
+import time
+from collections import OrderedDict
+
+# Read-only commands and the time their responses are kept in seconds, keyed by the first word.
+# 0 marks the read-only commands which are never cached, they don't clear the cache either.
+DEFAULT_TTLS = {
+    'type': 0.0,
+    'id': 60.0,
+    'directory': 5.0,
+    'dir': 5.0,
+    'list': 5.0,
+    'status': 0.5,
+    'where': 0.2,
+    'errlog': 1.0,
+    'oplog': 1.0,
+}
+
+
+def normalize(cmd: str) -> str:
+    """
+    Returns the cache key of a command, lowercase with single spaces.
+    """
+    return ' '.join(cmd.lower().split())
+
+
+class ResponseCache:
+    """
+    Cache of the responses of read-only commands with a TTL per command and LRU eviction.
+
+    Commands are matched by their first word against the TTLs. A command which is not
+    in the TTLs may change the controller, so the session clears the cache when it
+    sends one, and also after load. Commands with TTL 0 are read-only but never cached,
+    e.g. TYPE whose values are polled.
+    """
+
+    def __init__(self, ttls: dict = None, max_entries: int = 256) -> None:
+        """
+        Initializes a new instance of the ResponseCache class.
+
+        Args:
+            ttls (dict, optional): Time to keep the responses in seconds, keyed by the first word of the command. Defaults to DEFAULT_TTLS.
+            max_entries (int, optional): Maximum number of cached responses. Defaults to 256.
+        """
+        self.ttls = {k.lower(): v for k, v in (DEFAULT_TTLS if ttls is None else ttls).items()}
+        self.max_entries = max_entries
+        self.Hits = 0
+        self.Misses = 0
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def ttl(self, cmd: str) -> float:
+        """
+        Returns the TTL of the command, None if it may change the controller.
+        """
+        key = normalize(cmd)
+        # An empty command only prints the prompt
+        return self.ttls.get(key.split(' ', 1)[0]) if key else 0.0
+
+    def get(self, cmd: str) -> str:
+        """
+        Returns the cached response of the command, None if it is missing or expired.
+        """
+        key = normalize(cmd)
+        now = time.monotonic()
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self.__entries[key]
+                self.Misses += 1
+                return None
+            self.__entries.move_to_end(key)
+            self.Hits += 1
+            return entry[1]
+
+    def put(self, cmd: str, response: str) -> bool:
+        """
+        Stores the response of the command if it is cacheable.
+
+        Returns:
+            bool: True if the response was stored.
+        """
+        ttl = self.ttl(cmd)
+        if not ttl or ttl <= 0:
+            return False
+        with self.__lock:
+            self.__entries[normalize(cmd)] = (time.monotonic() + ttl, response)
+            self.__entries.move_to_end(normalize(cmd))
+            while len(self.__entries) > self.max_entries:
+                self.__entries.popitem(last=False)
+        return True
+
+    def invalidate(self) -> None:
+        with self.__lock:
+            if self.__entries:
+                logger.debug(f'Cache cleared, {len(self.__entries)} responses dropped')
+            self.__entries.clear()
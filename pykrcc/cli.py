@@ -0,0 +1,226 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import argparse
+import contextlib
+import json
+import sys
+import threading
+import time
+from dataclasses import dataclass
+
+from .fleet import ConnectionSpec, Fleet
+from .loadplan import LoadPlan
+
+# Exit codes
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_UNREACHABLE = 3
+
+
+@dataclass
+class Step:
+    """
+    Single step of a script: a command, save or load.
+    """
+    op: str
+    arg: str
+    qual: str = None
+    prog: str = None
+
+
+def parse_step(line: str) -> Step:
+    """
+    Parses a line of a script.
+
+    'save[/qual] <file> [program]' and 'load[/qual] <file>' save and load the file,
+    the file name is formatted with the fields of the host ({ip}, {port}). Any other
+    line is sent as a command.
+
+    Returns:
+        Step: The step, None for empty lines and comments ('#').
+
+    Raises:
+        ValueError: If the file of a save or load is missing.
+    """
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+    parts = line.split()
+    word, _, qual = parts[0].partition('/')
+    word = word.lower()
+    if word in ('save', 'load'):
+        if len(parts) < 2:
+            raise ValueError(f'Missing file name: {line}')
+        prog = parts[2] if word == 'save' and len(parts) > 2 else None
+        return Step(word, parts[1], '/' + qual if qual else None, prog)
+    return Step('command', line)
+
+
+def parse_script(lines) -> list:
+    return [step for step in (parse_step(line) for line in lines) if step is not None]
+
+
+def _open_input(name: str):
+    """
+    Opens a file for reading, '-' is stdin which is left open on exit.
+    """
+    if name == '-':
+        return contextlib.nullcontext(sys.stdin)
+    return open(name)
+
+
+def parse_host(host: str, port: int = 23, **kwargs) -> ConnectionSpec:
+    """
+    Returns the spec of '<ip>[:<port>]'.
+    """
+    ip, _, _port = host.strip().rpartition(':') if ':' in host else (host.strip(), '', '')
+    return ConnectionSpec(ip, int(_port) if _port else port, **kwargs)
+
+
+class Runner:
+    """
+    Runs the steps of a script on a session and writes the results as JSON lines.
+    """
+
+    def __init__(self, steps: list, out=None, keep_going: bool = False, pipeline: int = 0) -> None:
+        """
+        Initializes a new instance of the Runner class.
+
+        Args:
+            steps (list): Steps of the script.
+            out (file, optional): Output of the JSON lines. Defaults to sys.stdout.
+            keep_going (bool, optional): Continue after a failed step. Defaults to False.
+            pipeline (int, optional): Pipeline depth of the consecutive commands, 0 to send them one by one. Defaults to 0.
+        """
+        self.steps = steps
+        self.out = out if out is not None else sys.stdout
+        self.keep_going = keep_going
+        self.pipeline = pipeline
+        # Load plans shared by the hosts, keyed by the file name
+        self.plans = {}
+        self.__lock = threading.Lock()
+        for step in steps:
+            if step.op == 'load' and '{' not in step.arg and step.arg not in self.plans:
+                try:
+                    self.plans[step.arg] = LoadPlan.from_file(step.arg)
+                except Exception as e:
+                    logger.warning(f'Failed to prepare {step.arg}: {e}')
+
+    def emit(self, record: dict) -> None:
+        line = json.dumps(record, default=str)
+        with self.__lock:
+            self.out.write(line + '\n')
+            self.out.flush()
+
+    def __record(self, spec, i: int, step: Step, code: int, response, seconds: float, **extra) -> dict:
+        record = {'host': spec.name, 'step': i, 'op': step.op, 'arg': step.arg, 'code': code,
+                  'response': response, 'seconds': round(seconds, 6)}
+        record.update(extra)
+        self.emit(record)
+        return record
+
+    def __run_step(self, session, spec, step: Step) -> tuple:
+        if step.op == 'save':
+            fname = step.arg.format(ip=spec.ip, port=spec.port)
+            return session.save(fname, step.prog, step.qual), fname
+        if step.op == 'load':
+            fname = step.arg.format(ip=spec.ip, port=spec.port)
+            return session.load(self.plans.get(step.arg, fname), step.qual), fname
+        return session.command(step.arg)
+
+    def __call__(self, session, spec) -> tuple:
+        """
+        Runs the script, returns the code of the first failed step (0 if all succeeded) and the number of failed steps.
+        """
+        first = 0
+        failed = 0
+        i = 0
+        while i < len(self.steps):
+            step = self.steps[i]
+            t_start = time.perf_counter()
+            if step.op == 'command' and self.pipeline > 1:
+                j = i
+                while j < len(self.steps) and self.steps[j].op == 'command':
+                    j += 1
+                results = session.command_batch([s.arg for s in self.steps[i:j]], self.pipeline)
+                seconds = time.perf_counter() - t_start
+                codes = []
+                for k, (code, response) in enumerate(results):
+                    self.__record(spec, i + k, self.steps[i + k], code, response, seconds, batch=j - i)
+                    codes.append(code)
+                i = j
+            else:
+                code, response = self.__run_step(session, spec, step)
+                self.__record(spec, i, step, code, response, time.perf_counter() - t_start)
+                codes = [code]
+                i += 1
+            for code in codes:
+                if code != 0:
+                    failed += 1
+                    first = first or code
+            if failed and not self.keep_going:
+                break
+        return first, f'{failed} failed steps'
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(prog='pykrcc', description='Run commands, saves and loads on Kawasaki robot controllers. '
+                                     'Results are written to stdout as JSON lines.')
+    parser.add_argument('-H', '--host', action='append', default=[], help='controller as <ip>[:<port>], can be repeated')
+    parser.add_argument('--hosts', help="file with a host per line ('-' for stdin)")
+    parser.add_argument('-s', '--script', help="file with a step per line ('-' for stdin)")
+    parser.add_argument('-e', '--exec', action='append', default=[], dest='steps',
+                        help="step as in the script, e.g. 'status' or 'save/r backup_{ip}.as', can be repeated")
+    parser.add_argument('--port', type=int, default=23, help='port of the hosts without one')
+    parser.add_argument('--login', default='as')
+    parser.add_argument('--timeout', type=int, default=20, help='idle timeout of the sessions in seconds')
+    parser.add_argument('--tcp-nodelay', action='store_true')
+    parser.add_argument('-j', '--workers', type=int, default=8, help='hosts served at the same time')
+    parser.add_argument('--host-timeout', type=float, default=None, help='time limit of the whole script on one host in seconds')
+    parser.add_argument('--pipeline', type=int, default=0, help='pipeline depth of consecutive commands (see command_batch)')
+    parser.add_argument('-k', '--keep-going', action='store_true', help='continue the script after a failed step')
+    parser.add_argument('-v', '--verbose', action='count', default=0)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING - 10 * min(args.verbose, 2), stream=sys.stderr,
+                        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    if args.hosts == '-' and args.script == '-':
+        parser.error('stdin can be read by only one of --hosts and --script')
+    hosts = list(args.host)
+    try:
+        if args.hosts:
+            with _open_input(args.hosts) as f:
+                hosts += [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+        steps = []
+        if args.script:
+            with _open_input(args.script) as f:
+                steps += parse_script(f)
+        steps += parse_script(args.steps)
+        specs = [parse_host(host, args.port, login=args.login, timeout=args.timeout, tcp_nodelay=args.tcp_nodelay)
+                 for host in hosts]
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    if not specs:
+        parser.error('no hosts given')
+    if not steps:
+        parser.error('no steps given')
+
+    runner = Runner(steps, keep_going=args.keep_going, pipeline=args.pipeline)
+    report = Fleet(specs, args.workers, args.host_timeout).run(runner, 'script')
+    exit_code = EXIT_OK
+    for result in report.results:
+        runner.emit({'host': result.name, 'summary': True, 'code': result.code, 'response': result.response,
+                     'error': result.error, 'connect_seconds': result.connect_time, 'seconds': result.elapsed})
+        if result.error is not None:
+            exit_code = EXIT_UNREACHABLE
+        elif result.code != 0 and exit_code == EXIT_OK:
+            exit_code = EXIT_FAILED
+    logger.info(f'{len(report.ok)} of {len(report.results)} hosts succeeded in {report.elapsed:.3f} s')
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
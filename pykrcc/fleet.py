@@ -0,0 +1,218 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import concurrent.futures
+import threading
+import time
+from dataclasses import dataclass, field, asdict
+
+from .loadplan import LoadPlan
+from .pykrcc import pykrcc
+
+
+@dataclass
+class ConnectionSpec:
+    """
+    Connection parameters of a single controller.
+    """
+    ip: str
+    port: int = 23
+    login: str = 'as'
+    timeout: int = 20
+    tcp_nodelay: bool = False
+
+    @property
+    def name(self) -> str:
+        return f'{self.ip}:{self.port}'
+
+
+@dataclass
+class FleetResult:
+    """
+    Result of an operation on a single controller.
+
+    Code follows the return codes of the pykrcc methods, -1 is also used for the
+    operation timeout and -2 if the connection could not be established.
+    """
+    name: str
+    code: int
+    response: str = None
+    error: str = None
+    connect_time: float = None
+    elapsed: float = None
+
+
+@dataclass
+class FleetReport:
+    """
+    Results of an operation on the whole fleet.
+    """
+    operation: str
+    results: list = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def ok(self) -> list:
+        return [r for r in self.results if r.code == 0]
+
+    @property
+    def failed(self) -> list:
+        return [r for r in self.results if r.code != 0]
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class Fleet:
+    """
+    Runs command, save and load on many controllers concurrently.
+
+    Every controller gets its own connection in a worker thread. A slow or unreachable
+    controller only occupies its own worker and is reported when its timeout expires.
+    """
+
+    def __init__(self, specs: list, max_workers: int = 8, timeout: float = None) -> None:
+        """
+        Initializes a new instance of the Fleet class.
+
+        Args:
+            specs (list): Connection specs as ConnectionSpec or dicts with the same keys.
+            max_workers (int, optional): Maximum number of controllers served at the same time. Defaults to 8.
+            timeout (float, optional): Time limit for the whole operation on one controller in seconds. Defaults to None.
+        """
+        self.specs = [s if isinstance(s, ConnectionSpec) else ConnectionSpec(**s) for s in specs]
+        self.max_workers = max_workers
+        self.timeout = timeout
+
+    def __job(self, spec: ConnectionSpec, operation, sessions: dict, lock: threading.Lock) -> FleetResult:
+        """
+        Connects to the controller, runs the operation and disconnects.
+        """
+        t_start = time.perf_counter()
+        session = pykrcc(login=spec.login, ip=spec.ip, port=spec.port, timeout=spec.timeout, tcp_nodelay=spec.tcp_nodelay,
+                         autoconnect=False)
+        # Registered before connecting, so the timeout can also cut a hanging login
+        with lock:
+            sessions[spec.name] = session
+        session.connect(login=spec.login, ip=spec.ip, port=spec.port, timeout=spec.timeout, tcp_nodelay=spec.tcp_nodelay)
+        connect_time = time.perf_counter() - t_start
+        if not session.IsConnected:
+            return FleetResult(spec.name, -2, error='Failed to connect', connect_time=connect_time, elapsed=connect_time)
+        try:
+            ret = operation(session, spec)
+        finally:
+            session.disconnect()
+        if isinstance(ret, tuple):
+            code, response = ret
+        else:
+            code, response = ret, None
+        return FleetResult(spec.name, code, response, connect_time=connect_time, elapsed=time.perf_counter() - t_start)
+
+    def run(self, operation, name: str = 'run', timeout: float = None) -> FleetReport:
+        """
+        Runs an operation on every controller.
+
+        Args:
+            operation (callable): Called with (session, spec), returns a return code or a (code, response) tuple.
+            name (str, optional): Name of the operation for the report. Defaults to 'run'.
+            timeout (float, optional): Time limit for one controller in seconds. Defaults to the fleet timeout.
+
+        Returns:
+            FleetReport: Results in the order of the specs.
+        """
+        if timeout is None:
+            timeout = self.timeout
+        report = FleetReport(name)
+        sessions = {}
+        lock = threading.Lock()
+        results = {}
+        t_start = time.perf_counter()
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            futures = {executor.submit(self.__job, spec, operation, sessions, lock): spec for spec in self.specs}
+            started = {}
+            pending = set(futures)
+            while pending:
+                done, pending = concurrent.futures.wait(pending, timeout=0.05, return_when=concurrent.futures.FIRST_COMPLETED)
+                now = time.perf_counter()
+                for future in done:
+                    spec = futures[future]
+                    try:
+                        results[spec.name] = future.result()
+                    except Exception as e:
+                        logger.error(f'{spec.name}: {e}')
+                        results[spec.name] = FleetResult(spec.name, -4, error=str(e), elapsed=now - started.get(spec.name, t_start))
+                if timeout is None:
+                    continue
+                for future in list(pending):
+                    spec = futures[future]
+                    if future.running():
+                        started.setdefault(spec.name, now)
+                    if spec.name in started and now - started[spec.name] > timeout:
+                        # Shutting down the socket wakes up the worker blocked in a read
+                        pending.discard(future)
+                        logger.warning(f'{spec.name}: operation timeout')
+                        results[spec.name] = FleetResult(spec.name, -1, error='Operation timeout', elapsed=now - started[spec.name])
+                        with lock:
+                            session = sessions.get(spec.name)
+                        if session is not None:
+                            session.disconnect()
+        finally:
+            executor.shutdown(wait=False)
+        report.results = [results[spec.name] for spec in self.specs]
+        report.elapsed = time.perf_counter() - t_start
+        return report
+
+    def command(self, cmd: str, timeout: float = None) -> FleetReport:
+        """
+        Sends a command to every controller.
+
+        Args:
+            cmd (str): Command string.
+            timeout (float, optional): Time limit for one controller in seconds. Defaults to the fleet timeout.
+
+        Returns:
+            FleetReport: Results with the responses of the controllers.
+        """
+        return self.run(lambda session, spec: session.command(cmd), 'command', timeout)
+
+    def save(self, fname: str, prog: str = None, qual: str = None, timeout: float = None) -> FleetReport:
+        """
+        Saves the programs of every controller.
+
+        Args:
+            fname (str): Name of the file, formatted with the fields of the spec (e.g. 'backup_{ip}_{port}.as').
+            prog (str, optional): Program name. Defaults to None.
+            qual (str, optional): Qualifier. Defaults to None.
+            timeout (float, optional): Time limit for one controller in seconds. Defaults to the fleet timeout.
+
+        Returns:
+            FleetReport: Results with the names of the saved files.
+        """
+        def operation(session, spec):
+            _fname = fname.format(**asdict(spec))
+            return session.save(_fname, prog, qual), _fname
+        return self.run(operation, 'save', timeout)
+
+    def load(self, fname: str, qual: str = None, timeout: float = None) -> FleetReport:
+        """
+        Loads a file into every controller.
+
+        The file is read and framed once (see LoadPlan), the plan is shared by all the controllers.
+
+        Args:
+            fname (str or LoadPlan): Name of the file to load or its prepared plan.
+            qual (str, optional): Qualifier string. Defaults to None.
+            timeout (float, optional): Time limit for one controller in seconds. Defaults to the fleet timeout.
+
+        Returns:
+            FleetReport: Results of the load.
+        """
+        plan = fname
+        if not isinstance(plan, LoadPlan):
+            try:
+                plan = LoadPlan.from_file(fname)
+            except Exception as e:
+                logger.error(f'Failed to prepare {fname}: {e}')
+                return FleetReport('load', [FleetResult(spec.name, -3, error=str(e)) for spec in self.specs])
+        return self.run(lambda session, spec: session.load(plan, qual), 'load', timeout)
@@ -0,0 +1,243 @@
+import io
+import os
+import re
+
+# Framing of the data blocks sent by the controller during save
+FRAME_MARKER = re.compile(rb'\x17{0,1}\x05\x02[DE]{0,1}')
+
+# Maximum size of a load block accepted by the robot
+BLOCK_SIZE = 492
+
+
+def iter_blocks(lines, max_chars: int = BLOCK_SIZE):
+    """
+    Packs the lines into blocks which are acceptable by the robot as they are read.
+
+    Only the block being packed is kept in memory.
+
+    Args:
+        lines (iterable): Lines of the AS source with their line breaks.
+        max_chars (int, optional): Maximum size of a block. Defaults to BLOCK_SIZE.
+
+    Yields:
+        str: The blocks.
+    """
+    block = ''
+    for line in lines:
+        if len(block) + len(line) + 2 >= max_chars:
+            yield block
+            block = ''
+        block = block + line
+    if block != '':
+        yield block
+
+
+def is_source_path(source) -> bool:
+    """
+    Tells whether the load source is a file name, strings with a line break are AS source.
+    """
+    return isinstance(source, os.PathLike) or (isinstance(source, str) and '\n' not in source)
+
+
+class SourceReader:
+    """
+    Reads the lines of AS source from a file or from memory.
+
+    Line breaks are translated to '\n' like the text mode open() does, while the
+    size of the source taken so far is counted in its own bytes. The progress of a
+    load and its total use the same measure, also for files with CRLF line breaks.
+    """
+
+    def __init__(self, source) -> None:
+        """
+        Initializes a new instance of the SourceReader class.
+
+        Args:
+            source (str or PathLike or bytes or iterable): File name, the source, or its lines as str or bytes.
+                Line breaks are added to the lines of an iterable which miss them.
+
+        Raises:
+            FileNotFoundError: If the file does not exist.
+        """
+        self.consumed = 0
+        self.__file = None
+        self.__complete = False
+        # Size of the last line read and whether the source is exhausted
+        self.__last = 0
+        self.__done = False
+        if is_source_path(source):
+            # newline='' keeps the line breaks as they are in the file
+            self.__file = lines = open(source, 'r', newline='')
+            self.size = os.fstat(lines.fileno()).st_size
+            encoding = lines.encoding
+        elif isinstance(source, str):
+            lines = io.StringIO(source, newline='')
+            self.size = len(source.encode())
+            encoding = 'utf-8'
+        elif isinstance(source, (bytes, bytearray, memoryview)):
+            lines = io.TextIOWrapper(io.BytesIO(source), newline='')
+            self.size = len(source)
+            encoding = lines.encoding
+        else:
+            lines = source
+            self.size = None
+            encoding = 'utf-8'
+            self.__complete = True
+        self.__lines = lines
+        self.__encoding = encoding
+
+    def __iter__(self):
+        for line in self.__lines:
+            if isinstance(line, (bytes, bytearray)):
+                line = line.decode()
+            if self.__complete and not line.endswith(('\n', '\r')):
+                line = line + '\n'
+            self.__last = len(line.encode(self.__encoding))
+            self.consumed += self.__last
+            if line.endswith('\r\n'):
+                line = line[:-2] + '\n'
+            elif line.endswith('\r'):
+                line = line[:-1] + '\n'
+            yield line
+        self.__done = True
+
+    def blocks(self, max_chars: int = BLOCK_SIZE):
+        """
+        Packs the lines into blocks as they are read, see iter_blocks.
+
+        Args:
+            max_chars (int, optional): Maximum size of a block. Defaults to BLOCK_SIZE.
+
+        Yields:
+            tuple: Size of the source in the block and the block.
+        """
+        sent = 0
+        for block in iter_blocks(self, max_chars):
+            # Before the end the line which starts the next block has already been read
+            end = self.consumed if self.__done else self.consumed - self.__last
+            yield end - sent, block
+            sent = end
+
+    def frames(self, max_chars: int = BLOCK_SIZE):
+        """
+        Packs the lines into blocks and frames them as they are read.
+
+        Args:
+            max_chars (int, optional): Maximum size of a block. Defaults to BLOCK_SIZE.
+
+        Yields:
+            tuple: Size of the source in the block and the frame of the block.
+        """
+        for size, block in self.blocks(max_chars):
+            yield size, load_frame(block.encode())
+
+    def close(self) -> None:
+        if self.__file is not None:
+            self.__file.close()
+
+
+def record(kind: bytes, data: bytes = b'') -> bytes:
+    """
+    Frames a record of the save/load protocol as <STX><kind>    0<data><ETB>.
+
+    Args:
+        kind (bytes): Type of the record, b'A' starts a load, b'B' starts a save,
+            b'C' carries load data and b'E' ends the transfer.
+        data (bytes, optional): Payload of the record. Defaults to b''.
+
+    Returns:
+        bytes: Record ready to be sent.
+    """
+    return b'\x02' + kind + b'    0' + data + b'\x17'
+
+
+# Records sent to the controller
+SAVE_START = record(b'B')
+LOAD_START = record(b'A')
+LOAD_EOF = record(b'C', b'\x1a')
+TRANSFER_END = record(b'E')
+# Record which ends the save data sent by the controller
+SAVE_END = b'\x05\x02E\x17'
+
+
+def load_frame(block: bytes) -> bytes:
+    """
+    Frames a block of the load data as a C record <STX>C    0<data><CR><LF><ETB>.
+
+    Args:
+        block (bytes): Lines of the AS source.
+
+    Returns:
+        bytes: Record ready to be sent.
+    """
+    return b'\x02C    0' + block + b'\r\n\x17'
+
+
+class SaveParser:
+    """
+    Incremental parser of the data stream sent by the controller after save command.
+
+    Raw blocks are fed as they arrive, complete lines are returned with the framing
+    stripped. Only the unfinished last line is kept between the blocks. The transfer
+    is over when the whole end record has been fed, see ended.
+    """
+
+    def __init__(self, on_skip=None) -> None:
+        """
+        Initializes a new instance of the SaveParser class.
+
+        Args:
+            on_skip (callable, optional): Called with every service line which is not a part of the source code. Defaults to None.
+        """
+        self.on_skip = on_skip
+        self.ended = False
+        self.__pending = bytearray()
+        # End of the previous block, the end record may be split between the blocks
+        self.__tail = b''
+
+    def feed(self, data: bytes) -> list:
+        """
+        Parses the next raw block.
+
+        Args:
+            data (bytes): Raw data block from the robot.
+
+        Returns:
+            list: Source code lines completed by this block.
+        """
+        keep = len(SAVE_END) - 1
+        if SAVE_END in data or SAVE_END in self.__tail + bytes(data[:keep]):
+            self.ended = True
+        self.__tail = (self.__tail + bytes(data[-keep:]))[-keep:]
+        pending = self.__pending
+        pending += data
+        end = pending.rfind(b'\n')
+        if end < 0:
+            return []
+        # The framing never contains a line break, so it can't be split across the cut
+        chunk = bytes(pending[:end + 1])
+        del pending[:end + 1]
+        return self.__clean(chunk)
+
+    def close(self) -> list:
+        """
+        Parses the rest of the data after the last block.
+
+        Returns:
+            list: Remaining source code lines.
+        """
+        chunk = bytes(self.__pending)
+        self.__pending.clear()
+        return self.__clean(chunk)
+
+    def __clean(self, chunk: bytes) -> list:
+        clean_data = []
+        for line in FRAME_MARKER.sub(b'', chunk).splitlines():
+            if line and not line.startswith(b'\x17') and not line.startswith(b'Bfile.as') and not line.startswith(b'='):
+                clean_data.append(line)
+            else:
+                if line.startswith(b'Bfile.as'):
+                    continue
+                if self.on_skip is not None:
+                    self.on_skip(line.replace(b'\x17', b'') + b'\n')
+        return clean_data
@@ -0,0 +1,129 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import hashlib
+import json
+import os
+
+from .frames import BLOCK_SIZE, SourceReader, load_frame
+
+# First line of the cached plans
+_MAGIC = b'PYKRCC-LOADPLAN 1\n'
+
+
+class LoadPlan:
+    """
+    AS file split into blocks and framed once, ready to be sent by load().
+
+    The plan holds the framed records and the sizes of their data, so it can be
+    passed to load() of any number of sessions without reading, splitting or
+    encoding the file again. Plans can be cached on disk, keyed by the hash of the
+    file content and the block size.
+    """
+
+    def __init__(self, blocks: list, digest: str = None, sizes: list = None) -> None:
+        """
+        Initializes a new instance of the LoadPlan class.
+
+        Args:
+            blocks (list): Blocks of the AS source as bytes.
+            digest (str, optional): Hash of the source. Defaults to None.
+            sizes (list, optional): Size of the source in every block, e.g. with CRLF line breaks.
+                Defaults to None (the size of the blocks).
+        """
+        self.frames = [load_frame(block) for block in blocks]
+        self.sizes = [len(block) for block in blocks] if sizes is None else list(sizes)
+        self.size = sum(self.sizes)
+        self.digest = digest
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    @staticmethod
+    def file_digest(data: bytes, block_size: int = BLOCK_SIZE) -> str:
+        return hashlib.blake2b(data + b'\0' + str(block_size).encode(), digest_size=20).hexdigest()
+
+    @classmethod
+    def from_file(cls, fname: str, block_size: int = BLOCK_SIZE, cache_dir: str = None) -> 'LoadPlan':
+        """
+        Prepares the plan of an AS file.
+
+        Args:
+            fname (str): Name of the AS file.
+            block_size (int, optional): Maximum size of a block. Defaults to BLOCK_SIZE.
+            cache_dir (str, optional): Directory of the cached plans. Defaults to None (no cache).
+
+        Returns:
+            LoadPlan: The plan.
+
+        Raises:
+            FileNotFoundError: If the file does not exist.
+        """
+        with open(fname, 'rb') as f:
+            data = f.read()
+        digest = cls.file_digest(data, block_size)
+        cached = None
+        if cache_dir is not None:
+            cached = os.path.join(cache_dir, digest + '.plan')
+            if os.path.exists(cached):
+                try:
+                    return cls.read(cached)
+                except Exception as e:
+                    logger.warning(f'Failed to read cached load plan {cached}: {e}')
+        # Same blocks and sizes as load() of the file itself
+        sizes, blocks = zip(*SourceReader(data).blocks(block_size)) if data else ((), ())
+        plan = cls([block.encode() for block in blocks], digest, sizes)
+        if cached is not None:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                plan.write(cached)
+            except Exception as e:
+                logger.warning(f'Failed to cache load plan {cached}: {e}')
+        return plan
+
+    def write(self, fname: str) -> None:
+        """
+        Writes the plan to a file.
+
+        Args:
+            fname (str): Name of the file.
+        """
+        header = json.dumps({'digest': self.digest, 'sizes': self.sizes}).encode()
+        tmp = fname + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(_MAGIC + header + b'\n')
+            f.writelines(self.frames)
+        os.replace(tmp, fname)
+
+    @classmethod
+    def read(cls, fname: str) -> 'LoadPlan':
+        """
+        Reads a plan written by write().
+
+        Args:
+            fname (str): Name of the file.
+
+        Returns:
+            LoadPlan: The plan.
+
+        Raises:
+            ValueError: If the file is not a valid plan.
+        """
+        with open(fname, 'rb') as f:
+            if f.readline() != _MAGIC:
+                raise ValueError('Not a load plan')
+            header = json.loads(f.readline())
+            data = f.read()
+        plan = cls.__new__(cls)
+        plan.digest = header['digest']
+        plan.sizes = header['sizes']
+        plan.size = sum(plan.sizes)
+        plan.frames = []
+        pos = 0
+        overhead = len(load_frame(b''))
+        for size in plan.sizes:
+            plan.frames.append(data[pos:pos + size + overhead])
+            pos += size + overhead
+        if pos != len(data):
+            raise ValueError('Truncated load plan')
+        return plan
@@ -0,0 +1,51 @@
+import re
+
+
+class TerminatorMatcher:
+    """
+    Precompiled matcher for a list of literal terminators.
+
+    All terminators are searched in one pass over the data. The leftmost terminator
+    in the data wins, ties are resolved by the order of the list.
+    """
+
+    def __init__(self, terminators: list) -> None:
+        """
+        Initializes a new instance of the TerminatorMatcher class.
+
+        Args:
+            terminators (list): A list of terminators as bytes.
+        """
+        self.terminators = [bytes(t) for t in terminators]
+        self.__pattern = re.compile(b'|'.join(b'(' + re.escape(t) + b')' for t in self.terminators))
+        # Number of trailing bytes which may hold the beginning of a terminator
+        self.overlap = max(len(t) for t in self.terminators) - 1
+
+    def search(self, data, pos: int = 0) -> tuple:
+        """
+        Searches the data for the first terminator.
+
+        Args:
+            data (bytes or bytearray): The data to search.
+            pos (int, optional): Position to start the search from. Defaults to 0.
+
+        Returns:
+            tuple: Index of the terminator, start and end of the match, or None if nothing matched.
+        """
+        m = self.__pattern.search(data, pos)
+        if m is None:
+            return None
+        return m.lastindex - 1, m.start(), m.end()
+
+    def resume(self, length: int, start: int = 0) -> int:
+        """
+        Position to resume the search from after more data has been appended.
+
+        Args:
+            length (int): Length of the data which was already searched.
+            start (int, optional): Position the previous search started from. Defaults to 0.
+
+        Returns:
+            int: The position to continue the search from.
+        """
+        return max(start, length - self.overlap)
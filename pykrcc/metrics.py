@@ -0,0 +1,237 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import bisect
+import json
+import threading
+
+# Default histogram buckets in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Help strings of the metrics collected by pykrcc
+DESCRIPTIONS = {
+    'bytes_sent_total': 'Bytes written to the controller',
+    'bytes_received_total': 'Bytes read from the controller',
+    'writes_total': 'Sends to the controller',
+    'commands_total': 'Commands sent',
+    'command_errors_total': 'Commands which failed',
+    'command_inquiries_total': 'Inquiry round trips inside commands',
+    'command_cache_hits_total': 'Commands answered from the response cache',
+    'command_seconds': 'Command round trip time',
+    'connect_seconds': 'Connection and login time',
+    'reconnects_total': 'Reconnects of the session',
+    'timeouts_total': 'Reads which ended with a timeout',
+    'load_seconds': 'Duration of load',
+    'load_block_seconds': 'Time from sending a load block to its acknowledgement',
+    'save_seconds': 'Duration of save',
+    'save_frame_seconds': 'Time to receive a save data block',
+}
+
+
+class Histogram:
+    """
+    Histogram with fixed buckets.
+    """
+
+    def __init__(self, buckets: tuple = BUCKETS) -> None:
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimates the quantile as the upper bound of the bucket which contains it.
+
+        Args:
+            q (float): Quantile in range 0..1.
+
+        Returns:
+            float: Upper bound of the bucket, None if there are no observations.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        total = 0
+        for i, n in enumerate(self.counts):
+            total += n
+            if total >= rank and n:
+                return self.buckets[i] if i < len(self.buckets) else float('inf')
+        return float('inf')
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'buckets': dict(zip([str(b) for b in self.buckets] + ['+Inf'], self.counts)),
+            'p50': self.quantile(0.5),
+            'p99': self.quantile(0.99),
+        }
+
+
+class Metrics:
+    """
+    Counters and histograms of a session.
+
+    Every update is also passed to the hooks as (name, value, labels), so the values
+    can be forwarded to an external monitoring system.
+    """
+
+    def __init__(self, labels: dict = None, buckets: tuple = BUCKETS) -> None:
+        """
+        Initializes a new instance of the Metrics class.
+
+        Args:
+            labels (dict, optional): Labels of the session, e.g. {'controller': '10.0.0.1:23'}. Defaults to None.
+            buckets (tuple, optional): Histogram buckets in seconds. Defaults to BUCKETS.
+        """
+        self.labels = dict(labels or {})
+        self.buckets = buckets
+        self.counters = {}
+        self.histograms = {}
+        self.__hooks = []
+        self.__lock = threading.Lock()
+
+    def add_hook(self, hook) -> None:
+        """
+        Adds a hook called on every update.
+
+        The hooks run inline on the thread of the session, exceptions are logged.
+
+        Args:
+            hook (callable): Called with (name, value, labels).
+        """
+        self.__hooks.append(hook)
+
+    def remove_hook(self, hook) -> None:
+        self.__hooks.remove(hook)
+
+    def __call_hooks(self, name: str, value: float) -> None:
+        """
+        Calls the hooks, an error of a hook is logged and never reaches the session.
+        """
+        for hook in self.__hooks:
+            try:
+                hook(name, value, self.labels)
+            except Exception as e:
+                logger.error(f'Metrics hook {hook!r} failed on {name}: {e}')
+
+    def inc(self, name: str, value: float = 1) -> None:
+        """
+        Increases a counter.
+
+        Args:
+            name (str): Name of the counter.
+            value (float, optional): Increment. Defaults to 1.
+        """
+        with self.__lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        self.__call_hooks(name, value)
+
+    def observe(self, name: str, value: float) -> None:
+        """
+        Adds an observation to a histogram.
+
+        Args:
+            name (str): Name of the histogram.
+            value (float): Observed value in seconds.
+        """
+        with self.__lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(self.buckets)
+            histogram.observe(value)
+        self.__call_hooks(name, value)
+
+    def snapshot(self) -> dict:
+        """
+        Returns a copy of the current values.
+
+        Returns:
+            dict: Labels, counters and histograms.
+        """
+        with self.__lock:
+            return {
+                'labels': dict(self.labels),
+                'counters': dict(self.counters),
+                'histograms': {name: h.to_dict() for name, h in self.histograms.items()},
+            }
+
+    def to_json(self) -> str:
+        return export_json([self])
+
+    def to_prometheus(self, prefix: str = 'pykrcc') -> str:
+        return export_prometheus([self], prefix)
+
+
+def export_json(metrics: list) -> str:
+    """
+    Exports the snapshots of the sessions as JSON.
+
+    Args:
+        metrics (list): Metrics of the sessions.
+
+    Returns:
+        str: JSON list of the snapshots.
+    """
+    return json.dumps([m.snapshot() for m in metrics])
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels: dict, extra: dict = None) -> str:
+    items = dict(labels)
+    if extra:
+        items.update(extra)
+    if not items:
+        return ''
+    values = ','.join(f'{k}="{_escape(v)}"' for k, v in items.items())
+    return '{' + values + '}'
+
+
+def export_prometheus(metrics: list, prefix: str = 'pykrcc') -> str:
+    """
+    Exports the metrics of the sessions in the Prometheus text format.
+
+    Args:
+        metrics (list): Metrics of the sessions.
+        prefix (str, optional): Prefix of the metric names. Defaults to 'pykrcc'.
+
+    Returns:
+        str: Prometheus exposition text.
+    """
+    snapshots = [m.snapshot() for m in metrics]
+    counters = sorted({name for s in snapshots for name in s['counters']})
+    histograms = sorted({name for s in snapshots for name in s['histograms']})
+    lines = []
+    for name in counters:
+        full = f'{prefix}_{name}'
+        if name in DESCRIPTIONS:
+            lines.append(f'# HELP {full} {DESCRIPTIONS[name]}')
+        lines.append(f'# TYPE {full} counter')
+        for s in snapshots:
+            if name in s['counters']:
+                lines.append(f'{full}{_labels(s["labels"])} {s["counters"][name]}')
+    for name in histograms:
+        full = f'{prefix}_{name}'
+        if name in DESCRIPTIONS:
+            lines.append(f'# HELP {full} {DESCRIPTIONS[name]}')
+        lines.append(f'# TYPE {full} histogram')
+        for s in snapshots:
+            h = s['histograms'].get(name)
+            if h is None:
+                continue
+            total = 0
+            for le, n in h['buckets'].items():
+                total += n
+                lines.append(f'{full}_bucket{_labels(s["labels"], {"le": le})} {total}')
+            lines.append(f'{full}_sum{_labels(s["labels"])} {h["sum"]}')
+            lines.append(f'{full}_count{_labels(s["labels"])} {h["count"]}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,332 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import concurrent.futures
+import contextlib
+import threading
+import time
+
+from .fleet import ConnectionSpec
+from .pykrcc import pykrcc
+
+
+class _Controller:
+    """
+    Sessions of a single controller.
+    """
+
+    def __init__(self, spec: ConnectionSpec) -> None:
+        self.spec = spec
+        self.idle = []
+        self.busy = set()
+        self.broken = []
+        self.connecting = 0
+        self.last_used = {}
+        self.failures = 0
+        self.next_retry = 0.0
+        # A check of the controller is running in the executor
+        self.checking = False
+
+    @property
+    def size(self) -> int:
+        return len(self.idle) + len(self.busy) + len(self.broken) + self.connecting
+
+
+class SessionPool:
+    """
+    Pool of logged-in pykrcc sessions keyed by controller.
+
+    A background thread probes the idle sessions with a cheap command and reconnects
+    the broken ones with exponential backoff, so acquire() normally returns a session
+    which is ready to use without the login handshake. The controllers are checked in
+    parallel, so an unreachable one doesn't delay the checks of the others.
+    """
+
+    def __init__(self, specs: list = None, max_sessions: int = 1, keepalive: float = 10.0, probe: str = '',
+                 backoff: float = 0.5, max_backoff: float = 30.0, warm: bool = True, check_workers: int = 8,
+                 probe_timeout: float = 2.0) -> None:
+        """
+        Initializes a new instance of the SessionPool class.
+
+        Args:
+            specs (list, optional): Connection specs as ConnectionSpec or dicts. Defaults to None.
+            max_sessions (int, optional): Maximum number of sessions per controller. Defaults to 1.
+            keepalive (float, optional): Idle time in seconds after which a session is probed. Defaults to 10.0.
+            probe (str, optional): Command used for the health check. Defaults to '' (empty line).
+            backoff (float, optional): First reconnect delay in seconds. Defaults to 0.5.
+            max_backoff (float, optional): Maximum reconnect delay in seconds. Defaults to 30.0.
+            warm (bool, optional): Open one session per controller in the background right away. Defaults to True.
+            check_workers (int, optional): Maximum number of controllers checked at the same time. Defaults to 8.
+            probe_timeout (float, optional): Time to wait for the response of the probe in seconds,
+                a session which doesn't answer in time is reconnected. Defaults to 2.0.
+        """
+        self.max_sessions = max_sessions
+        self.keepalive = keepalive
+        self.probe = probe
+        self.probe_timeout = probe_timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.warm = warm
+        self.Reconnects = 0
+        self.__controllers = {}
+        self.__cond = threading.Condition()
+        self.__closed = False
+        self.__wakeup = threading.Event()
+        self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers=check_workers, thread_name_prefix='pykrcc-pool-check')
+        for spec in specs or []:
+            self.add(spec)
+        self.__thread = threading.Thread(target=self.__run, name='pykrcc-pool', daemon=True)
+        self.__thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def add(self, spec) -> str:
+        """
+        Adds a controller to the pool.
+
+        Args:
+            spec (ConnectionSpec or dict): Connection parameters of the controller.
+
+        Returns:
+            str: Key of the controller.
+        """
+        if not isinstance(spec, ConnectionSpec):
+            spec = ConnectionSpec(**spec)
+        with self.__cond:
+            if spec.name not in self.__controllers:
+                self.__controllers[spec.name] = _Controller(spec)
+        self.__wakeup.set()
+        return spec.name
+
+    def keys(self) -> list:
+        with self.__cond:
+            return list(self.__controllers)
+
+    def __open(self, spec: ConnectionSpec) -> pykrcc:
+        return pykrcc(login=spec.login, ip=spec.ip, port=spec.port, timeout=spec.timeout, tcp_nodelay=spec.tcp_nodelay)
+
+    def __retry_delay(self, failures: int) -> float:
+        return min(self.backoff * 2 ** max(failures - 1, 0), self.max_backoff)
+
+    def acquire(self, key: str, timeout: float = None) -> pykrcc:
+        """
+        Takes a connected session of the controller out of the pool.
+
+        Args:
+            key (str): Key of the controller ('<ip>:<port>').
+            timeout (float, optional): Time to wait for a free session in seconds. Defaults to None (forever).
+
+        Returns:
+            pykrcc: A logged-in session, return it with release().
+
+        Raises:
+            KeyError: If the controller is not in the pool.
+            TimeoutError: If no session became free before the timeout.
+            ConnectionError: If a new session could not be connected.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.__cond:
+            ctrl = self.__controllers[key]
+            while True:
+                if self.__closed:
+                    raise ConnectionError('Pool is closed')
+                while ctrl.idle:
+                    session = ctrl.idle.pop()
+                    if session.IsConnected:
+                        ctrl.busy.add(session)
+                        return session
+                    ctrl.broken.append(session)
+                    self.__wakeup.set()
+                if ctrl.size < self.max_sessions:
+                    ctrl.connecting += 1
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f'No free session for {key}')
+                self.__cond.wait(remaining)
+        # Open a new session outside of the lock
+        session = self.__open(ctrl.spec)
+        with self.__cond:
+            ctrl.connecting -= 1
+            if session.IsConnected:
+                ctrl.busy.add(session)
+                return session
+            ctrl.broken.append(session)
+            ctrl.failures += 1
+            ctrl.next_retry = time.monotonic() + self.__retry_delay(ctrl.failures)
+            self.__cond.notify_all()
+        raise ConnectionError(f'Failed to connect to {key}')
+
+    def release(self, session: pykrcc) -> None:
+        """
+        Returns the session to the pool, a session released after close() is disconnected.
+
+        Args:
+            session (pykrcc): Session taken with acquire().
+        """
+        with self.__cond:
+            closed = self.__closed
+            for ctrl in self.__controllers.values():
+                if session in ctrl.busy:
+                    ctrl.busy.discard(session)
+                    if closed:
+                        # close() has already collected the sessions of the pool
+                        break
+                    if session.IsConnected:
+                        ctrl.idle.append(session)
+                        ctrl.last_used[id(session)] = time.monotonic()
+                    else:
+                        ctrl.broken.append(session)
+                        self.__wakeup.set()
+                    self.__cond.notify_all()
+                    break
+        if closed:
+            session.disconnect()
+
+    @contextlib.contextmanager
+    def session(self, key: str, timeout: float = None):
+        """
+        Context manager which acquires a session and releases it on exit.
+
+        Args:
+            key (str): Key of the controller ('<ip>:<port>').
+            timeout (float, optional): Time to wait for a free session in seconds. Defaults to None.
+        """
+        session = self.acquire(key, timeout)
+        try:
+            yield session
+        finally:
+            self.release(session)
+
+    def __healthy(self, session: pykrcc) -> bool:
+        """
+        Runs the probe command on the session.
+        """
+        if not session.IsConnected:
+            return False
+        code, response = session.command(self.probe, self.probe_timeout)
+        return code == 0 and response.endswith('>')
+
+    def check(self, wait: bool = False) -> None:
+        """
+        Probes the idle sessions and reconnects the broken ones which are due.
+
+        Every controller is checked in a worker of its own, a controller whose previous
+        check is still running (e.g. connecting to an unreachable controller) is skipped.
+        Called periodically by the pool thread.
+
+        Args:
+            wait (bool, optional): Wait until the checks are finished. Defaults to False.
+        """
+        now = time.monotonic()
+        futures = []
+        with self.__cond:
+            if self.__closed:
+                return
+            for ctrl in self.__controllers.values():
+                if not ctrl.checking:
+                    ctrl.checking = True
+                    futures.append(self.__executor.submit(self.__check, ctrl, now))
+        if wait:
+            concurrent.futures.wait(futures)
+
+    def __check(self, ctrl: _Controller, now: float) -> None:
+        """
+        Checks the sessions of a single controller.
+        """
+        try:
+            self.__check_sessions(ctrl, now)
+        except Exception as e:
+            logger.error(f'{ctrl.spec.name}: check failed: {e}')
+        finally:
+            with self.__cond:
+                ctrl.checking = False
+
+    def __check_sessions(self, ctrl: _Controller, now: float) -> None:
+        """
+        Probes the stale sessions of the controller and reconnects a broken one.
+        """
+        # Probe the sessions which were idle for too long
+        with self.__cond:
+            stale = [s for s in ctrl.idle if now - ctrl.last_used.get(id(s), 0) >= self.keepalive]
+            for session in stale:
+                ctrl.idle.remove(session)
+                ctrl.busy.add(session)
+        for session in stale:
+            healthy = self.__healthy(session)
+            with self.__cond:
+                ctrl.busy.discard(session)
+                if healthy:
+                    ctrl.idle.append(session)
+                    ctrl.last_used[id(session)] = time.monotonic()
+                else:
+                    logger.warning(f'{ctrl.spec.name}: health check failed')
+                    ctrl.broken.append(session)
+                self.__cond.notify_all()
+        # Reconnect the broken sessions with backoff
+        with self.__cond:
+            if self.__closed or now < ctrl.next_retry:
+                return
+            if not ctrl.broken and self.warm and ctrl.size == 0:
+                ctrl.connecting += 1
+                session = None
+            elif ctrl.broken:
+                session = ctrl.broken.pop()
+                ctrl.connecting += 1
+            else:
+                return
+        reconnect = session is not None
+        if reconnect:
+            ok = session.reconnect() == 0
+        else:
+            session = self.__open(ctrl.spec)
+            ok = session.IsConnected
+        with self.__cond:
+            ctrl.connecting -= 1
+            if reconnect:
+                self.Reconnects += 1
+            if ok:
+                ctrl.failures = 0
+                ctrl.next_retry = 0.0
+                ctrl.idle.append(session)
+                ctrl.last_used[id(session)] = time.monotonic()
+            else:
+                ctrl.failures += 1
+                ctrl.next_retry = time.monotonic() + self.__retry_delay(ctrl.failures)
+                ctrl.broken.append(session)
+                logger.warning(f'{ctrl.spec.name}: reconnect failed, retry in {ctrl.next_retry - time.monotonic():.1f} s')
+            self.__cond.notify_all()
+
+    def __run(self) -> None:
+        interval = min(self.keepalive, self.backoff) / 2
+        while not self.__closed:
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f'Pool check failed: {e}')
+            self.__wakeup.wait(interval)
+            self.__wakeup.clear()
+
+    def close(self) -> None:
+        """
+        Disconnects all the sessions and stops the pool thread.
+        """
+        with self.__cond:
+            self.__closed = True
+            self.__cond.notify_all()
+        self.__wakeup.set()
+        self.__thread.join()
+        # The running checks put their sessions back before they are collected
+        self.__executor.shutdown(wait=True, cancel_futures=True)
+        with self.__cond:
+            sessions = []
+            for ctrl in self.__controllers.values():
+                sessions += ctrl.idle + ctrl.broken
+                ctrl.idle = []
+                ctrl.broken = []
+        for session in sessions:
+            session.disconnect()
@@ -1,17 +1,79 @@
 from gc import enable
 import logging
-logger = logging.getLogger()
-logging.basicConfig()
-logger.setLevel(logging.DEBUG)
+logger = logging.getLogger(__name__)
 
-import telnetlib as tlib
 import time
 import socket
-import re
-import os
+from collections import deque
+
+from . import telnet as tlib
+from .frames import BLOCK_SIZE, SaveParser, SourceReader, is_source_path, load_frame, \
+    SAVE_START, LOAD_START, LOAD_EOF, TRANSFER_END
+from .asfile import ASIndex
+from .cache import ResponseCache
+from .loadplan import LoadPlan
+from .matcher import TerminatorMatcher
+from .metrics import Metrics
+from .query import ReadPlan
+from .sync import SyncReport, sync_file
+from .wirelog import WireLogger
 
 #TODO: Add code comments
 
+# Terminators of the command responses and the default replies to them
+CMD_TERMINATORS = [b'\x0a>', 
+                   b'Press SPACE key to continue.', 
+                   b'Yes:1, No:0']
+CMD_REPLIES = [None, 
+               b' ', 
+               b'1']
+# Commands which may ask for a confirmation, command_batch() never sends anything behind them
+LOCKSTEP_COMMANDS = {'zpow', 'kill', 'ereset', 'delete', 'erase', 'save', 'load', 'initialize'}
+# Commands answered with a single page and never asking, command_batch() queues other commands behind them only
+PIPELINE_COMMANDS = {'', 'type', 'id', 'where'}
+
+
+def _first_word(cmd: str) -> str:
+    """
+    Returns the command word without its qualifier in lower case.
+    """
+    return cmd.split(' ')[0].split('/')[0].lower()
+
+
+def _echo(response: bytes) -> bytes:
+    """
+    Returns the echo of the command which starts the response.
+    """
+    return response.split(b'\r\n', 1)[0].strip()
+
+
+# Terminators of the save/load responses and the default replies to them
+AS_TERMINATORS = [b'.as',
+                  b'LOAD in progress',
+                  b'1:Yes, 0:No / 2:Load all, 3:Exit',
+                  b'Delete program and abort',
+                  b'Are you sure ? (Yes:1, No:0)',
+                  b'E\x17',
+                  b'errors',
+                  b'\x02C\x17',
+                  b'Force load',
+                  b'Press ENTER.'
+                  ]
+AS_REPLIES = [None,
+              None,
+              b'2\r\n',
+              b'0\r\n',
+              b'1\r\n',
+              None,
+              b'break',
+              None,
+              b'9\r\n',
+              b'\r\n'
+              ]
+# Save/load protocol events
+AS_END = AS_TERMINATORS.index(b'E\x17')
+AS_BLOCK_ACK = AS_TERMINATORS.index(b'\x02C\x17')
+
 class pykrcc:
     """
     Class for communication with Kawasaki robot controllers.
@@ -20,7 +82,9 @@ class pykrcc:
     It also provides functions for saving and loading programs to/from the controller.
     """
 
-    def __init__(self, login: str = 'as', ip: str = None, port: int = 23, timeout: int = 20, tcp_nodelay:bool = False) -> None:
+    def __init__(self, login: str = 'as', ip: str = None, port: int = 23, timeout: int = 20, tcp_nodelay:bool = False, 
+                 autoconnect: bool = True, lazy: bool = False, metrics: Metrics = None, transport=None,
+                 cache: ResponseCache = None) -> None:
         """
         Initializes a new instance of the pykrcc class.
 
@@ -30,6 +94,12 @@ class pykrcc:
             port (int, optional): Port number. Defaults to 23.
             timeout (int, optional): Timeout in milliseconds. Defaults to 20.
             tcp_nodelay (bool, optional): TCP_NODELAY option. Defaults to False.
+            autoconnect (bool, optional): Connect in the constructor. If False, call reconnect() to connect. Defaults to True.
+            lazy (bool, optional): Don't connect in the constructor, connect on demand when command, save or load is called. Defaults to False.
+            metrics (Metrics, optional): Metrics to collect the statistics of the session to. Defaults to a new Metrics labeled with the address.
+            transport (callable, optional): Opens the socket instead of socket.create_connection, e.g. WireRecorder to capture
+                the traffic or WireReplay to play a capture back. Defaults to None.
+            cache (ResponseCache, optional): Cache of the responses of read-only commands. Defaults to None (no cache).
         """
         
         # Initialize parameters
@@ -38,59 +108,65 @@ class pykrcc:
         self.__port = port
         self.TimeoutValue = timeout
         self.__tcp_nodelay = tcp_nodelay
+        self.__transport = transport
+        self.__lazy = lazy
         
         # Initialize internal data
         self.IsConnected = False
+        # Set by the first successful connection, the following ones are reconnects
+        self.__was_connected = False
+        self.__telnet_connection = None
         self.__logging = False
-        self.__logging_file = None
-        self.__cmd_terminators = [b'\x0a>', 
-                                  b'Press SPACE key to continue.', 
-                                  b'Yes:1, No:0']
-        
-        self.__as_terminators = [b'.as',
-                                 b'LOAD in progress',
-                                 b'1:Yes, 0:No / 2:Load all, 3:Exit',
-                                 b'Delete program and abort',
-                                 b'Are you sure ? \(Yes:1, No:0\)',
-                                 b'E\x17',
-                                 b'errors',
-                                 b'\x02C\x17',
-                                 b'Force load'
-                                 b'Press ENTER.'
-                                 ]
+        self.__wire_log = None
+        self.__cmd_terminators = TerminatorMatcher(CMD_TERMINATORS)
+        self.__as_terminators = TerminatorMatcher(AS_TERMINATORS)
+        # Index of the terminator which ended the last read, -1 on timeout
+        self.LastTerminator = -1
+        # Maximum size of a load block
+        self.BlockSize = BLOCK_SIZE
+        # Time given to every load block of a controller which does not acknowledge them, in seconds
+        self.BlockPace = 0.05
+        # Duration of the phases of the last load in seconds
+        self.LoadTiming = {}
+        # Duration of the phases of the last connection in seconds
+        self.ConnectTiming = {}
         
+        if metrics is None:
+            metrics = Metrics({'controller': f'{ip}:{port}'})
+        self.metrics = metrics
+        self.cache = cache
+
         self.cmdInquiry = self.default_cmd_inquiry
         self.asInquiry = self.default_as_inquiry
         self.progress = self.default_progress
 
         # Autoconnect
-        _ = self.__connect()
+        if autoconnect and not lazy:
+            _ = self.__connect()
 
     def __del__(self) -> None:
         """
         Destructor. Disconnects from the robot and stops logging if needed.
         """
         self.disconnect()
-        if self.__logging_file is not None:
+        if self.__wire_log is not None:
             self.stopLog()
 
     def __log(self, data) -> None:
         """
         Logs the data to the log file and debug output.
 
+        The log file is written by the background WireLogger, the data is only queued here.
+
         Args:
             data (bytearray or bytes or str): The data to log.
         """
-        try:
-            if type(data) is bytes or type(data) is bytearray:
-                data = data.decode()
-            if self.__logging:
-                data = re.sub(r'\x17{0,1}\x05\x02[DE]{0,1}', '', data)
-                self.__logging_file.write(data.replace('\r\n', '\n'))
-                self.__logging_file.flush()
+        if self.__logging:
+            self.__wire_log.write(data)
+        if logger.isEnabledFor(logging.DEBUG):
+            if type(data) is not str:
+                data = bytes(data).decode(errors='replace')
             logger.debug(data)
-        except Exception as e:
-            logger.error(e)
 
     def __process_options(self, socket, cmd, opt) -> None:
         """
@@ -113,17 +189,39 @@ class pykrcc:
             pass 
         else: logger.error('Unexpected telnet negotiation')
 
-    def __write(self, data: bytearray) -> int:
+    def __connection_lost(self) -> None:
+        """
+        Marks the robot disconnected after the connection was closed by the other side.
+        """
+        if self.IsConnected:
+            logger.warning('Connection to robot lost')
+        self.IsConnected = False
+        try:
+            self.__telnet_connection.close()
+        except Exception:
+            pass
+
+    def __write(self, *data: bytes) -> int:
         """
         Writes the data to the connection.
 
+        Several chunks are joined and sent at once, so the frames which don't wait
+        for a reply in between go out in one packet.
+
         Args:
-            data (bytearray): The data to write.
+            data (bytes): The data to write.
 
         Returns:
             int: The number of bytes written.
         """
-        bytes_written = self.__telnet_connection.write(data)
+        data = data[0] if len(data) == 1 else b''.join(data)
+        try:
+            bytes_written = self.__telnet_connection.write(data)
+        except (EOFError, ConnectionError):
+            self.__connection_lost()
+            raise
+        self.metrics.inc('writes_total')
+        self.metrics.inc('bytes_sent_total', len(data))
         self.__log(data)
         return bytes_written
 
@@ -140,16 +238,25 @@ class pykrcc:
         """
         if timeout is None:
             timeout = self.TimeoutValue
-        response = self.__telnet_connection.read_until(match, timeout)
+        try:
+            response = self.__telnet_connection.read_until(match, timeout)
+        except (EOFError, ConnectionError):
+            self.__connection_lost()
+            raise
+        self.metrics.inc('bytes_received_total', len(response))
+        if not response.endswith(match):
+            self.metrics.inc('timeouts_total')
         self.__log(response)
         return response
 
-    def __read_until_many(self, matches: list, timeout: int = None) -> bytearray:
+    def __read_until_many(self, matches: TerminatorMatcher, timeout: int = None) -> bytearray:
         """
         Reads from the connection until one of the matches is found.
 
+        The index of the match is stored to LastTerminator.
+
         Args:
-            matches (list): A list of matches to search for.
+            matches (TerminatorMatcher): The matches to search for.
             timeout (int, optional): The timeout in milliseconds. Defaults to None.
 
         Returns:
@@ -157,7 +264,15 @@ class pykrcc:
         """
         if timeout is None:
             timeout = self.TimeoutValue
-        response = self.__telnet_connection.expect(matches, timeout)
+        try:
+            response = self.__telnet_connection.expect(matches, timeout)
+        except (EOFError, ConnectionError):
+            self.__connection_lost()
+            raise
+        self.LastTerminator = response[0]
+        self.metrics.inc('bytes_received_total', len(response[2]))
+        if response[0] < 0:
+            self.metrics.inc('timeouts_total')
         self.__log(response[2])
         return response[2]
 
@@ -168,20 +283,25 @@ class pykrcc:
         Returns:
             bytearray: The data read from the connection.
         """
-        response = self.__telnet_connection.read_eager()
+        try:
+            response = self.__telnet_connection.read_eager()
+        except (EOFError, ConnectionError):
+            self.__connection_lost()
+            raise
+        self.metrics.inc('bytes_received_total', len(response))
         self.__log(response)
         return response
 
-    def __get_savefile(self, prog: str = None, qual: str = None) -> bytes:
+    def __start_save(self, prog: str = None, qual: str = None) -> bool:
         """
-        Reads the source code of the program from the controller and returns it.
+        Sends the save command and requests the data transfer.
 
         Args:
             prog (str, optional): Program name. Defaults to None.
             qual (str, optional): Qualifier. Defaults to None.
 
         Returns:
-            bytes: The source code of the program.
+            bool: True if the transfer was started, False if save/load is already in progress.
         """
         _prog = ''
         if prog is not None:
@@ -190,107 +310,109 @@ class pykrcc:
         if qual is not None:
             _qual = qual
         
-        if self.__logging_file:
-            self.__logging_file.write(f'save{_qual} file.as{_prog}\n')
+        if self.__wire_log is not None:
+            self.__wire_log.write(f'save{_qual} file.as{_prog}\n')
         self.__write(f'save{_qual} file.as{_prog}\r\n'.encode())
         response = self.__read_until(b'.as', 1)
-        if self.__logging_file:
-            self.__logging_file.write('Saving...(file.as)')
+        if self.__wire_log is not None:
+            self.__wire_log.write('Saving...(file.as)')
         # Check if save/load is in progress
         if b'LOAD in progress' in response:
             logger.error('SAVE/LOAD in progress')
-            if self.__logging_file:
-                self.__logging_file.write('SAVE/LOAD in progress')
-            return -2
-        self.__write(b'\x02B    0\x17')
-        switch = True
-        raw_data = b''
+            if self.__wire_log is not None:
+                self.__wire_log.write('SAVE/LOAD in progress')
+            return False
+        self.__write(SAVE_START)
+        return True
 
-        while True:
-            if switch:
-                data_block = self.__read_until(b'\x05\x02')
-                if data_block == b'':
-                    break
-                raw_data = raw_data + data_block
-                data_block = self.__read_eager()
-                if data_block == b'':
-                    break
-                raw_data = raw_data + data_block
-                if b'E\x17' in data_block:
-                    break
-            else:
-                data_block = self.__read_until(b'\x17')
-                raw_data = raw_data + data_block
-                if b'E\x17' in data_block:
-                    break
+    def __iter_save_lines(self):
+        """
+        Streams the source code lines of the started save.
 
-            switch = not switch
-        self.__write(b'\x02\x45' + b'    0' + b'\x17')
-        self.__write(b'\r\n')
-        self.__write(b'\x02' + b'E    0' + b'\x17')
-        data_block = self.__read_until(b'>')
+        The frames are read as they arrive until the parser has seen the end record.
+        Logging of the raw blocks is disabled during the transfer.
 
-        return raw_data
+        Yields:
+            bytes: Source code lines without line breaks.
 
-    def __process_data(self, data: bytearray) -> list:
+        Raises:
+            TimeoutError: If the data stopped before the end of the transfer.
         """
-        Processes the data from the robot after save command.
-
-        Args:
-            data (bytearray): Raw data from the robot after save command.
+        enable_later = self.__logging
+        self.__logging = False
+        try:
+            parser = SaveParser(self.__log_skipped)
+            while not parser.ended:
+                t_frame = time.perf_counter()
+                data_block = self.__read_until(b'\x17')
+                if not data_block.endswith(b'\x17'):
+                    raise TimeoutError('Save stopped before the end of the transfer')
+                # Take the frames which have already arrived too
+                data_block = data_block + self.__read_eager()
+                self.metrics.observe('save_frame_seconds', time.perf_counter() - t_frame)
+                yield from parser.feed(data_block)
+            yield from parser.close()
+        finally:
+            self.__logging = enable_later
+        self.__write(TRANSFER_END, b'\r\n', TRANSFER_END)
+        self.__read_until(b'>')
 
-        Returns:
-            list: List of strings which are the actual source code of the program.
+    def __log_skipped(self, line: bytes) -> None:
         """
-        data = re.sub(rb'\x17{0,1}\x05\x02[DE]{0,1}', b'', data)
-        clean_data = []
-        for line in data.splitlines():
-            if line and not line.startswith(b'\x17') and not line.startswith(b'Bfile.as') and not line.startswith(b'='):
-                clean_data.append(line)
-            else:
-                if line.startswith(b'Bfile.as'):
-                    continue
-                self.__log(line.replace(b'\x17', b'') + b'\n')
-        return clean_data
+        Logs the service lines of the save data with logging enabled.
+        """
+        enable_later = self.__logging
+        self.__logging = self.__wire_log is not None
+        try:
+            self.__log(line)
+        finally:
+            self.__logging = enable_later
 
-    def __split_content_to_blocks(self, content: list) -> list:
+    def iter_save(self, prog: str = None, qual: str = None):
         """
-        Splits the content into blocks which are acceptable by the robot.
+        Reads the source code of the program from the controller line by line.
+
+        Lines are yielded as the data blocks arrive, so memory usage doesn't depend on the size of the program.
 
         Args:
-            content (list): The content to split.
+            prog (str, optional): Program name. Defaults to None.
+            qual (str, optional): Qualifier. Defaults to None.
 
-        Returns:
-            list: A list of blocks.
+        Yields:
+            str: Source code lines without line breaks.
+
+        Raises:
+            ConnectionError: If not connected.
+            RuntimeError: If save/load is already in progress.
+            TimeoutError: If the controller stopped sending before the end of the transfer.
         """
-        max_chars = 492
-        
-        content_blocks = []
-        block = ''
-
-        for line in content:
-            if len(block) + len(line) + 2 >= max_chars:
-                content_blocks.append(block)
-                block = ''
-            block = block + line 
-        if block != '':
-            content_blocks.append(block)
-        return content_blocks
+        if not self.__ensure_connected():
+            raise ConnectionError('Not connected')
+        if not self.__start_save(prog, qual):
+            raise RuntimeError('SAVE/LOAD in progress')
+        for line in self.__iter_save_lines():
+            yield line.decode()
 
     def __connect(self) -> int: 
         """ 
         Tries to establish connection to the robot and login.
 
+        The handshake only waits for the prompts of the robot. The duration of the
+        phases is stored to ConnectTiming.
+
         Returns:
             int: 0 if connected successfully, 
             -1 if connection could not be established, 
             -2 if timeout occurred while trying to login, 
             -3 if an unexpected error occurred while trying to login.
         """ 
+        timing = {}
+        self.ConnectTiming = timing
+        t_start = time.perf_counter()
         # Trying to establish connection
         try: 
             logger.debug(f'Connecting to robot with {self.__ip}:{self.__port}')
-            self.__telnet_connection = tlib.Telnet()
+            self.__telnet_connection = tlib.Telnet(connect=self.__transport)
             self.__telnet_connection.set_option_negotiation_callback(self.__process_options)
             self.__telnet_connection.open(self.__ip, self.__port, self.TimeoutValue)
             self.__telnet_connection.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, self.__tcp_nodelay)
@@ -298,13 +420,22 @@ class pykrcc:
         except Exception as e:
             logger.error(f'Failed to connect to robot: {e}')
             return -1
+        t_connected = time.perf_counter()
+        timing['connect'] = t_connected - t_start
         # Trying to login
         try:
-            time.sleep(0.5)
             logger.debug('Trying to login') 
-            self.__read_until(b'login: ')
+            # Telnet options are negotiated while waiting for the login prompt
+            if not self.__read_until(b'login: ').endswith(b'login: '):
+                raise TimeoutError()
+            t_prompt = time.perf_counter()
+            timing['negotiation'] = t_prompt - t_connected
             self.__write(self.__login.encode() + b'\r\n')
-            self.__read_until(b'>')
+            if not self.__read_until(b'>').endswith(b'>'):
+                raise TimeoutError()
+            t_login = time.perf_counter()
+            timing['login'] = t_login - t_prompt
+            timing['total'] = t_login - t_start
         except TimeoutError:
             logger.error('Timeout while trying to login')
             return -2
@@ -312,8 +443,22 @@ class pykrcc:
             logger.error(f'Unexpected error while trying to login: {e}')
             return -3
         self.IsConnected = True
+        self.__was_connected = True
+        self.metrics.observe('connect_seconds', timing['total'])
+        logger.debug(f'Connect timing: {timing}')
         return 0
 
+    def __ensure_connected(self) -> bool:
+        """
+        Connects on demand if the session is lazy.
+
+        Returns:
+            bool: True if connected.
+        """
+        if not self.IsConnected and self.__lazy:
+            self.reconnect()
+        return self.IsConnected
+
     def connect(self, port_str: str = None, login: str = 'khidl', ip: str = None, port: int = 23, timeout: int = 20000, tcp_nodelay:bool = False):
         """
         Connects to the robot.
@@ -341,6 +486,24 @@ class pykrcc:
 
         return self.__connect()
 
+    def reconnect(self) -> int:
+        """
+        Closes the connection if it is open and connects again with the current parameters.
+
+        Only a session which has been connected before counts in reconnects_total, so the
+        first connection of a lazy session is not a reconnect.
+
+        Returns:
+            int: Return code of the connection, see connect().
+        """
+        if self.IsConnected:
+            self.disconnect()
+        else:
+            self.__connection_lost()
+        if self.__was_connected:
+            self.metrics.inc('reconnects_total')
+        return self.__connect()
+
     def disconnect(self) -> bool:
         """
         Disconnects from the robot.
@@ -349,6 +512,9 @@ class pykrcc:
             bool: True if disconnected successfully, False if not.
         """
         if not self.IsConnected:
+            # A connection being established in another thread is interrupted
+            if self.__telnet_connection is not None:
+                self.__telnet_connection.close()
             logger.info('Robot is already disconnected')
             return True
         try:
@@ -373,14 +539,18 @@ class pykrcc:
         """
         Starts logging to file.
 
+        The file is written in a background thread, see WireLogger.
+
         Args:
             log_fname (str): Name of the log file.
 
         Returns:
             bool: True if logging started successfully, False if not.
         """
+        if self.__wire_log is not None:
+            self.stopLog()
         try:
-            self.__logging_file = open(log_fname, 'a')
+            self.__wire_log = WireLogger(log_fname)
             self.__logging = True
             return True
         except Exception as e:
@@ -394,10 +564,12 @@ class pykrcc:
         Returns:
             bool: True if logging stopped successfully, False if not.
         """
+        if self.__wire_log is None:
+            return True
         try:
-            self.__logging_file.close()
-            self.__logging_file = None
             self.__logging = False
+            wire_log, self.__wire_log = self.__wire_log, None
+            wire_log.close()
             return True
         except Exception as e:
             logger.error(f'Failed to close logging file: {e}')
@@ -409,77 +581,285 @@ class pykrcc:
 
         Args:
             cmd (str, optional): Command string. Defaults to None.
-            timeout (int, optional): Timeout in milliseconds. Defaults to None.
+            timeout (int, optional): Time to wait for each part of the response in seconds. Defaults to None (5 s).
 
         Returns:
             list: A list containing the return code and the response string. 
             Return code is 0 if the command was sent successfully, 
-            -1 if timeout occurred, 
+            -1 if no prompt or inquiry arrived before the timeout, 
             -2 if not connected, 
             -3 if the command was invalid, 
             -4 if the request was denied, 
             -5 if an error occurred.
         """
-        if not self.IsConnected:
+        if not self.__ensure_connected():
             return (-2, 'Not connected')
         if cmd is None:
             cmd = ''
+        metrics = self.metrics
+        cache = self.cache
+        if cache is not None:
+            ttl = cache.ttl(cmd)
+            if ttl is None:
+                cache.invalidate()
+            elif ttl > 0:
+                cached = cache.get(cmd)
+                if cached is not None:
+                    metrics.inc('command_cache_hits_total')
+                    return (0, cached)
         response_ret = b''
+        metrics.inc('commands_total')
+        t_start = time.perf_counter()
+        wait = 5 if timeout is None else timeout
         try:
             self.__write(cmd.encode() + b'\r\n')
-            response = self.__read_until_many(self.__cmd_terminators, 5)
+            response = self.__read_until_many(self.__cmd_terminators, wait)
             response_ret = response_ret + response
+            inquiries = 0
             while True:
+                if self.LastTerminator < 0:
+                    raise TimeoutError()
                 request = self.cmdInquiry(response)
                 if request is None:
                     break
+                inquiries += 1
                 self.__write(request)
-                response = self.__read_until_many(self.__cmd_terminators, 5)
+                response = self.__read_until_many(self.__cmd_terminators, wait)
                 response_ret = response_ret + response
-            return (0, response_ret.decode())    
+            if inquiries:
+                metrics.inc('command_inquiries_total', inquiries)
+            metrics.observe('command_seconds', time.perf_counter() - t_start)
+            response_ret = response_ret.decode()
+            if cache is not None:
+                cache.put(cmd, response_ret)
+            return (0, response_ret)
         
         except TimeoutError:
             logger.warning('Timeout while reading')
+            metrics.inc('command_errors_total')
             return (-1, 'Timeout while reading')
         except Exception as e:
             logger.error(f'Unexpected error: {e}')
+            metrics.inc('command_errors_total')
             return (-2, 'Unexpected error')
 
-    def default_cmd_inquiry(self, as_msg: bytearray) -> bytearray:
+    def command_batch(self, cmds: list, pipeline_depth: int = 8, lockstep: set = LOCKSTEP_COMMANDS, settle: float = 0.2,
+                      pipelined: set = PIPELINE_COMMANDS) -> list:
+        """
+        Sends a list of commands keeping up to pipeline_depth of them in flight.
+
+        The responses are split at the prompts, every response has to start with the echo
+        of its command. Commands are queued only behind the commands from pipelined, which
+        never page their output or ask for a confirmation, anything else ends the window.
+        Commands from lockstep run alone. If an inquiry arrives while other commands are in
+        flight, the echo doesn't match or a read times out, the pipelined bytes may have been
+        taken as an answer: the stream is drained and the command gets -3. The commands in
+        flight whose echo is found in the drained stream get their response, the others never
+        ran and are sent again one at a time, as is the rest of the batch.
+
+        The commands are always sent. With a cache, the responses are stored only if every
+        command of the batch is read-only, otherwise the cache is cleared.
+
+        Args:
+            cmds (list): Command strings, None is sent as an empty command like in command().
+            pipeline_depth (int, optional): Maximum number of commands in flight. Defaults to 8.
+            lockstep (set, optional): First words of the commands which are never pipelined. Defaults to LOCKSTEP_COMMANDS.
+            settle (float, optional): Idle time which ends the drain after a failure in seconds. Defaults to 0.2.
+            pipelined (set, optional): First words of the commands which other commands may be queued behind.
+                Defaults to PIPELINE_COMMANDS.
+
+        Returns:
+            list: (code, response) of every command as returned by command(),
+            code -3 if the command was being read when the pipeline failed, its effect is unknown.
+        """
+        if not self.__ensure_connected():
+            return [(-2, 'Not connected')] * len(cmds)
+        cmds = ['' if cmd is None else cmd for cmd in cmds]
+        results = [None] * len(cmds)
+        metrics = self.metrics
+        cache = self.cache
+        if cache is not None and any(cache.ttl(cmd) is None for cmd in cmds):
+            cache.invalidate()
+            cache = None
+        depth = max(1, pipeline_depth)
+        pending = deque()
+        sent = {}
+        next_cmd = 0
+        try:
+            while next_cmd < len(cmds) or pending:
+                # Fill the window, the commands go out in one write
+                lines = []
+                while next_cmd < len(cmds) and len(pending) < depth:
+                    if pending and _first_word(cmds[pending[-1]]) not in pipelined:
+                        # The last command may page or ask, the queued bytes would answer it
+                        break
+                    cmd = cmds[next_cmd]
+                    if _first_word(cmd) in lockstep:
+                        if pending or lines:
+                            break
+                        results[next_cmd] = self.command(cmd)
+                        next_cmd += 1
+                        continue
+                    lines.append(cmd.encode() + b'\r\n')
+                    pending.append(next_cmd)
+                    sent[next_cmd] = time.perf_counter()
+                    metrics.inc('commands_total')
+                    next_cmd += 1
+                if lines:
+                    self.__write(*lines)
+                if not pending:
+                    continue
+                i = pending.popleft()
+                response_ret = b''
+                failed = False
+                while True:
+                    response = self.__read_until_many(self.__cmd_terminators, 5)
+                    response_ret = response_ret + response
+                    index = self.LastTerminator
+                    if index == 0 or index < 0 or pending:
+                        break
+                    # Nothing else is in flight, answer the inquiry as command() does
+                    request = self.cmdInquiry(response)
+                    if request is None:
+                        break
+                    metrics.inc('command_inquiries_total')
+                    self.__write(request)
+                if index < 0:
+                    logger.warning('Timeout while reading, pipeline stopped')
+                    failed = True
+                elif index > 0:
+                    logger.warning('Inquiry while commands were in flight, pipeline stopped')
+                    failed = True
+                elif _echo(response_ret) != cmds[i].strip().encode():
+                    logger.warning('Unexpected echo, pipeline stopped')
+                    failed = True
+                if not failed:
+                    metrics.observe('command_seconds', time.perf_counter() - sent[i])
+                    results[i] = (0, response_ret.decode())
+                    if cache is not None:
+                        cache.put(cmds[i], results[i][1])
+                    continue
+                response_ret = response_ret + self.__drain_commands(settle, index)
+                metrics.inc('command_errors_total')
+                # The first response belongs to the failed command, the rest to the commands in flight
+                segments = response_ret.split(b'\n>')
+                results[i] = (-3, (segments[0] + b'\n>').decode(errors='replace'))
+                segments = [segment + b'\n>' for segment in segments[1:-1]]
+                lost = []
+                for j in pending:
+                    echoes = [_echo(segment) for segment in segments]
+                    if cmds[j].strip().encode() in echoes:
+                        k = echoes.index(cmds[j].strip().encode())
+                        results[j] = (0, segments[k].decode(errors='replace'))
+                        segments = segments[k + 1:]
+                    else:
+                        lost.append(j)
+                pending.clear()
+                depth = 1
+                # The lost commands never reached the command line, they are sent again
+                for j in lost:
+                    logger.info(f'Sending again: {cmds[j]!r}')
+                    results[j] = self.command(cmds[j])
+            return results
+        except Exception as e:
+            logger.error(f'Unexpected error: {e}')
+            for i in range(len(cmds)):
+                if results[i] is None:
+                    results[i] = (-2, 'Unexpected error')
+            return results
+
+    def __drain_commands(self, settle: float, index: int) -> bytes:
+        """
+        Reads the responses until the controller is idle at the prompt.
+
+        An inquiry which is still waiting when the stream goes idle is answered.
+
+        Args:
+            settle (float): Idle time in seconds.
+            index (int): Index of the terminator which ended the last read.
+
+        Returns:
+            bytes: The data read.
+        """
+        drained = b''
+        response = b''
+        while True:
+            data = self.__read_until_many(self.__cmd_terminators, settle)
+            drained = drained + data
+            if self.LastTerminator >= 0:
+                index, response = self.LastTerminator, data
+                continue
+            if index <= 0 or data:
+                return drained
+            # Nothing arrived after the inquiry, the controller waits for an answer
+            self.LastTerminator = index
+            request = self.cmdInquiry(response)
+            index = -1
+            if request is None:
+                return drained
+            self.__write(request)
+
+    def read_many(self, queries, timeout: int = None) -> tuple:
+        """
+        Reads several AS values with as few commands as possible.
+
+        Args:
+            queries (list or ReadPlan): AS expressions, or (expression, kind) tuples with kind
+                'real', 'int', 'sig', 'trans' or 'joint'. Strings starting with 'SIG(' are signals,
+                strings starting with '#' are joint poses, other strings are reals.
+            timeout (int, optional): Timeout in seconds. Defaults to None.
+
+        Returns:
+            tuple: The return code and the dict of the values keyed by the expressions.
+            Return code is 0 if the values were read successfully,
+            -1 if timeout occurred,
+            -2 if not connected or an error occurred,
+            -3 if the response could not be parsed, the response is returned instead of the values.
+        """
+        plan = queries if isinstance(queries, ReadPlan) else ReadPlan(queries)
+        responses = []
+        for cmd in plan.commands:
+            code, response = self.command(cmd, timeout)
+            if code != 0:
+                return (code, response)
+            responses.append(response)
+        try:
+            return (0, plan.parse(responses))
+        except ValueError as e:
+            logger.error(f'Failed to parse the values: {e}')
+            return (-3, '\n'.join(responses))
+
+    def default_cmd_inquiry(self, as_msg: bytearray, index: int = None) -> bytearray:
         """
         Default inquiry function for commands.
 
-        Checks if the response contains any inquiry strings and returns the appropriate response.
+        Returns the appropriate response to the terminator which ended the message.
+
+        Args:
+            as_msg (bytearray): The message from the robot.
+            index (int, optional): Index of the terminator in CMD_TERMINATORS. Defaults to LastTerminator.
         """
-        if b'\x0a>' in as_msg:
-            return None
-        if b'Press SPACE key to continue.' in as_msg:
-            return b' '
-        if b'Yes:1, No:0' in as_msg:
-            return b'1'
-        return b''
+        if index is None:
+            index = self.LastTerminator
+        if index < 0:
+            return b''
+        return CMD_REPLIES[index]
 
-    def default_as_inquiry(self, as_msg: bytearray) -> bytearray:
+    def default_as_inquiry(self, as_msg: bytearray, index: int = None) -> bytearray:
         """
         Default inquiry function for save/load commands.
 
-        Checks if the response contains any inquiry strings and returns the appropriate response.
+        Returns the appropriate response to the terminator which ended the message.
+
+        Args:
+            as_msg (bytearray): The message from the robot.
+            index (int, optional): Index of the terminator in AS_TERMINATORS. Defaults to LastTerminator.
         """
-        if b'errors' in as_msg:
-            return b'break'
-        if b'1:Yes, 0:No / 2:Load all, 3:Exit' in as_msg:
-            return b'2\r\n'
-        if b'E\x17' in as_msg:
+        if index is None:
+            index = self.LastTerminator
+        if index < 0:
             return None
-        if b'Delete program and abort' in as_msg:
-            return b'0\r\n'
-        if b'Are you sure' in as_msg:
-            return b'1\r\n'
-        if b'Force load' in as_msg:
-            return b'9\r\n'
-        if b'Press ENTER.' in as_msg:
-            return b'\r\n'
-        return None
+        return AS_REPLIES[index]
 
     def default_progress(self, val: int, total: int) -> None:
         """
@@ -494,13 +874,49 @@ class pykrcc:
         logger.info(f'Progress: {val}/{total}')
         return
 
-    def load(self, fname: str, qual: str = None) -> int:
+    def __wait_as_event(self, timeout: int, events: tuple) -> int:
+        """
+        Reads the save/load responses and answers the inquiries until one of the events.
+
+        Args:
+            timeout (int): The timeout of a single read.
+            events (tuple): Indexes of AS_TERMINATORS to wait for.
+
+        Returns:
+            int: Index of the event, -1 if nothing matched before the timeout.
+        """
+        while True:
+            response = self.__read_until_many(self.__as_terminators, timeout)
+            index = self.LastTerminator
+            request = self.asInquiry(response)
+            if request is not None:
+                self.__write(request)
+            if index < 0 or index in events:
+                return index
+
+    def load(self, fname, qual: str = None, sections: list = None) -> int:
         """
         Loads a file into the controller.
 
+        Every block waits for the acknowledgement of the controller, the idle timeouts
+        are used only if the controller stops responding. The duration of the phases
+        is stored to LoadTiming.
+
+        With sections the file is indexed (see ASIndex) and only the lines of the selected
+        programs, variables and sections are read from the mapped file. A LoadPlan is sent
+        as prepared, which saves the preparation when the same file is loaded to many robots.
+
+        Other sources are packed into blocks while they are sent, so the memory does not
+        grow with the size of the file. A str with a line break, bytes or an iterable of
+        lines is loaded from memory without a temporary file. The progress is reported in
+        bytes of the source, its total is None if the size of an iterable is not known.
+
         Args:
-            fname (str): Name of the file to load.
+            fname (str or bytes or iterable or ASIndex or LoadPlan): Name of the file to load, the AS source
+                or its lines, its index or its plan. Sections can be selected only from a file.
             qual (str, optional): Qualifier string. Defaults to None.
+            sections (list, optional): Keys of the units to load, program names, section names
+                or '<section> <variable>'. Defaults to None (the whole file).
 
         Returns:
             int: Return code. 0 if the file was loaded successfully, 
@@ -510,9 +926,11 @@ class pykrcc:
             -4 if an error occurred.
         """
         # Check connection
-        if not self.IsConnected:
+        if not self.__ensure_connected():
             logger.error('Not connected')
             return -3
+        if self.cache is not None:
+            self.cache.invalidate()
         # Disable logging while loading
         enable_later = False
         if self.__logging:
@@ -522,71 +940,101 @@ class pykrcc:
         _qual = b''
         if qual is not None:
             _qual = qual.encode()
+        timing = {}
+        self.LoadTiming = timing
+        t_start = t_phase = time.perf_counter()
         # Load file
+        as_index = None
+        source = None
         try:
-            max_chars = 470
-            with open(fname, 'r') as f:
-                content = f.readlines()
-            file_size = os.path.getsize(fname)
+            if isinstance(fname, LoadPlan):
+                file_size = fname.size
+                payloads = zip(fname.sizes, fname.frames)
+            elif isinstance(fname, ASIndex) or sections is not None:
+                if not isinstance(fname, ASIndex) and not is_source_path(fname):
+                    raise ValueError('Sections can be selected only from a file')
+                as_index = fname if isinstance(fname, ASIndex) else ASIndex(fname)
+                entries = as_index.select(sections)
+                file_size = sum(e.size for e in entries)
+                payloads = ((len(block), load_frame(block)) for block in as_index.iter_blocks(entries, self.BlockSize))
+            else:
+                source = SourceReader(fname)
+                file_size = source.size
+                payloads = source.frames(self.BlockSize)
             logger.debug(f'File size: {file_size}')
-            content_blocks = self.__split_content_to_blocks(content)
         except FileNotFoundError:
             logger.error(f'File not found: {fname}')
             return -3
         except Exception as e:
             logger.error(f'Unexpected error: {e}')
+            if as_index is not None and as_index is not fname:
+                as_index.close()
+            if source is not None:
+                source.close()
             return -4
         finally:
             self.__logging = enable_later
+        t_now = time.perf_counter()
+        timing['prepare'], t_phase = t_now - t_phase, t_now
         # Load data to controller
         try:
             self.__write(b'load'+ _qual + b' file'  + b'\r\n')
             # Add to logging file
-            if self.__logging_file is not None:
-                self.__logging_file.write(f'load{_qual.decode()} file\r\n')
+            if self.__wire_log is not None:
+                self.__wire_log.write(f'load{_qual.decode()} file\r\n')
             response = self.__read_until_many(self.__as_terminators, 2)
             # Check if load is in progress
             if b'LOAD in progress' in response:
                 logger.error('SAVE/LOAD in progress')
-                if self.__logging_file:
-                    self.__logging_file.write('SAVE/LOAD in progress')
+                if self.__wire_log is not None:
+                    self.__wire_log.write('SAVE/LOAD in progress')
                 return -2
-            self.__write(b'\x02A    0\x17')
+            self.__write(LOAD_START)
             response = self.__read_until(b'\x17')
             logger.debug(response)
-            
-            empty_counter = 0
+            t_now = time.perf_counter()
+            timing['start'], t_phase = t_now - t_phase, t_now
+
             loaded_size = 0
-            for block in content_blocks:
-                loaded_size = loaded_size + len(block.encode())
+            acked = True
+            index = AS_BLOCK_ACK
+            for size, frame in payloads:
+                if index == AS_END:
+                    logger.error('Load ended by the controller before all the data was sent')
+                    return -4
+                loaded_size = loaded_size + size
                 self.progress(loaded_size, file_size)
-                self.__write(b'\x02C    0' + block.encode() + b'\r\n\x17')
-                response = self.__read_until_many(self.__as_terminators, 1)
-                logger.debug(response)
-                request = self.asInquiry(response)
-                if request is not None:
-                    self.__write(request)
-                if response == b'':
-                    empty_counter += 1
-                    if empty_counter > 2:
-                        break
-            empty_counter = 0
-            self.progress(file_size, file_size)
-            while True:
-                response = self.__read_until_many(self.__as_terminators, 1)
-                logger.debug(response)
-                request = self.asInquiry(response)
-                if request is not None:
-                    self.__write(request)
-                if response == b'':
-                    empty_counter += 1
-                    if empty_counter > 2:
-                        break
-            self.__write(b'\x02' + b'C    0' + b'\x1a\x17')
-            self.__write(b'\r\n')
-            response = self.__read_until(b'E\x17')
-            self.__write(b'\x02' + b'E    0' + b'\x17')
+                t_block = time.perf_counter()
+                self.__write(frame)
+                index = self.__wait_as_event(1 if acked else self.BlockPace, (AS_BLOCK_ACK, AS_END))
+                if index < 0 and acked:
+                    # The controller does not acknowledge the blocks, the rest is paced by time
+                    logger.warning('Load block not acknowledged, pacing the blocks by time')
+                    acked = False
+                elif acked:
+                    self.metrics.observe('load_block_seconds', time.perf_counter() - t_block)
+            self.progress(loaded_size, loaded_size if file_size is None else file_size)
+            t_now = time.perf_counter()
+            timing['transfer'], t_phase = t_now - t_phase, t_now
+            # Answer the pending inquiries and take the late acknowledgements
+            ended = index == AS_END
+            if not ended:
+                ended = self.__wait_as_event(0, (AS_END,)) == AS_END
+            t_now = time.perf_counter()
+            timing['drain'], t_phase = t_now - t_phase, t_now
+            if ended:
+                self.__write(LOAD_EOF, b'\r\n', TRANSFER_END)
+            else:
+                self.__write(LOAD_EOF, b'\r\n')
+                if self.__wait_as_event(self.TimeoutValue, (AS_END,)) < 0:
+                    raise TimeoutError('End of the load not received')
+                self.__write(TRANSFER_END)
             response = self.__read_until(b'>')
+            t_now = time.perf_counter()
+            timing['finish'] = t_now - t_phase
+            timing['total'] = t_now - t_start
+            self.metrics.observe('load_seconds', timing['total'])
+            logger.debug(f'Load timing: {timing}')
             return 0
         except TimeoutError:
             logger.warning('Timeout while reading')
@@ -596,11 +1044,38 @@ class pykrcc:
             return -4
         finally:
             self.__logging = enable_later
+            if as_index is not None and as_index is not fname:
+                as_index.close()
+            if source is not None:
+                source.close()
+
+    def sync(self, fname: str, qual: str = None, cache: str = None, fetch: bool = True) -> tuple:
+        """
+        Loads only the programs, variables and sections of the file which differ from the controller.
+
+        Programs are compared with their save output, variables and other sections with the
+        hashes in the cache written by the previous sync (see sync_file).
+
+        Args:
+            fname (str): Name of the file to load.
+            qual (str, optional): Qualifier string. Defaults to None.
+            cache (str, optional): JSON file with the hashes of the loaded units. Defaults to None.
+            fetch (bool, optional): Read the programs from the controller instead of trusting the cache. Defaults to True.
+
+        Returns:
+            tuple: Return code as of load() and the SyncReport with the loaded units and bytes avoided.
+        """
+        if not self.__ensure_connected():
+            logger.error('Not connected')
+            return (-3, SyncReport())
+        return sync_file(self, fname, qual, cache, fetch, f'{self.__ip}:{self.__port}')
 
     def save(self, fname: str, prog: str = None, qual: str = None) -> int:
         """
         Saves the source code of the program to file.
 
+        The data is written to the file as it arrives from the controller.
+
         Args:
             fname (str): Name of the file to save the data to.
             prog (str, optional): Program name. Defaults to None.
@@ -609,20 +1084,22 @@ class pykrcc:
         Returns:
             int: 0 if saved successfully, 
             -1 if timeout occurred, 
-            -2 if not connected, 
+            -2 if not connected or save/load is already in progress, 
             -3 if file already exists, 
             -4 if an error occurred.
         """
-        enable_later = False
-        if self.__logging:
-            enable_later = True
-            self.__logging = False
+        if not self.__ensure_connected():
+            logger.error('Not connected')
+            return -2
+        t_start = time.perf_counter()
         try:
             with open(fname, 'w') as f:
-                raw_data = self.__get_savefile(prog, qual)
-                self.__logging = enable_later
-                data_list = self.__process_data(raw_data)
-                f.writelines([line.decode() + '\n' for line in data_list])
+                if not self.__start_save(prog, qual):
+                    return -2
+                for line in self.__iter_save_lines():
+                    f.write(line.decode() + '\n')
+            self.metrics.observe('save_seconds', time.perf_counter() - t_start)
+            return 0
         except TimeoutError:
             logger.warning('Timeout while reading')
             return -1
@@ -632,5 +1109,3 @@ class pykrcc:
         except Exception as e:
             logger.error(f'Unexpected error: {e}')
             return -4
-        finally:
-            self.__logging = enable_later
@@ -0,0 +1,130 @@
+import re
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Separator of the values printed by one TYPE command
+SEPARATOR = '|'
+# Kinds of the values which can be read
+KINDS = ('real', 'int', 'sig', 'trans', 'joint')
+
+_OUTPUT = re.compile(r'\[([^\[\]\r\n]*)\]')
+
+
+def _query_kind(query) -> tuple:
+    """
+    Splits the query to the AS expression and the kind of its value.
+
+    Plain strings are reals, except 'SIG(...)' which is a signal and '#name' which is a joint pose.
+    """
+    if isinstance(query, tuple):
+        expr, kind = query
+    else:
+        expr = query
+        if expr.upper().startswith('SIG('):
+            kind = 'sig'
+        elif expr.startswith('#'):
+            kind = 'joint'
+        else:
+            kind = 'real'
+    if kind not in KINDS:
+        raise ValueError(f'Unknown kind of {expr}: {kind}')
+    return expr.strip(), kind
+
+
+class ReadPlan:
+    """
+    TYPE commands which read a set of AS values at once.
+
+    Every value is printed by an expression of a TYPE command, poses are read
+    element by element with DEXT(). The expressions are packed into as few
+    commands as the line length allows, so a plan of scalar values and a few
+    poses usually needs a single round trip. Build the plan once and pass it to
+    read_many() on every polling cycle.
+    """
+
+    def __init__(self, queries: list, axes: int = 6, max_line: int = 240) -> None:
+        """
+        Initializes a new instance of the ReadPlan class.
+
+        Args:
+            queries (list): AS expressions, or (expression, kind) tuples with kind in KINDS.
+            axes (int, optional): Number of the joints of the robot. Defaults to 6.
+            max_line (int, optional): Maximum length of a command line. Defaults to 240.
+        """
+        self.items = [_query_kind(q) for q in queries]
+        self.axes = axes
+        self.commands = []
+        # Number of the printed values of every command
+        self.counts = []
+        # Room for the expressions after the TYPE keyword and the brackets
+        room = max_line - len('TYPE "[",,"]"')
+        line = ''
+        count = 0
+        for expr, kind in self.items:
+            if kind == 'trans':
+                exprs = [f'DEXT({expr},{i})' for i in range(1, 7)]
+            elif kind == 'joint':
+                exprs = [f'DEXT({expr},{i})' for i in range(1, axes + 1)]
+            else:
+                exprs = [expr]
+            for e in exprs:
+                part = f',"{SEPARATOR}",{e}' if count else e
+                if count and len(line) + len(part) > room:
+                    self.__close(line, count)
+                    line, count, part = '', 0, e
+                line += part
+                count += 1
+        if count:
+            self.__close(line, count)
+
+    def __close(self, line: str, count: int) -> None:
+        self.commands.append(f'TYPE "[",{line},"]"')
+        self.counts.append(count)
+
+    def parse(self, responses: list) -> dict:
+        """
+        Converts the responses of the commands to Python values.
+
+        Reals are floats, ints are ints, signals are bools and poses are numpy
+        arrays (tuples if numpy is not installed).
+
+        Args:
+            responses (list): Responses of the commands in the order of the commands.
+
+        Returns:
+            dict: Values keyed by the expressions.
+
+        Raises:
+            ValueError: If a response doesn't contain the expected values.
+        """
+        values = []
+        for response, count in zip(responses, self.counts):
+            # Skip the echo of the command
+            output = response.split('\n', 1)[1] if '\n' in response else ''
+            m = _OUTPUT.search(output)
+            if m is None:
+                raise ValueError(f'Unexpected response: {output.strip()}')
+            fields = m.group(1).split(SEPARATOR)
+            if len(fields) != count:
+                raise ValueError(f'Expected {count} values, got {len(fields)}: {m.group(1)}')
+            values += [float(f) for f in fields]
+        result = {}
+        i = 0
+        for expr, kind in self.items:
+            if kind == 'trans' or kind == 'joint':
+                n = 6 if kind == 'trans' else self.axes
+                pose = values[i:i + n]
+                result[expr] = np.array(pose) if np is not None else tuple(pose)
+                i += n
+                continue
+            value = values[i]
+            if kind == 'int':
+                value = int(round(value))
+            elif kind == 'sig':
+                value = value != 0
+            result[expr] = value
+            i += 1
+        return result
@@ -0,0 +1,196 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import threading
+import time
+from dataclasses import dataclass
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .query import ReadPlan
+
+
+@dataclass
+class Samples:
+    """
+    Recent samples of the robot state, oldest first.
+
+    The arrays are views of the ring buffers of the sampler. They stay valid for at
+    least the next spare samples of the sampler, copy them to keep them longer.
+    """
+    time: 'np.ndarray'
+    pose: 'np.ndarray'
+    joints: 'np.ndarray'
+    signals: 'np.ndarray'
+    values: 'np.ndarray'
+
+
+class StateSampler:
+    """
+    Polls the robot state of a session at a fixed rate in a background thread.
+
+    Every sample (the current pose, joints, signals and real variables) is read with
+    one read_many() call and stored to preallocated ring buffers with a monotonic
+    timestamp. The ring holds capacity + spare samples and is written twice (at i and
+    i + its length), so the last n samples are always a contiguous slice and snapshot()
+    returns them without copying. The spare rows keep a snapshot of up to capacity
+    samples intact while the next spare samples are written.
+
+    The session must not be used by other threads while the sampler is running.
+    """
+
+    def __init__(self, session, signals: list = (), variables: list = (), rate: float = 10.0, capacity: int = 1000,
+                 pose: str = 'HERE', joints: str = None, axes: int = 6, spare: int = None) -> None:
+        """
+        Initializes a new instance of the StateSampler class.
+
+        Args:
+            session (pykrcc): Connected session used for the polling.
+            signals (list, optional): Numbers of the signals to sample. Defaults to ().
+            variables (list, optional): Real variables or expressions to sample. Defaults to ().
+            rate (float, optional): Target sampling rate in Hz. Defaults to 10.0.
+            capacity (int, optional): Number of samples kept. Defaults to 1000.
+            pose (str, optional): Expression of the current transformation pose, None to skip it. Defaults to 'HERE'.
+            joints (str, optional): Expression of the current joint pose (e.g. '#HERE'), None to skip it. Defaults to None.
+            axes (int, optional): Number of the joints of the robot. Defaults to 6.
+            spare (int, optional): Number of the samples a snapshot stays valid for. Defaults to the capacity.
+
+        Raises:
+            ImportError: If numpy is not installed.
+        """
+        if np is None:
+            raise ImportError('StateSampler requires numpy')
+        self.session = session
+        self.period = 1.0 / rate
+        self.capacity = capacity
+        self.spare = capacity if spare is None else spare
+        # Length of the ring, the buffers hold it twice
+        self.__ring = capacity + self.spare
+        self.__pose = pose
+        self.__joints = joints
+        self.__signals = [f'SIG({n})' for n in signals]
+        self.__variables = list(variables)
+        queries = []
+        if pose is not None:
+            queries.append((pose, 'trans'))
+        if joints is not None:
+            queries.append((joints, 'joint'))
+        queries += [(s, 'sig') for s in self.__signals]
+        queries += [(v, 'real') for v in self.__variables]
+        self.plan = ReadPlan(queries, axes)
+
+        size = 2 * self.__ring
+        self.__time = np.zeros(size)
+        self.__pose_buf = np.zeros((size, 6 if pose is not None else 0))
+        self.__joints_buf = np.zeros((size, axes if joints is not None else 0))
+        self.__signals_buf = np.zeros((size, len(self.__signals)), dtype=bool)
+        self.__values_buf = np.zeros((size, len(self.__variables)))
+
+        # Number of the samples taken
+        self.Count = 0
+        # Number of the sampling periods which were missed because a read took too long
+        self.Missed = 0
+        # Number of the failed reads
+        self.Errors = 0
+        self.__stop = threading.Event()
+        self.__thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    @property
+    def running(self) -> bool:
+        return self.__thread is not None and self.__thread.is_alive()
+
+    def sample(self) -> bool:
+        """
+        Reads the state once and stores it to the buffers.
+
+        Returns:
+            bool: True if the sample was stored, False if the read failed.
+        """
+        t_sample = time.monotonic()
+        code, values = self.session.read_many(self.plan)
+        if code != 0:
+            self.Errors += 1
+            logger.warning(f'Sampling failed: {code}')
+            return False
+        i = self.Count % self.__ring
+        for j in (i, i + self.__ring):
+            self.__time[j] = t_sample
+            if self.__pose is not None:
+                self.__pose_buf[j] = values[self.__pose]
+            if self.__joints is not None:
+                self.__joints_buf[j] = values[self.__joints]
+            for k, s in enumerate(self.__signals):
+                self.__signals_buf[j, k] = values[s]
+            for k, v in enumerate(self.__variables):
+                self.__values_buf[j, k] = values[v]
+        # Publish the sample only after it is written
+        self.Count += 1
+        return True
+
+    def __run(self) -> None:
+        next_time = time.monotonic()
+        while not self.__stop.is_set():
+            try:
+                self.sample()
+            except Exception as e:
+                self.Errors += 1
+                logger.error(f'Sampling failed: {e}')
+            next_time += self.period
+            now = time.monotonic()
+            if now > next_time:
+                # Skip the periods which already passed instead of sampling in a burst
+                missed = int((now - next_time) / self.period) + 1
+                self.Missed += missed
+                next_time += missed * self.period
+            self.__stop.wait(next_time - now)
+
+    def start(self):
+        """
+        Starts sampling in a background thread.
+
+        Returns:
+            StateSampler: The sampler itself.
+        """
+        if not self.running:
+            self.__stop.clear()
+            self.__thread = threading.Thread(target=self.__run, name='pykrcc-sampler', daemon=True)
+            self.__thread.start()
+        return self
+
+    def stop(self) -> None:
+        """
+        Stops sampling and waits for the thread to finish.
+        """
+        self.__stop.set()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+
+    def snapshot(self, n: int = None) -> Samples:
+        """
+        Returns the last samples without copying them.
+
+        The views stay valid while the sampler takes the next spare samples.
+
+        Args:
+            n (int, optional): Number of the samples, at most the capacity. Defaults to all the stored samples.
+
+        Returns:
+            Samples: Views of the last n samples, oldest first.
+        """
+        count = self.Count
+        available = min(count, self.capacity)
+        n = available if n is None else min(n, available)
+        end = (count - 1) % self.__ring + self.__ring + 1 if count else 0
+        window = slice(end - n, end)
+        return Samples(self.__time[window], self.__pose_buf[window], self.__joints_buf[window],
+                       self.__signals_buf[window], self.__values_buf[window])
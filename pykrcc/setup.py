@@ -7,9 +7,19 @@ setup(
     author='Bogachev Dmitrii',
     author_email='dm.bogachev@yandex.ru',
     url='https://github.com/dm-bogachev/pykrcc',
+    # setup.py lives inside the package directory
+    packages=['pykrcc'],
+    package_dir={'pykrcc': '.'},
+    extras_require={
+        # Poses of read_many() as arrays instead of tuples, required by StateSampler
+        'numpy': ['numpy'],
+    },
     classifiers=[
         'Development Status :: 3 - Alpha',
         'Intended Audience :: Developers',
         'License :: OSI Approved :: MIT License',
     ],  
+    entry_points={
+        'console_scripts': ['pykrcc=pykrcc.cli:main'],
+    },
 )
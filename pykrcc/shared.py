@@ -0,0 +1,148 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import concurrent.futures
+import itertools
+import queue
+import threading
+
+# Priorities of the requests, lower runs first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 5
+PRIORITY_BULK = 10
+
+# Marker which stops the worker thread, sorted after all the requests
+_STOP = (float('inf'), 0, None, None)
+
+
+class SharedSession:
+    """
+    Session which can be used from many threads at once.
+
+    All the requests are executed one at a time by a worker thread which owns the
+    session, so their traffic can't interleave. Waiting requests are ordered by the
+    priority and then by the time they were submitted: a command submitted during a
+    long load runs right after the load, before the save queued behind it. A running
+    request is never interrupted.
+
+    Every method returns a concurrent.futures.Future with the return value of the
+    pykrcc method.
+    """
+
+    def __init__(self, session) -> None:
+        """
+        Initializes a new instance of the SharedSession class and starts the worker thread.
+
+        Args:
+            session (pykrcc): The session to share.
+        """
+        self.session = session
+        self.__queue = queue.PriorityQueue()
+        self.__seq = itertools.count()
+        self.__closed = False
+        self.__lock = threading.Lock()
+        self.__thread = threading.Thread(target=self.__run, name='pykrcc-shared', daemon=True)
+        self.__thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __run(self) -> None:
+        while True:
+            _, _, future, operation = self.__queue.get()
+            if future is None:
+                return
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(operation(self.session))
+            except Exception as e:
+                logger.error(f'Shared session request failed: {e}')
+                future.set_exception(e)
+
+    def pending(self) -> int:
+        """
+        Number of the requests waiting in the queue.
+        """
+        return self.__queue.qsize()
+
+    def submit(self, operation, priority: int = PRIORITY_NORMAL) -> concurrent.futures.Future:
+        """
+        Queues an operation which gets exclusive access to the session.
+
+        Args:
+            operation (callable): Called with the session, may call several of its methods.
+            priority (int, optional): Priority of the request, lower runs first. Defaults to PRIORITY_NORMAL.
+
+        Returns:
+            concurrent.futures.Future: Result of the operation.
+
+        Raises:
+            RuntimeError: If the session was closed.
+        """
+        future = concurrent.futures.Future()
+        with self.__lock:
+            if self.__closed:
+                raise RuntimeError('Shared session is closed')
+            self.__queue.put((priority, next(self.__seq), future, operation))
+        return future
+
+    def command(self, cmd: str = None, timeout: int = None, priority: int = PRIORITY_INTERACTIVE) -> concurrent.futures.Future:
+        """
+        Queues a command, see pykrcc.command().
+
+        Returns:
+            concurrent.futures.Future: The return code and the response string.
+        """
+        return self.submit(lambda session: session.command(cmd, timeout), priority)
+
+    def read_many(self, queries, timeout: int = None, priority: int = PRIORITY_INTERACTIVE) -> concurrent.futures.Future:
+        """
+        Queues a read of several values, see pykrcc.read_many().
+
+        Returns:
+            concurrent.futures.Future: The return code and the dict of the values.
+        """
+        return self.submit(lambda session: session.read_many(queries, timeout), priority)
+
+    def save(self, fname: str, prog: str = None, qual: str = None, priority: int = PRIORITY_BULK) -> concurrent.futures.Future:
+        """
+        Queues a save, see pykrcc.save().
+
+        Returns:
+            concurrent.futures.Future: The return code of the save.
+        """
+        return self.submit(lambda session: session.save(fname, prog, qual), priority)
+
+    def load(self, fname: str, qual: str = None, priority: int = PRIORITY_BULK) -> concurrent.futures.Future:
+        """
+        Queues a load, see pykrcc.load().
+
+        Returns:
+            concurrent.futures.Future: The return code of the load.
+        """
+        return self.submit(lambda session: session.load(fname, qual), priority)
+
+    def close(self, cancel: bool = False) -> None:
+        """
+        Stops accepting requests and waits for the worker thread.
+
+        Args:
+            cancel (bool, optional): Cancel the waiting requests instead of running them. Defaults to False.
+        """
+        with self.__lock:
+            if self.__closed:
+                return
+            self.__closed = True
+            if cancel:
+                while True:
+                    try:
+                        _, _, future, _ = self.__queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    future.cancel()
+            self.__queue.put(_STOP)
+        self.__thread.join()
@@ -0,0 +1,437 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import argparse
+import random
+import re
+import socket
+import socketserver
+import threading
+import time
+
+from .telnet import IAC, DO, WILL, SB, SE, ECHO, TTYPE
+
+# Telnet suboption command
+SEND = bytes([1])
+
+
+class _Disconnect(Exception):
+    """
+    Raised to close the connection of the simulated controller.
+    """
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    """
+    Session of a single client of the simulated controller.
+    """
+
+    def setup(self) -> None:
+        self.sim = self.server.simulator
+        self.buffer = bytearray()
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, True)
+
+    def send(self, data: bytes) -> None:
+        """
+        Sends the data applying the configured latency, bandwidth and errors.
+        """
+        sim = self.sim
+        if sim.latency:
+            time.sleep(sim.latency)
+        if sim.error_rate and random.random() < sim.error_rate:
+            if sim.error_mode == 'drop':
+                raise _Disconnect()
+            if sim.error_mode == 'stall':
+                time.sleep(sim.stall_time)
+            elif sim.error_mode == 'garbage':
+                data = bytes(random.randrange(32, 127) for _ in range(len(data)))
+        if sim.bandwidth:
+            chunk = max(1, int(sim.bandwidth / 100))
+            for i in range(0, len(data), chunk):
+                self.request.sendall(data[i:i + chunk])
+                time.sleep(len(data[i:i + chunk]) / sim.bandwidth)
+        else:
+            self.request.sendall(data)
+
+    def fill(self) -> None:
+        data = self.request.recv(65536)
+        if not data:
+            raise _Disconnect()
+        self.sim.bytes_received += len(data)
+        self.buffer += data
+
+    def read_until(self, match: bytes) -> bytes:
+        while True:
+            i = self.buffer.find(match)
+            if i >= 0:
+                data = bytes(self.buffer[:i + len(match)])
+                del self.buffer[:i + len(match)]
+                return data
+            self.fill()
+
+    def read_byte(self) -> bytes:
+        while not self.buffer:
+            self.fill()
+        data = bytes(self.buffer[:1])
+        del self.buffer[:1]
+        return data
+
+    def read_line(self) -> str:
+        return self.read_until(b'\n').rstrip(b'\r\n').decode(errors='replace')
+
+    def read_record(self) -> bytes:
+        """
+        Reads the next <STX>...<ETB> record of the save/load protocol.
+        """
+        while True:
+            i = self.buffer.find(b'\x02')
+            if i >= 0:
+                del self.buffer[:i + 1]
+                break
+            self.buffer.clear()
+            self.fill()
+        return self.read_until(b'\x17')[:-1]
+
+    def negotiate(self) -> None:
+        """
+        Negotiates echo and the terminal type with the client.
+        """
+        self.send(IAC + WILL + ECHO + IAC + DO + TTYPE)
+        self.read_until(IAC + WILL + TTYPE)
+        self.send(IAC + SB + TTYPE + SEND + IAC + SE)
+        self.read_until(IAC + SE)
+        # Drop the remaining negotiation replies
+        self.buffer = bytearray(re.sub(rb'\xff[\xfb-\xfe].', b'', bytes(self.buffer)))
+
+    def handle(self) -> None:
+        try:
+            self.negotiate()
+            self.send(b'login: ')
+            login = self.read_line()
+            self.send(login.encode() + b'\r\n' + self.sim.banner + b'\r\n>')
+            while True:
+                line = self.read_line()
+                self.sim.commands.append(line)
+                self.send(line.encode() + b'\r\n')
+                self.dispatch(line.strip())
+                self.send(b'\r\n>')
+        except (_Disconnect, ConnectionError, OSError):
+            pass
+
+    def dispatch(self, line: str) -> None:
+        """
+        Executes a command line.
+        """
+        sim = self.sim
+        m = re.match(r'(?i)save(\S*)\s+file\.as(?:=(\S+))?$', line)
+        if m:
+            return self.save(m.group(1), m.group(2))
+        m = re.match(r'(?i)load(\S*)\s+file$', line)
+        if m:
+            return self.load(m.group(1))
+        word = line.split(' ')[0].lower() if line else ''
+        if word == 'type':
+            return self.type(line[4:])
+        if word in sim.confirm_commands:
+            self.send(b'Are you sure ? (Yes:1, No:0)')
+            answer = self.read_byte()
+            self.send(answer + b'\r\n')
+            return
+        handler = sim.responses.get(line.lower())
+        if handler is None:
+            handler = sim.responses.get(word)
+        if callable(handler):
+            handler = handler(line)
+        if handler is not None:
+            return self.page(handler)
+        if line:
+            self.send(b'Unknown command.')
+
+    def type(self, args: str) -> None:
+        """
+        Prints the values of the expressions of the TYPE command.
+        """
+        try:
+            text = ''.join(self.sim.evaluate(arg) for arg in _split_args(args))
+        except (KeyError, IndexError, ValueError):
+            self.send(b'(P1000) Variable is not defined.')
+            return
+        self.send(text.encode())
+
+    def page(self, text: str) -> None:
+        """
+        Sends the text waiting for the space key after every page.
+        """
+        lines = text.split('\r\n')
+        size = self.sim.page_lines
+        for i in range(0, len(lines), size):
+            self.send('\r\n'.join(lines[i:i + size]).encode())
+            if i + size < len(lines):
+                self.send(b'\r\nPress SPACE key to continue.')
+                self.read_byte()
+                self.send(b'\r\n')
+
+    def save(self, qual: str, prog: str) -> None:
+        """
+        Sends the programs in <ENQ><STX>D...<ETB> frames.
+        """
+        sim = self.sim
+        if sim.busy:
+            self.send(b'LOAD in progress')
+            return
+        self.read_until(b'\x02B    0\x17')
+        if prog is not None:
+            text = sim.programs.get(prog, '')
+        else:
+            text = sim.dump()
+        self.send(b'\x05\x02Bfile.as\r\n\x17')
+        data = text.encode()
+        if sim.split_lines:
+            block = b''
+            for line in data.splitlines(keepends=True):
+                if block and len(block) + len(line) > sim.frame_size:
+                    self.send(b'\x05\x02D' + block + b'\x17')
+                    block = b''
+                block += line
+            if block:
+                self.send(b'\x05\x02D' + block + b'\x17')
+        else:
+            for i in range(0, len(data), sim.frame_size):
+                self.send(b'\x05\x02D' + data[i:i + sim.frame_size] + b'\x17')
+        self.send(b'\x05\x02E\x17')
+        self.read_until(b'\x02E    0\x17')
+        self.read_until(b'\x02E    0\x17')
+
+    def load(self, qual: str) -> None:
+        """
+        Receives the <STX>C...<ETB> records and stores the programs.
+        """
+        sim = self.sim
+        if sim.busy:
+            self.send(b'LOAD in progress')
+            return
+        self.send(b'Loading...(file.as)\r\n')
+        self.read_until(b'\x02A    0\x17')
+        self.send(b'\x05\x02A\x17')
+        content = bytearray()
+        while True:
+            record = self.read_record()
+            if not record.startswith(b'C'):
+                continue
+            data = record[6:]
+            if data == b'\x1a':
+                break
+            sim.load_blocks.append(len(data))
+            content += data
+            if sim.block_ack:
+                self.send(b'\x05\x02C\x17')
+        text = content.decode(errors='replace')
+        for name, unit in split_programs(text):
+            if name in sim.programs and '/Q' not in qual.upper():
+                self.send(f'\r\n{name} already exists.\r\n1:Yes, 0:No / 2:Load all, 3:Exit'.encode())
+                self.read_line()
+                break
+        sim.store(text)
+        self.send(b'\r\n\x05\x02E\x17')
+        self.read_until(b'\x02E    0\x17')
+
+
+def split_programs(text: str) -> list:
+    """
+    Finds the programs in the AS source.
+
+    Args:
+        text (str): AS source.
+
+    Returns:
+        list: Tuples of the program name and the program source.
+    """
+    return [(m.group(1), m.group(0)) for m in re.finditer(r'(?ms)^\.PROGRAM\s+([^\s(]+).*?^\.END[ \t]*\r?$\n?', text)]
+
+
+def _split_args(args: str) -> list:
+    """
+    Splits the arguments of a command at the commas outside of strings and parentheses.
+    """
+    parts = []
+    depth = 0
+    quoted = False
+    start = 0
+    for i, c in enumerate(args):
+        if c == '"':
+            quoted = not quoted
+        elif not quoted and c == '(':
+            depth += 1
+        elif not quoted and c == ')':
+            depth -= 1
+        elif not quoted and depth == 0 and c == ',':
+            parts.append(args[start:i])
+            start = i + 1
+    parts.append(args[start:])
+    return [p.strip() for p in parts if p.strip()]
+
+
+class ControllerSimulator:
+    """
+    Socket based stand-in for a Kawasaki controller.
+
+    Speaks the telnet negotiation, login, command prompt and the save/load framing
+    used by pykrcc, so the client can be tested and measured without hardware.
+    The state of the controller (programs, received commands and blocks) is kept in
+    public attributes.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0, bandwidth: float = None,
+                 error_rate: float = 0.0, error_mode: str = 'drop', stall_time: float = 5.0,
+                 page_lines: int = 20, frame_size: int = 256, block_ack: bool = True, split_lines: bool = True) -> None:
+        """
+        Initializes a new instance of the ControllerSimulator class.
+
+        Args:
+            host (str, optional): Address to listen on. Defaults to '127.0.0.1'.
+            port (int, optional): Port to listen on, 0 to pick a free one. Defaults to 0.
+            latency (float, optional): Delay before every reply in seconds. Defaults to 0.0.
+            bandwidth (float, optional): Reply bandwidth limit in bytes/s. Defaults to None.
+            error_rate (float, optional): Probability of an error on every reply. Defaults to 0.0.
+            error_mode (str, optional): 'drop' closes the connection, 'stall' delays the reply by stall_time,
+                'garbage' replaces the reply with random characters. Defaults to 'drop'.
+            stall_time (float, optional): Delay of the 'stall' errors in seconds. Defaults to 5.0.
+            page_lines (int, optional): Lines per page of the command output. Defaults to 20.
+            frame_size (int, optional): Maximum size of the save frames in bytes. Defaults to 256.
+            block_ack (bool, optional): Acknowledge every load block. Defaults to True.
+            split_lines (bool, optional): Cut the save frames at line breaks, False cuts them every
+                frame_size bytes, also inside the words. Defaults to True.
+        """
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.error_mode = error_mode
+        self.stall_time = stall_time
+        self.page_lines = page_lines
+        self.frame_size = frame_size
+        self.block_ack = block_ack
+        self.split_lines = split_lines
+        self.banner = b'Kawasaki AS controller simulator'
+        self.busy = False
+        self.programs = {}
+        self.other = ''
+        self.commands = []
+        self.load_blocks = []
+        self.bytes_received = 0
+        self.confirm_commands = {'zpow', 'kill', 'ereset', 'delete'}
+        # Values printed by TYPE: reals, signals by number and poses as lists of the elements
+        self.variables = {}
+        self.signals = {}
+        self.poses = {}
+        # Replies to the commands, a string or a function of the command line
+        self.responses = {'id': 'Kawasaki AS controller simulator\r\nVersion 0.1'}
+        self.server = socketserver.ThreadingTCPServer((host, port), _Handler, bind_and_activate=False)
+        self.server.allow_reuse_address = True
+        self.server.daemon_threads = True
+        self.server.server_bind()
+        self.server.server_activate()
+        self.server.simulator = self
+        self.host, self.port = self.server.server_address[:2]
+        self.__thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def store(self, text: str) -> None:
+        """
+        Stores the AS source as if it was loaded.
+
+        Args:
+            text (str): AS source.
+        """
+        rest = text
+        for name, unit in split_programs(text):
+            self.programs[name] = unit.rstrip() + '\r\n'
+            rest = rest.replace(unit, '')
+        if rest.strip():
+            self.other = rest
+
+    def evaluate(self, expr: str) -> str:
+        """
+        Evaluates an argument of the TYPE command.
+
+        Supports string literals, numbers, real variables, SIG(n, ...) and DEXT(pose, n).
+
+        Raises:
+            KeyError: If a variable is not defined.
+        """
+        if expr.startswith('"') and expr.endswith('"'):
+            return expr[1:-1]
+        m = re.match(r'(?i)sig\((.*)\)$', expr)
+        if m:
+            on = all(self.signals.get(abs(int(n)), False) == (int(n) > 0) for n in _split_args(m.group(1)))
+            return '-1' if on else '0'
+        m = re.match(r'(?i)dext\((.*)\)$', expr)
+        if m:
+            name, index = _split_args(m.group(1))
+            value = self.poses[name.lower()][int(index) - 1]
+        else:
+            try:
+                value = float(expr)
+            except ValueError:
+                value = self.variables[expr.lower()]
+        return f'{value:g}'
+
+    def dump(self) -> str:
+        """
+        Returns the AS source of all the stored programs and data.
+        """
+        return ''.join(self.programs.values()) + self.other
+
+    def start(self):
+        """
+        Starts serving in a background thread.
+
+        Returns:
+            ControllerSimulator: The simulator itself.
+        """
+        self.__thread = threading.Thread(target=self.server.serve_forever, name='pykrcc-simulator', daemon=True)
+        self.__thread.start()
+        logger.info(f'Controller simulator listening on {self.host}:{self.port}')
+        return self
+
+    def stop(self) -> None:
+        """
+        Stops serving and closes the socket.
+        """
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main(argv: list = None) -> None:
+    parser = argparse.ArgumentParser(description='Kawasaki AS controller simulator')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9105)
+    parser.add_argument('--latency', type=float, default=0.0, help='reply delay in seconds')
+    parser.add_argument('--bandwidth', type=float, default=None, help='reply bandwidth in bytes/s')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--error-mode', choices=['drop', 'stall', 'garbage'], default='drop')
+    parser.add_argument('--frame-size', type=int, default=256, help='maximum size of the save frames')
+    parser.add_argument('--no-block-ack', action='store_true', help="don't acknowledge the load blocks")
+    parser.add_argument('--split-words', action='store_true', help='cut the save frames every frame size bytes')
+    parser.add_argument('--load', help='AS file to preload')
+    args = parser.parse_args(argv)
+    sim = ControllerSimulator(args.host, args.port, args.latency, args.bandwidth, args.error_rate, args.error_mode,
+                              frame_size=args.frame_size, block_ack=not args.no_block_ack, split_lines=not args.split_words)
+    if args.load:
+        with open(args.load) as f:
+            sim.store(f.read())
+    print(f'Listening on {sim.host}:{sim.port}', flush=True)
+    try:
+        sim.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sim.server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import json
+import os
+from dataclasses import dataclass, field
+
+from .asfile import parse_units, unit_hash
+
+
+@dataclass
+class SyncReport:
+    """
+    Result of a sync of an AS file.
+    """
+    loaded: list = field(default_factory=list)
+    unchanged: list = field(default_factory=list)
+    bytes_total: int = 0
+    bytes_loaded: int = 0
+
+    @property
+    def bytes_avoided(self) -> int:
+        return self.bytes_total - self.bytes_loaded
+
+
+def _read_cache(cache: str, key: str) -> dict:
+    try:
+        with open(cache) as f:
+            return json.load(f).get(key, {})
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logger.warning(f'Failed to read sync cache: {e}')
+        return {}
+
+
+def _write_cache(cache: str, key: str, hashes: dict) -> None:
+    try:
+        with open(cache) as f:
+            data = json.load(f)
+    except Exception:
+        data = {}
+    data[key] = hashes
+    tmp = cache + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=1)
+    os.replace(tmp, cache)
+
+
+def sync_file(session, fname: str, qual: str = None, cache: str = None, fetch: bool = True, name: str = None) -> tuple:
+    """
+    Loads the units of the AS file which differ from the controller.
+
+    The hashes of the programs on the controller are taken from save with prog=,
+    or from the cache if fetch is False. Variables and other sections can't be
+    saved one by one, so they are compared with the cache only and always loaded
+    if it is not given. The changed units are loaded from the indexed file.
+
+    Args:
+        session (pykrcc): Connected session.
+        fname (str): Name of the AS file.
+        qual (str, optional): Qualifier of the load. Defaults to None.
+        cache (str, optional): JSON file with the hashes of the units loaded before, per controller. Defaults to None.
+        fetch (bool, optional): Read the programs from the controller instead of trusting the cache. Defaults to True.
+        name (str, optional): Key of the controller in the cache. Defaults to the name of the session.
+
+    Returns:
+        tuple: Return code of the load (0 if nothing had to be loaded) and the SyncReport.
+    """
+    report = SyncReport()
+    try:
+        with open(fname, 'r') as f:
+            units = parse_units(f.read())
+    except FileNotFoundError:
+        logger.error(f'File not found: {fname}')
+        return (-3, report)
+    key = name if name is not None else session.name()
+    known = _read_cache(cache, key) if cache is not None else {}
+
+    changed = []
+    for unit in units:
+        size = len(unit.text.encode())
+        report.bytes_total += size
+        digest = unit.digest()
+        if unit.kind == 'program' and fetch:
+            try:
+                remote = unit_hash('\n'.join(session.iter_save(unit.name)))
+            except RuntimeError:
+                return (-2, report)
+            except TimeoutError:
+                return (-1, report)
+            except ConnectionError:
+                return (-3, report)
+        else:
+            remote = known.get(unit.key)
+        if remote == digest:
+            report.unchanged.append(unit.key)
+        else:
+            changed.append(unit)
+            report.loaded.append(unit.key)
+            report.bytes_loaded += size
+
+    code = 0
+    if changed:
+        code = session.load(fname, qual, [unit.key for unit in changed])
+    logger.info(f'Sync {fname}: {len(changed)} of {len(units)} units loaded, {report.bytes_avoided} bytes avoided')
+    if code == 0 and cache is not None:
+        _write_cache(cache, key, {unit.key: unit.digest() for unit in units})
+    return (code, report)
@@ -0,0 +1,342 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import selectors
+import socket
+import threading
+import time
+
+from .matcher import TerminatorMatcher
+
+# Telnet protocol bytes
+IAC = bytes([255])
+DONT = bytes([254])
+DO = bytes([253])
+WONT = bytes([252])
+WILL = bytes([251])
+SB = bytes([250])
+SE = bytes([240])
+ECHO = bytes([1])
+TTYPE = bytes([24])
+NOOPT = bytes([0])
+
+
+class TelnetParser:
+    """
+    Incremental parser which separates telnet commands from the data stream.
+
+    Received data is appended to the cooked buffer with the IAC sequences stripped.
+    Option negotiation is passed to the callback as (cmd, opt), suboption data is dropped.
+    """
+
+    def __init__(self, callback=None) -> None:
+        """
+        Initializes a new instance of the TelnetParser class.
+
+        Args:
+            callback (callable, optional): Called with (cmd, opt) for every telnet command. Defaults to None.
+        """
+        self.callback = callback
+        self.cooked = bytearray()
+        self.__iacseq = b''
+        self.__sb = False
+
+    def reset(self) -> None:
+        """
+        Drops the parser state and the cooked data.
+        """
+        self.cooked = bytearray()
+        self.__iacseq = b''
+        self.__sb = False
+
+    def feed(self, data, n: int = None) -> None:
+        """
+        Parses the received data.
+
+        Plain data is copied to the cooked buffer in runs, so the data is touched
+        once per received byte.
+
+        Args:
+            data (bytes or bytearray): Raw data received from the socket.
+            n (int, optional): Number of valid bytes in data. Defaults to len(data).
+        """
+        if n is None:
+            n = len(data)
+        view = memoryview(data)
+        cooked = self.cooked
+        pos = 0
+        while pos < n:
+            if not self.__iacseq:
+                idx = data.find(IAC, pos, n)
+                if idx < 0:
+                    if not self.__sb:
+                        cooked += view[pos:n]
+                    return
+                if not self.__sb:
+                    cooked += view[pos:idx]
+                self.__iacseq = IAC
+                pos = idx + 1
+                continue
+            c = bytes(data[pos:pos + 1])
+            pos += 1
+            if len(self.__iacseq) == 1:
+                if c in (DO, DONT, WILL, WONT):
+                    self.__iacseq += c
+                    continue
+                self.__iacseq = b''
+                if c == IAC:
+                    if not self.__sb:
+                        cooked += c
+                    continue
+                if c == SB:
+                    self.__sb = True
+                elif c == SE:
+                    self.__sb = False
+                self.__command(c, NOOPT)
+            else:
+                cmd = self.__iacseq[1:2]
+                self.__iacseq = b''
+                self.__command(cmd, c)
+
+    def __command(self, cmd: bytes, opt: bytes) -> None:
+        if self.callback is not None:
+            self.callback(cmd, opt)
+
+
+class Telnet:
+    """
+    Telnet client transport on top of a plain socket.
+
+    Replaces telnetlib for the pykrcc class. Data is received with recv_into into
+    a preallocated buffer and kept in a single cooked buffer with a read offset,
+    so consumed data is not shifted on every read.
+    """
+
+    def __init__(self, bufsize: int = 65536, connect=None) -> None:
+        """
+        Initializes a new instance of the Telnet class.
+
+        Args:
+            bufsize (int, optional): Size of the receive buffer. Defaults to 65536.
+            connect (callable, optional): Opens the socket, called with ((host, port), timeout) like
+                socket.create_connection (e.g. WireRecorder or WireReplay). Defaults to socket.create_connection.
+        """
+        self.sock = None
+        self.__connect = connect if connect is not None else socket.create_connection
+        self.eof = False
+        self.__option_callback = None
+        self.__rawbuf = bytearray(bufsize)
+        self.__rawview = memoryview(self.__rawbuf)
+        self.__parser = TelnetParser(self.__process_option)
+        self.__start = 0
+        self.__selector = None
+        # A thread waiting in __fill() releases the socket when close() is called meanwhile
+        self.__lock = threading.Lock()
+        self.__waiting = False
+
+    def set_option_negotiation_callback(self, callback) -> None:
+        """
+        Sets the callback for telnet options.
+
+        Args:
+            callback (callable): Called with (sock, cmd, opt) for every telnet command.
+        """
+        self.__option_callback = callback
+
+    def __process_option(self, cmd: bytes, opt: bytes) -> None:
+        if self.__option_callback is not None:
+            self.__option_callback(self.sock, cmd, opt)
+        elif cmd in (DO, DONT):
+            self.sock.sendall(IAC + WONT + opt)
+        elif cmd in (WILL, WONT):
+            self.sock.sendall(IAC + DONT + opt)
+
+    def open(self, host: str, port: int = 23, timeout: float = None) -> None:
+        """
+        Connects to the host.
+
+        Args:
+            host (str): Host name or IP address.
+            port (int, optional): Port number. Defaults to 23.
+            timeout (float, optional): Connection timeout in seconds. Defaults to None.
+        """
+        self.eof = False
+        self.__parser.reset()
+        self.__start = 0
+        self.sock = self.__connect((host, port), timeout)
+        self.__selector = selectors.DefaultSelector()
+        self.__selector.register(self.sock, selectors.EVENT_READ)
+
+    def close(self) -> None:
+        """
+        Closes the connection.
+
+        The socket is shut down first, which wakes up a thread blocked in a read. The
+        socket is then released by that thread, closing it under the waiting select
+        would lose the wakeup.
+        """
+        with self.__lock:
+            self.eof = True
+            if self.sock is not None:
+                try:
+                    self.sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            if not self.__waiting:
+                self.__release()
+
+    def __release(self) -> None:
+        if self.__selector is not None:
+            self.__selector.close()
+            self.__selector = None
+        if self.sock is not None:
+            sock = self.sock
+            self.sock = None
+            sock.close()
+
+    def write(self, data: bytes) -> int:
+        """
+        Writes the data to the connection, doubling IAC bytes.
+
+        Args:
+            data (bytes): The data to write.
+
+        Returns:
+            int: The number of bytes written.
+        """
+        if IAC in data:
+            data = data.replace(IAC, IAC + IAC)
+        sock = self.sock
+        if sock is None:
+            raise ConnectionError('Connection closed')
+        sock.sendall(data)
+        return len(data)
+
+    def __fill(self, timeout: float = None) -> bool:
+        """
+        Receives the next chunk of data into the cooked buffer.
+
+        Args:
+            timeout (float, optional): Time to wait for data in seconds, None to wait forever.
+
+        Returns:
+            bool: False if nothing arrived before the timeout or the connection is closed.
+        """
+        with self.__lock:
+            if self.eof:
+                return False
+            self.__waiting = True
+        try:
+            if timeout is not None and not self.__selector.select(max(timeout, 0)):
+                return False
+            cooked = self.__parser.cooked
+            # Compact the consumed part before it grows
+            if self.__start and self.__start >= len(cooked) // 2:
+                del cooked[:self.__start]
+                self.__start = 0
+            n = self.sock.recv_into(self.__rawview)
+        except OSError:
+            # Shut down by close() in another thread
+            if self.eof:
+                return False
+            raise
+        finally:
+            with self.__lock:
+                self.__waiting = False
+                if self.eof:
+                    self.__release()
+        if n == 0:
+            self.eof = True
+            return False
+        self.__parser.feed(self.__rawbuf, n)
+        return True
+
+    def __take(self, end: int) -> bytes:
+        """
+        Returns the cooked data up to end and marks it consumed.
+        """
+        cooked = self.__parser.cooked
+        data = bytes(memoryview(cooked)[self.__start:end])
+        if end >= len(cooked):
+            cooked.clear()
+            self.__start = 0
+        else:
+            self.__start = end
+        return data
+
+    def __take_all(self) -> bytes:
+        cooked = self.__parser.cooked
+        if self.eof and self.__start >= len(cooked):
+            raise EOFError('telnet connection closed')
+        return self.__take(len(cooked))
+
+    def read_until(self, match: bytes, timeout: float = None) -> bytes:
+        """
+        Reads until the match is found or until the timeout.
+
+        Args:
+            match (bytes): The match to search for.
+            timeout (float, optional): The timeout in seconds. Defaults to None.
+
+        Returns:
+            bytes: The data read including the match, or the data available at the timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        pos = self.__start
+        while True:
+            cooked = self.__parser.cooked
+            idx = cooked.find(match, pos)
+            if idx >= 0:
+                return self.__take(idx + len(match))
+            # Only the tail which may hold a partial match is scanned again
+            pos = max(self.__start, len(cooked) - len(match) + 1)
+            start = self.__start
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if not self.__fill(remaining):
+                break
+            pos -= start - self.__start
+        return self.__take_all()
+
+    def expect(self, matcher, timeout: float = None) -> tuple:
+        """
+        Reads until one of the terminators is found.
+
+        Only the newly received data and the tail which may hold a partial
+        terminator are scanned after each receive.
+
+        Args:
+            matcher (TerminatorMatcher or list): The terminators to search for.
+            timeout (float, optional): The timeout in seconds. Defaults to None.
+
+        Returns:
+            tuple: Index of the terminator (-1 on timeout), the terminator and the data read.
+        """
+        if not isinstance(matcher, TerminatorMatcher):
+            matcher = TerminatorMatcher(matcher)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        pos = self.__start
+        while True:
+            cooked = self.__parser.cooked
+            found = matcher.search(cooked, pos)
+            if found is not None:
+                index, _, end = found
+                return index, matcher.terminators[index], self.__take(end)
+            pos = matcher.resume(len(cooked), self.__start)
+            start = self.__start
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if not self.__fill(remaining):
+                break
+            pos -= start - self.__start
+        return -1, None, self.__take_all()
+
+    def read_eager(self) -> bytes:
+        """
+        Reads all the data which is available without blocking.
+
+        Returns:
+            bytes: The data read.
+        """
+        cooked = self.__parser.cooked
+        while self.__start >= len(cooked) and not self.eof and self.__fill(0):
+            cooked = self.__parser.cooked
+        return self.__take_all()
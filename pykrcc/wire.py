@@ -0,0 +1,242 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import socket
+import struct
+import threading
+import time
+
+# Directions of the captured records
+SENT = 0
+RECEIVED = 1
+CONNECT = 2
+
+_MAGIC = b'PYKRCC-WIRE1\n'
+# Time since the start of the capture in seconds, direction and length of the data
+_RECORD = struct.Struct('<dBI')
+
+
+def read_capture(fname: str) -> list:
+    """
+    Reads a capture written by WireRecorder.
+
+    Args:
+        fname (str): Name of the capture file.
+
+    Returns:
+        list: Records as (time, direction, data) tuples.
+
+    Raises:
+        ValueError: If the file is not a capture.
+    """
+    with open(fname, 'rb') as f:
+        data = f.read()
+    if not data.startswith(_MAGIC):
+        raise ValueError('Not a wire capture')
+    records = []
+    pos = len(_MAGIC)
+    while pos + _RECORD.size <= len(data):
+        t, direction, length = _RECORD.unpack_from(data, pos)
+        pos += _RECORD.size
+        records.append((t, direction, data[pos:pos + length]))
+        pos += length
+    return records
+
+
+class _RecordingSocket:
+    """
+    Socket which passes the sent and received bytes to the recorder.
+    """
+
+    def __init__(self, sock: socket.socket, recorder) -> None:
+        self.__sock = sock
+        self.__recorder = recorder
+
+    def __getattr__(self, name: str):
+        return getattr(self.__sock, name)
+
+    def sendall(self, data: bytes) -> None:
+        self.__sock.sendall(data)
+        self.__recorder.record(SENT, data)
+
+    def recv_into(self, buffer, nbytes: int = 0) -> int:
+        n = self.__sock.recv_into(buffer, nbytes)
+        self.__recorder.record(RECEIVED, bytes(buffer[:n]))
+        return n
+
+
+class WireRecorder:
+    """
+    Captures the exact bytes of the sessions in both directions with timestamps.
+
+    Pass the recorder as the transport of a pykrcc session. The capture keeps the
+    telnet negotiation and the save/load framing, so it can be played back by
+    WireReplay.
+    """
+
+    def __init__(self, fname: str) -> None:
+        """
+        Initializes a new instance of the WireRecorder class.
+
+        Args:
+            fname (str): Name of the capture file, it is overwritten.
+        """
+        self.fname = fname
+        self.__file = open(fname, 'wb')
+        self.__file.write(_MAGIC)
+        self.__lock = threading.Lock()
+        self.__start = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __call__(self, address: tuple, timeout: float = None) -> _RecordingSocket:
+        sock = socket.create_connection(address, timeout)
+        self.record(CONNECT, f'{address[0]}:{address[1]}'.encode())
+        return _RecordingSocket(sock, self)
+
+    def record(self, direction: int, data: bytes) -> None:
+        with self.__lock:
+            if self.__file.closed:
+                return
+            self.__file.write(_RECORD.pack(time.monotonic() - self.__start, direction, len(data)))
+            self.__file.write(data)
+
+    def close(self) -> None:
+        with self.__lock:
+            self.__file.close()
+
+
+class _ReplaySocket:
+    """
+    Client end of the replay, options of the TCP socket are ignored.
+    """
+
+    def __init__(self, sock: socket.socket) -> None:
+        self.__sock = sock
+
+    def __getattr__(self, name: str):
+        return getattr(self.__sock, name)
+
+    def setsockopt(self, *args) -> None:
+        pass
+
+
+class WireReplay:
+    """
+    Plays a capture back to a pykrcc session instead of a controller.
+
+    Pass the replay as the transport of the session. Every connect plays the next
+    connection of the capture. The received data is sent only after the client
+    sent everything it sent before that data in the capture, so the replay follows
+    the protocol deterministically. With speed the gaps of the capture are kept
+    (scaled), without it the data is sent as soon as possible.
+    """
+
+    def __init__(self, fname: str, speed: float = None, timeout: float = 10.0) -> None:
+        """
+        Initializes a new instance of the WireReplay class.
+
+        Args:
+            fname (str): Name of the capture file.
+            speed (float, optional): Playback speed, 1.0 for the recorded speed. Defaults to None (full speed).
+            timeout (float, optional): Time to wait for the data of the client in seconds. Defaults to 10.0.
+        """
+        self.speed = speed
+        self.timeout = timeout
+        self.sessions = []
+        for record in read_capture(fname):
+            if record[1] == CONNECT or not self.sessions:
+                self.sessions.append([])
+            if record[1] != CONNECT:
+                self.sessions[-1].append(record)
+        # Bytes sent by the client in every played connection
+        self.sent = []
+        self.__next = 0
+        self.__threads = []
+
+    def __call__(self, address: tuple, timeout: float = None) -> _ReplaySocket:
+        if self.__next >= len(self.sessions):
+            raise ConnectionRefusedError('No more connections in the capture')
+        records = self.sessions[self.__next]
+        self.__next += 1
+        client, peer = socket.socketpair()
+        sent = bytearray()
+        self.sent.append(sent)
+        thread = threading.Thread(target=self.__play, args=(peer, records, sent), name='pykrcc-replay', daemon=True)
+        thread.start()
+        self.__threads.append(thread)
+        return _ReplaySocket(client)
+
+    def __play(self, peer: socket.socket, records: list, sent: bytearray) -> None:
+        peer.settimeout(self.timeout)
+        expected = 0
+        t_prev = records[0][0] if records else 0.0
+        real_prev = time.monotonic()
+        try:
+            for t, direction, data in records:
+                if direction == SENT:
+                    expected += len(data)
+                    while len(sent) < expected:
+                        chunk = peer.recv(65536)
+                        if not chunk:
+                            return
+                        sent += chunk
+                    t_prev, real_prev = t, time.monotonic()
+                    continue
+                if self.speed:
+                    delay = real_prev + (t - t_prev) / self.speed - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                peer.sendall(data)
+                t_prev, real_prev = t, time.monotonic()
+            # Take the rest of the client data until it disconnects
+            while True:
+                chunk = peer.recv(65536)
+                if not chunk:
+                    return
+                sent += chunk
+        except socket.timeout:
+            logger.warning('Replay stopped, the client did not send the captured data')
+        except OSError:
+            pass
+        finally:
+            peer.close()
+
+    def expected(self, index: int = 0) -> bytes:
+        """
+        Returns the bytes the client sent in the captured connection.
+
+        Args:
+            index (int, optional): Index of the connection. Defaults to 0.
+        """
+        return b''.join(data for _, direction, data in self.sessions[index] if direction == SENT)
+
+    def mismatch(self, index: int = 0) -> int:
+        """
+        Compares the data sent by the client with the capture.
+
+        Args:
+            index (int, optional): Index of the connection. Defaults to 0.
+
+        Returns:
+            int: Offset of the first differing byte, -1 if the data match.
+        """
+        expected = self.expected(index)
+        sent = bytes(self.sent[index])
+        for i, (a, b) in enumerate(zip(expected, sent)):
+            if a != b:
+                return i
+        if len(expected) != len(sent):
+            return min(len(expected), len(sent))
+        return -1
+
+    def join(self, timeout: float = None) -> None:
+        """
+        Waits until the played connections are finished.
+        """
+        for thread in self.__threads:
+            thread.join(timeout)
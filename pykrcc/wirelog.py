@@ -0,0 +1,98 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import queue
+import threading
+import time
+
+from .frames import FRAME_MARKER
+
+# Marker which stops the writer thread
+_STOP = object()
+
+
+class WireLogger:
+    """
+    Writes the traffic of a session to a log file in a background thread.
+
+    The session only puts the raw chunks into a bounded queue. Decoding, stripping
+    of the save/load framing and the file writes are done by the writer thread in
+    batches, with one flush per batch.
+    """
+
+    def __init__(self, fname: str, queue_size: int = 4096, batch_size: int = 256, flush_interval: float = 0.5) -> None:
+        """
+        Initializes a new instance of the WireLogger class and starts the writer thread.
+
+        Args:
+            fname (str): Name of the log file, the data is appended.
+            queue_size (int, optional): Maximum number of queued chunks, write() blocks when the queue is full. Defaults to 4096.
+            batch_size (int, optional): Maximum number of chunks written at once. Defaults to 256.
+            flush_interval (float, optional): Maximum time in seconds the written data stays unflushed. Defaults to 0.5.
+
+        Raises:
+            OSError: If the log file could not be opened.
+        """
+        self.fname = fname
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.__file = open(fname, 'a')
+        self.__queue = queue.Queue(queue_size)
+        self.__thread = threading.Thread(target=self.__run, name='pykrcc-wirelog', daemon=True)
+        self.__thread.start()
+
+    def write(self, data) -> None:
+        """
+        Queues the data for the log file.
+
+        Args:
+            data (bytes or bytearray or str): Raw data sent to or received from the robot.
+        """
+        if type(data) is bytearray:
+            data = bytes(data)
+        self.__queue.put(data)
+
+    def __format(self, batch: list) -> str:
+        data = b''.join(d if type(d) is bytes else d.encode() for d in batch)
+        data = FRAME_MARKER.sub(b'', data)
+        return data.decode(errors='replace').replace('\r\n', '\n')
+
+    def __run(self) -> None:
+        last_flush = time.monotonic()
+        while True:
+            batch = [self.__queue.get()]
+            while len(batch) < self.batch_size and batch[-1] is not _STOP:
+                try:
+                    batch.append(self.__queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = batch[-1] is _STOP
+            if stop:
+                batch.pop()
+            if batch:
+                try:
+                    self.__file.write(self.__format(batch))
+                except Exception as e:
+                    logger.error(f'Failed to write log file: {e}')
+            # Flush when the session went idle, or at least every flush_interval under load
+            now = time.monotonic()
+            if stop or self.__queue.empty() or now - last_flush >= self.flush_interval:
+                self.__flush()
+                last_flush = now
+            if stop:
+                return
+
+    def __flush(self) -> None:
+        try:
+            self.__file.flush()
+        except Exception as e:
+            logger.error(f'Failed to flush log file: {e}')
+
+    def close(self) -> None:
+        """
+        Writes the queued data and closes the log file.
+        """
+        if self.__thread.is_alive():
+            self.__queue.put(_STOP)
+            self.__thread.join()
+        self.__file.close()
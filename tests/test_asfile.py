@@ -0,0 +1,81 @@
+import pytest
+
+from pykrcc.asfile import ASIndex, join_units, parse_units, unit_hash
+from pykrcc.pykrcc import pykrcc
+from pykrcc.simulator import ControllerSimulator
+
+SOURCE = ('.** backup\n'
+          '.PROGRAM main()\n  CALL pick\n.END\n'
+          '.PROGRAM pick()\n  JMOVE #a\n  LMOVE b\n.END\n'
+          '.TRANS\na 0 0 0 0 0 0\nb 1 2 3 4 5 6\n.END\n'
+          '.REALS\nspeed = 10\n.END\n'
+          '.AUXDATA\nZ 1\n.END\n')
+
+
+@pytest.fixture
+def fname(tmp_path):
+    fname = tmp_path / 'cell.as'
+    fname.write_bytes(SOURCE.replace('\n', '\r\n').encode())
+    return str(fname)
+
+
+def test_parse_units():
+    units = parse_units(SOURCE)
+    assert [u.key for u in units] == ['main', 'pick', '.TRANS a', '.TRANS b', '.REALS speed', '.AUXDATA']
+    assert units[1].text == '.PROGRAM pick()\n  JMOVE #a\n  LMOVE b\n.END\n'
+    # Variables are joined after the other units
+    assert sorted(parse_units(join_units(units)), key=lambda u: u.key) == sorted(units, key=lambda u: u.key)
+
+
+def test_unit_hash_ignores_whitespace():
+    assert unit_hash('.PROGRAM a()\n  HOME\n.END\n') == unit_hash('.PROGRAM a()\r\n\r\n    HOME  \r\n.END')
+    assert unit_hash('.PROGRAM a()\n  HOME\n') != unit_hash('.PROGRAM a()\n  HOME 2\n')
+
+
+def test_index_matches_the_parser(fname):
+    with ASIndex(fname) as index:
+        assert index.keys() == [u.key for u in parse_units(SOURCE)]
+        assert index.programs() == ['main', 'pick']
+        for unit in parse_units(SOURCE):
+            assert index.text(unit.key) == unit.text
+            assert index.digest(unit.key) == unit.digest()
+        assert bytes(index.view('.REALS speed')) == b'speed = 10\r\n'
+        assert index['pick'].size == len('.PROGRAM pick()\r\n  JMOVE #a\r\n  LMOVE b\r\n.END\r\n')
+
+
+def test_diff(fname, tmp_path):
+    other = tmp_path / 'other.as'
+    other.write_text(SOURCE.replace('LMOVE b', 'LMOVE c').replace('.REALS\nspeed = 10\n', '.REALS\nspeed = 10\nacc = 1\n'))
+    with ASIndex(fname) as index, ASIndex(str(other)) as changed:
+        assert index.diff(changed) == ([], ['.REALS acc'], ['pick'])
+
+
+def test_blocks_group_variables_under_their_sections(fname):
+    with ASIndex(fname) as index:
+        entries = index.select(['.TRANS b', 'pick', '.REALS speed'])
+        assert [e.key for e in entries] == ['pick', '.TRANS b', '.REALS speed']
+        blocks = list(index.iter_blocks(entries, 32))
+    assert all(len(block) + 2 < 32 for block in blocks)
+    assert b''.join(blocks) == (b'.PROGRAM pick()\n  JMOVE #a\n  LMOVE b\n.END\n'
+                                b'.TRANS\nb 1 2 3 4 5 6\n.END\n.REALS\nspeed = 10\n.END\n')
+    with ASIndex(fname) as index, pytest.raises(KeyError):
+        index.select(['missing'])
+
+
+def test_empty_file(tmp_path):
+    fname = tmp_path / 'empty.as'
+    fname.write_bytes(b'')
+    with ASIndex(str(fname)) as index:
+        assert index.entries == []
+
+
+def test_load_selected_programs(fname):
+    with ControllerSimulator() as sim:
+        session = pykrcc(ip=sim.host, port=sim.port)
+        session.progress = lambda val, total: None
+        try:
+            assert session.load(fname, sections=['pick']) == 0
+            assert list(sim.programs) == ['pick']
+            assert session.load(fname, sections=['missing']) == -4
+        finally:
+            session.disconnect()
@@ -0,0 +1,70 @@
+import itertools
+
+import pytest
+
+from pykrcc import simulator
+from pykrcc.backup import BackupEngine, BackupStore, iter_chunks
+from pykrcc.fleet import ConnectionSpec
+from pykrcc.simulator import ControllerSimulator
+
+COMMON = '.PROGRAM common()\n' + ''.join(f'  POINT a{i} = b{i}\n' for i in range(20)) + '.END\n'
+
+
+@pytest.fixture
+def sims():
+    with ControllerSimulator() as first, ControllerSimulator() as second:
+        first.store(COMMON + '.PROGRAM first()\n  HOME\n.END\n')
+        second.store(COMMON + '.PROGRAM second()\n  HOME 2\n.END\n')
+        yield [first, second]
+
+
+def test_iter_chunks():
+    lines = ['.** header', '.PROGRAM a()', '  HOME', '.END', '.REALS', 'x = 1', '.END', 'tail']
+    chunks = list(iter_chunks(lines))
+    assert [name for name, _ in chunks] == ['', '.PROGRAM a()', '.REALS', '']
+    assert ''.join(text for _, text in chunks) == '\n'.join(lines) + '\n'
+
+
+def test_store_round_trip(tmp_path):
+    store = BackupStore(str(tmp_path))
+    digest, created = store.put(b'data')
+    assert created
+    assert store.put(b'data') == (digest, False)
+    assert store.get(digest) == b'data'
+    with pytest.raises(FileNotFoundError):
+        store.read_manifest('10.0.0.1:23')
+
+
+def test_backup_deduplicates_chunks(sims, tmp_path):
+    store = BackupStore(str(tmp_path / 'store'))
+    engine = BackupEngine(store, [ConnectionSpec(sim.host, sim.port) for sim in sims])
+    report = engine.run('r1')
+    assert [r.code for r in report.results] == [0, 0]
+    manifests = [store.read_manifest(spec.name) for spec in engine.fleet.specs]
+    # The shared program is stored once
+    assert sum(m['new_chunks'] for m in manifests) == 3
+
+    robot = engine.fleet.specs[0].name
+    restored = store.restore(robot, str(tmp_path / 'restored.as'))
+    with open(restored) as f:
+        assert f.read() == sims[0].dump().replace('\r\n', '\n')
+
+    sims[0].store('.PROGRAM first()\n  HOME 3\n.END\n')
+    engine.run('r2')
+    assert store.runs(robot) == ['r1', 'r2']
+    assert store.read_manifest(robot)['new_chunks'] == 1
+
+
+def test_incomplete_save_writes_no_manifest(tmp_path, monkeypatch):
+    with ControllerSimulator(frame_size=64, stall_time=2) as sim:
+        sim.store(COMMON)
+        store = BackupStore(str(tmp_path))
+        engine = BackupEngine(store, [ConnectionSpec(sim.host, sim.port, timeout=1)])
+        # Login, the echo, the header and two data frames arrive, then the controller stalls
+        counter = itertools.count()
+        monkeypatch.setattr(simulator.random, 'random', lambda: 1.0 if next(counter) < 6 else 0.0)
+        sim.error_mode = 'stall'
+        sim.error_rate = 0.5
+        report = engine.run('r1')
+    assert report.results[0].code == -1
+    assert store.runs(engine.fleet.specs[0].name) == []
@@ -0,0 +1,59 @@
+import pytest
+
+from pykrcc.pykrcc import pykrcc, PIPELINE_COMMANDS
+from pykrcc.simulator import ControllerSimulator
+
+LISTING = '\r\n'.join(f'line {i}' for i in range(12))
+
+
+@pytest.fixture
+def sim():
+    with ControllerSimulator(page_lines=5) as sim:
+        sim.responses['list'] = LISTING
+        sim.responses['status'] = 'RUNNING'
+        sim.variables.update({'a': 1.5, 'b': 2.0})
+        yield sim
+
+
+@pytest.fixture
+def session(sim):
+    session = pykrcc(ip=sim.host, port=sim.port)
+    assert session.IsConnected
+    yield session
+    session.disconnect()
+
+
+def test_pipelined_commands(sim, session):
+    results = session.command_batch(['type a', 'type b', None, 'id'])
+    assert [code for code, _ in results] == [0, 0, 0, 0]
+    assert results[0][1].split('\r\n')[1] == '1.5'
+    assert results[1][1].split('\r\n')[1] == '2'
+    assert 'Version 0.1' in results[3][1]
+    assert sim.commands[-4:] == ['type a', 'type b', '', 'id']
+
+
+def test_nothing_is_queued_behind_paged_output(sim, session):
+    results = session.command_batch(['list', 'status', '', 'type a'])
+    assert [code for code, _ in results] == [0, 0, 0, 0]
+    assert 'line 11' in results[0][1]
+    assert 'RUNNING' in results[1][1]
+    assert sim.commands[-4:] == ['list', 'status', '', 'type a']
+
+
+def test_nothing_is_queued_behind_confirmation(sim, session):
+    sim.confirm_commands.add('reset')
+    results = session.command_batch(['reset', 'id'])
+    assert [code for code, _ in results] == [0, 0]
+    assert results[0][1].endswith('1\r\n\r\n>')
+    assert sim.commands[-2:] == ['reset', 'id']
+
+
+def test_fallback_sends_the_lost_commands_again(sim, session):
+    # Queuing behind 'list' lets its pager take the bytes of the next command
+    results = session.command_batch(['list', 'status', '', 'type a'], pipelined=PIPELINE_COMMANDS | {'list'})
+    assert results[0][0] == -3
+    assert results[1][0] == 0 and 'RUNNING' in results[1][1]
+    assert results[2][0] == 0
+    assert results[3][0] == 0 and results[3][1].split('\r\n')[1] == '1.5'
+    assert sim.commands.count('status') == 1
+    assert sim.commands.count('type a') == 1
@@ -0,0 +1,88 @@
+import time
+
+import pytest
+
+from pykrcc.cache import ResponseCache, normalize
+from pykrcc.pykrcc import pykrcc
+from pykrcc.simulator import ControllerSimulator
+
+
+@pytest.fixture
+def sim():
+    with ControllerSimulator() as sim:
+        sim.variables.update({'a': 1.5, 'b': 2.0})
+        yield sim
+
+
+@pytest.fixture
+def session(sim):
+    session = pykrcc(ip=sim.host, port=sim.port, cache=ResponseCache())
+    assert session.IsConnected
+    yield session
+    session.disconnect()
+
+
+def test_normalize():
+    assert normalize('  ID ') == 'id'
+    assert normalize('list   /p  a') == 'list /p a'
+
+
+def test_ttl():
+    cache = ResponseCache({'id': 10, 'type': 0})
+    assert cache.ttl('ID') == 10
+    assert cache.ttl('type a') == 0
+    assert cache.ttl('') == 0
+    assert cache.ttl('zpow on') is None
+
+
+def test_expiry_and_read_only_commands():
+    cache = ResponseCache({'id': 0.05, 'type': 0})
+    assert cache.put('id', 'response')
+    assert not cache.put('type a', '1.5')
+    assert not cache.put('kill', '')
+    assert cache.get('ID') == 'response'
+    time.sleep(0.06)
+    assert cache.get('id') is None
+    assert len(cache) == 0
+    assert (cache.Hits, cache.Misses) == (1, 1)
+
+
+def test_lru_eviction():
+    cache = ResponseCache({'list': 10}, max_entries=2)
+    cache.put('list a', 'a')
+    cache.put('list b', 'b')
+    cache.get('list a')
+    cache.put('list c', 'c')
+    assert cache.get('list b') is None
+    assert cache.get('list a') == 'a'
+    assert cache.get('list c') == 'c'
+
+
+def test_session_answers_from_the_cache(sim, session):
+    first = session.command('id')
+    assert session.command('ID ') == first
+    assert sim.commands.count('id') == 1
+    assert session.metrics.snapshot()['counters']['command_cache_hits_total'] == 1
+
+
+def test_type_keeps_the_cache(sim, session):
+    session.command('id')
+    code, values = session.read_many(['a', 'b'])
+    assert code == 0 and values == {'a': 1.5, 'b': 2.0}
+    assert session.command('type a')[0] == 0
+    assert session.command('')[0] == 0
+    assert len(session.cache) == 1
+    sim.variables['a'] = 3.0
+    assert session.read_many(['a'])[1] == {'a': 3.0}
+
+
+def test_other_commands_and_load_clear_the_cache(sim, session):
+    session.progress = lambda val, total: None
+    session.command('id')
+    session.command('here p1')
+    assert len(session.cache) == 0
+    session.command('id')
+    assert session.load('.PROGRAM a()\n.END\n') == 0
+    assert len(session.cache) == 0
+    session.command('id')
+    assert sim.commands.count('id') == 3
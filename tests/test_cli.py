@@ -0,0 +1,66 @@
+import io
+import json
+import socket
+import sys
+
+import pytest
+
+from pykrcc import cli
+from pykrcc.cli import Step, parse_host, parse_step
+from pykrcc.simulator import ControllerSimulator
+
+
+@pytest.fixture
+def sim():
+    with ControllerSimulator() as sim:
+        yield sim
+
+
+def _records(capsys) -> list:
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+
+def test_parse_step():
+    assert parse_step('  # comment') is None
+    assert parse_step('status') == Step('command', 'status')
+    assert parse_step('SAVE/R backup_{ip}.as main') == Step('save', 'backup_{ip}.as', '/R', 'main')
+    assert parse_step('load a.as') == Step('load', 'a.as')
+    with pytest.raises(ValueError):
+        parse_step('load')
+
+
+def test_parse_host():
+    assert (parse_host('10.0.0.1').ip, parse_host('10.0.0.1').port) == ('10.0.0.1', 23)
+    assert parse_host('10.0.0.1:9105', login='khidl').port == 9105
+
+
+def test_run_steps(sim, capsys):
+    assert cli.main(['-H', f'{sim.host}:{sim.port}', '-e', 'id', '-e', 'status']) == cli.EXIT_OK
+    records = _records(capsys)
+    assert [r['arg'] for r in records[:2]] == ['id', 'status']
+    assert 'Version 0.1' in records[0]['response']
+    assert records[2]['summary'] and records[2]['code'] == 0
+
+
+def test_script_from_stdin_leaves_stdin_open(sim, capsys, monkeypatch):
+    stdin = io.StringIO('# script\nid\n')
+    monkeypatch.setattr(sys, 'stdin', stdin)
+    assert cli.main(['-H', f'{sim.host}:{sim.port}', '--script', '-']) == cli.EXIT_OK
+    assert not stdin.closed
+    assert _records(capsys)[0]['arg'] == 'id'
+
+
+@pytest.mark.parametrize('argv', [['--hosts', '-', '--script', '-'], ['-e', 'id'], ['-H', '127.0.0.1']])
+def test_usage_errors(argv, monkeypatch):
+    monkeypatch.setattr(sys, 'stdin', io.StringIO(''))
+    with pytest.raises(SystemExit) as e:
+        cli.main(argv)
+    assert e.value.code == cli.EXIT_USAGE
+
+
+def test_unreachable_host(capsys):
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    assert cli.main(['-H', f'127.0.0.1:{port}', '--timeout', '1', '-e', 'id']) == cli.EXIT_UNREACHABLE
+    assert _records(capsys)[-1]['code'] == -2
@@ -0,0 +1,62 @@
+import socket
+import threading
+
+import pytest
+
+from pykrcc.fleet import ConnectionSpec, Fleet
+from pykrcc.simulator import ControllerSimulator
+
+
+@pytest.fixture
+def sims():
+    with ControllerSimulator() as first, ControllerSimulator() as second:
+        yield [first, second]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def test_command_on_every_controller(sims):
+    fleet = Fleet([ConnectionSpec(sim.host, sim.port) for sim in sims])
+    report = fleet.command('id')
+    assert [r.name for r in report.results] == [f'{sim.host}:{sim.port}' for sim in sims]
+    assert len(report.ok) == 2
+    assert all('Version 0.1' in r.response for r in report.results)
+    assert all(sim.commands.count('id') == 1 for sim in sims)
+
+
+def test_first_connection_is_not_a_reconnect(sims):
+    counters = []
+
+    def operation(session, spec):
+        counters.append(session.metrics.snapshot()['counters'])
+        return session.command('id')
+
+    report = Fleet([ConnectionSpec(sim.host, sim.port) for sim in sims]).run(operation)
+    assert len(report.ok) == 2
+    assert all(c.get('reconnects_total', 0) == 0 for c in counters)
+
+
+def test_unreachable_controller(sims):
+    fleet = Fleet([{'ip': sims[0].host, 'port': sims[0].port}, {'ip': '127.0.0.1', 'port': _free_port(), 'timeout': 1}])
+    report = fleet.command('id')
+    assert report.results[0].code == 0
+    assert report.results[1].code == -2
+    assert report.failed == [report.results[1]]
+
+
+def test_stalled_controller_is_cut_by_the_timeout(sims):
+    release = threading.Event()
+    sims[1].responses['status'] = lambda line: release.wait(5) and 'RUNNING'
+    fleet = Fleet([ConnectionSpec(sim.host, sim.port) for sim in sims], timeout=0.5)
+    try:
+        report = fleet.command('status')
+    finally:
+        release.set()
+    assert report.results[0].code == 0
+    assert report.results[1].code == -1
+    assert report.results[1].error == 'Operation timeout'
+    assert report.elapsed < 3
@@ -0,0 +1,90 @@
+from pykrcc.frames import SaveParser, SourceReader, iter_blocks, load_frame, record, LOAD_EOF
+
+
+def test_records():
+    assert record(b'B') == b'\x02B    0\x17'
+    assert LOAD_EOF == b'\x02C    0\x1a\x17'
+    assert load_frame(b'.END\n') == b'\x02C    0.END\n\r\n\x17'
+
+
+def test_save_parser_strips_framing():
+    skipped = []
+    parser = SaveParser(skipped.append)
+    lines = parser.feed(b'\x05\x02Bfile.as\r\n\x17\x05\x02D.PROGRAM a()\r\n  HOME\r\n.END\r\n\x17')
+    lines += parser.feed(b'\x05\x02E\x17')
+    lines += parser.close()
+    assert lines == [b'.PROGRAM a()', b'  HOME', b'.END']
+
+
+def test_save_parser_line_split_across_frames():
+    parser = SaveParser()
+    lines = parser.feed(b'\x05\x02D.PROGRAM a()\r\n  JMO')
+    assert lines == [b'.PROGRAM a()']
+    lines = parser.feed(b'\x17\x05\x02DVE #a\r\n.END\r\n\x17')
+    assert lines == [b'  JMOVE #a', b'.END']
+    assert parser.close() == []
+
+
+def test_save_parser_reports_service_lines():
+    skipped = []
+    parser = SaveParser(skipped.append)
+    parser.feed(b'\x05\x02D.END\r\n\r\n=== 2 errors\r\n\x17')
+    assert skipped == [b'\n', b'=== 2 errors\n']
+
+
+def test_iter_blocks_respects_the_size():
+    lines = [f'  POINT a{i} = b{i}\n' for i in range(100)]
+    blocks = list(iter_blocks(lines, 64))
+    assert ''.join(blocks) == ''.join(lines)
+    assert all(len(block) + 2 < 64 for block in blocks)
+
+
+def test_source_reader_translates_line_breaks(tmp_path):
+    text = '.PROGRAM a()\r\n  HOME\r\n.END\r\n'
+    fname = tmp_path / 'a.as'
+    fname.write_bytes(text.encode())
+    for source in (fname, str(fname), text, text.encode()):
+        reader = SourceReader(source)
+        try:
+            assert ''.join(reader) == '.PROGRAM a()\n  HOME\n.END\n'
+            assert reader.consumed == reader.size == len(text)
+        finally:
+            reader.close()
+
+
+def test_source_reader_progress_matches_the_total(tmp_path):
+    fname = tmp_path / 'a.as'
+    fname.write_bytes(''.join(f'  POINT a{i} = b{i}\r\n' for i in range(200)).encode())
+    reader = SourceReader(fname)
+    try:
+        sizes = [size for size, frame in reader.frames(64)]
+    finally:
+        reader.close()
+    assert len(sizes) > 1
+    assert sum(sizes) == reader.size
+
+
+def test_source_reader_lines():
+    reader = SourceReader([b'.PROGRAM a()', '  HOME\n', '.END'])
+    assert list(reader) == ['.PROGRAM a()\n', '  HOME\n', '.END\n']
+    assert reader.size is None
+
+
+def test_save_parser_ends_on_the_end_record_only():
+    parser = SaveParser()
+    lines = parser.feed(b'\x05\x02D.PROGRAM a()\r\n  HOME\x17')
+    assert not parser.ended
+    lines += parser.feed(b'\x05\x02D\r\n.END\r\n\x17\x05\x02')
+    assert not parser.ended
+    lines += parser.feed(b'E\x17')
+    assert parser.ended
+    lines += parser.close()
+    assert lines == [b'.PROGRAM a()', b'  HOME', b'.END']
+
+
+def test_source_reader_block_sizes():
+    lines = [f'  JMOVE #pa{i}\n' for i in range(9)]
+    assert {len(line) for line in lines} == {13}
+    reader = SourceReader(''.join(lines))
+    blocks = list(reader.blocks(40))
+    assert [size for size, _ in blocks] == [len(block) for _, block in blocks] == [26, 26, 26, 26, 13]
@@ -0,0 +1,68 @@
+import pytest
+
+from pykrcc.frames import SourceReader
+from pykrcc.loadplan import LoadPlan
+from pykrcc.pykrcc import pykrcc
+from pykrcc.simulator import ControllerSimulator
+
+SOURCE = ''.join(f'.PROGRAM p{i}()\n' + ''.join(f'  POINT a{j} = b{j}\n' for j in range(40)) + '.END\n'
+                 for i in range(4))
+
+
+@pytest.fixture
+def fname(tmp_path):
+    fname = tmp_path / 'source.as'
+    fname.write_bytes(SOURCE.replace('\n', '\r\n').encode())
+    return str(fname)
+
+
+def test_plan_matches_the_source_reader(fname):
+    plan = LoadPlan.from_file(fname, 128)
+    reader = SourceReader(fname)
+    try:
+        expected = list(reader.frames(128))
+    finally:
+        reader.close()
+    assert list(zip(plan.sizes, plan.frames)) == expected
+    assert plan.size == len(SOURCE.replace('\n', '\r\n'))
+
+
+def test_cached_plan(fname, tmp_path):
+    cache_dir = tmp_path / 'plans'
+    plan = LoadPlan.from_file(fname, cache_dir=str(cache_dir))
+    cached = list(cache_dir.iterdir())
+    assert [p.name for p in cached] == [plan.digest + '.plan']
+    again = LoadPlan.from_file(fname, cache_dir=str(cache_dir))
+    assert (again.digest, again.sizes, again.frames) == (plan.digest, plan.sizes, plan.frames)
+    assert LoadPlan.from_file(fname, 128, cache_dir=str(cache_dir)).digest != plan.digest
+
+
+def test_truncated_plan(fname, tmp_path):
+    plan_name = str(tmp_path / 'a.plan')
+    LoadPlan.from_file(fname, 128).write(plan_name)
+    with open(plan_name, 'rb+') as f:
+        f.truncate(f.seek(0, 2) - 1)
+    with pytest.raises(ValueError):
+        LoadPlan.read(plan_name)
+
+
+def test_empty_file(tmp_path):
+    fname = tmp_path / 'empty.as'
+    fname.write_bytes(b'')
+    plan = LoadPlan.from_file(str(fname))
+    assert (len(plan), plan.size) == (0, 0)
+
+
+def test_load_plan_into_controllers(fname):
+    plan = LoadPlan.from_file(fname)
+    with ControllerSimulator() as first, ControllerSimulator() as second:
+        for sim in (first, second):
+            session = pykrcc(ip=sim.host, port=sim.port)
+            progress = []
+            session.progress = lambda val, total: progress.append((val, total))
+            try:
+                assert session.load(plan) == 0
+                assert '\n'.join(session.iter_save()) + '\n' == SOURCE
+            finally:
+                session.disconnect()
+            assert progress[-1] == (plan.size, plan.size)
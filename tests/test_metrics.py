@@ -0,0 +1,87 @@
+import json
+
+import pytest
+
+from pykrcc.fleet import ConnectionSpec, Fleet
+from pykrcc.metrics import Histogram, Metrics, export_prometheus
+from pykrcc.pykrcc import pykrcc
+from pykrcc.simulator import ControllerSimulator
+
+
+@pytest.fixture
+def sim():
+    with ControllerSimulator() as sim:
+        yield sim
+
+
+def test_histogram_quantiles():
+    histogram = Histogram((0.1, 1.0))
+    assert histogram.quantile(0.5) is None
+    for value in (0.05, 0.05, 0.5, 2.0):
+        histogram.observe(value)
+    assert histogram.counts == [2, 1, 1]
+    assert histogram.quantile(0.5) == 0.1
+    assert histogram.quantile(0.75) == 1.0
+    assert histogram.quantile(1.0) == float('inf')
+
+
+def test_hooks_and_failing_hook():
+    metrics = Metrics({'controller': 'a'})
+    updates = []
+    metrics.add_hook(lambda name, value, labels: updates.append((name, value, labels['controller'])))
+    metrics.add_hook(lambda name, value, labels: 1 / 0)
+    metrics.inc('commands_total')
+    metrics.observe('command_seconds', 0.01)
+    assert updates == [('commands_total', 1, 'a'), ('command_seconds', 0.01, 'a')]
+    assert metrics.snapshot()['counters'] == {'commands_total': 1}
+
+
+def test_export():
+    metrics = Metrics({'controller': 'a"b'}, buckets=(0.1,))
+    metrics.inc('reconnects_total')
+    metrics.observe('connect_seconds', 0.05)
+    assert json.loads(metrics.to_json())[0]['counters'] == {'reconnects_total': 1}
+    text = export_prometheus([metrics])
+    assert '# TYPE pykrcc_reconnects_total counter' in text
+    assert 'pykrcc_reconnects_total{controller="a\\"b"} 1' in text
+    assert 'pykrcc_connect_seconds_bucket{controller="a\\"b",le="+Inf"} 1' in text
+    assert 'pykrcc_connect_seconds_count{controller="a\\"b"} 1' in text
+
+
+def test_session_counts_commands(sim):
+    session = pykrcc(ip=sim.host, port=sim.port)
+    try:
+        session.command('id')
+        session.command('id')
+        snapshot = session.metrics.snapshot()
+        assert snapshot['counters']['commands_total'] == 2
+        assert snapshot['histograms']['command_seconds']['count'] == 2
+        assert snapshot['histograms']['connect_seconds']['count'] == 1
+    finally:
+        session.disconnect()
+
+
+def test_fleet_job_is_not_a_reconnect(sim):
+    counters = []
+
+    def operation(session, spec):
+        code, response = session.command('id')
+        counters.append(session.metrics.snapshot()['counters'])
+        return code, response
+
+    assert Fleet([ConnectionSpec(sim.host, sim.port)]).run(operation).results[0].code == 0
+    assert counters[0].get('reconnects_total', 0) == 0
+
+
+def test_only_real_reconnects_are_counted(sim):
+    session = pykrcc(ip=sim.host, port=sim.port, lazy=True)
+    try:
+        # The first connection of a lazy session goes through reconnect()
+        assert session.command('id')[0] == 0
+        assert session.metrics.snapshot()['counters'].get('reconnects_total', 0) == 0
+        session.disconnect()
+        assert session.command('id')[0] == 0
+        assert session.reconnect() == 0
+        assert session.metrics.snapshot()['counters']['reconnects_total'] == 2
+    finally:
+        session.disconnect()
@@ -0,0 +1,68 @@
+import itertools
+import time
+
+import pytest
+
+from pykrcc import simulator
+from pykrcc.fleet import ConnectionSpec
+from pykrcc.pool import SessionPool
+from pykrcc.simulator import ControllerSimulator
+
+
+@pytest.fixture
+def sim():
+    with ControllerSimulator() as sim:
+        yield sim
+
+
+def _wait(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def test_acquire_and_release(sim):
+    with SessionPool([ConnectionSpec(sim.host, sim.port)], max_sessions=2, warm=False) as pool:
+        key = pool.keys()[0]
+        with pool.session(key, timeout=5) as first, pool.session(key, timeout=5) as second:
+            assert first is not second
+            assert first.command('id')[0] == 0
+            with pytest.raises(TimeoutError):
+                pool.acquire(key, timeout=0.1)
+        with pool.session(key, timeout=5) as session:
+            assert session in (first, second)
+
+
+def test_stalled_controller_is_reconnected(sim, monkeypatch):
+    pool = SessionPool([ConnectionSpec(sim.host, sim.port)], keepalive=0.1, probe_timeout=0.3, backoff=0.1)
+    try:
+        key = pool.keys()[0]
+        session = pool.acquire(key, timeout=5)
+        pool.release(session)
+        # The reply to the next probe stalls, the following replies are sent at once
+        counter = itertools.count()
+        monkeypatch.setattr(simulator.random, 'random', lambda: 0.0 if next(counter) == 0 else 1.0)
+        sim.error_mode = 'stall'
+        sim.stall_time = 5
+        sim.error_rate = 0.5
+        assert _wait(lambda: pool.Reconnects >= 1)
+        session = pool.acquire(key, timeout=5)
+        try:
+            assert session.command('id')[0] == 0
+            assert session.metrics.snapshot()['counters']['reconnects_total'] == 1
+        finally:
+            pool.release(session)
+    finally:
+        pool.close()
+
+
+def test_close_disconnects_sessions_released_later(sim):
+    pool = SessionPool([ConnectionSpec(sim.host, sim.port)], warm=False)
+    session = pool.acquire(pool.keys()[0], timeout=5)
+    pool.close()
+    assert session.IsConnected
+    pool.release(session)
+    assert not session.IsConnected
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from pykrcc.asynckrcc import AsyncKRCC
+from pykrcc.pykrcc import pykrcc
+from pykrcc.query import ReadPlan
+from pykrcc.simulator import ControllerSimulator
+
+QUERIES = ['a', ('n', 'int'), 'SIG(1,-2)', '#home', ('p', 'trans')]
+
+
+@pytest.fixture
+def sim():
+    with ControllerSimulator() as sim:
+        sim.variables.update({'a': 1.5, 'n': 3.0})
+        sim.signals.update({1: True, 2: False})
+        sim.poses.update({'#home': [0, 10, 20, 30, 40, 50], 'p': [100, 200, 300, 0, 90, 180]})
+        yield sim
+
+
+def _check(values: dict) -> None:
+    assert values['a'] == 1.5
+    assert values['n'] == 3 and isinstance(values['n'], int)
+    assert values['SIG(1,-2)'] is True
+    assert list(values['#home']) == [0, 10, 20, 30, 40, 50]
+    assert list(values['p']) == [100, 200, 300, 0, 90, 180]
+
+
+def test_plan_packs_the_expressions():
+    plan = ReadPlan(QUERIES)
+    assert len(plan.commands) == 1
+    assert plan.counts == [15]
+    plan = ReadPlan([f'var{i}' for i in range(100)], max_line=80)
+    assert len(plan.commands) > 1
+    assert all(len(cmd) <= 80 for cmd in plan.commands)
+    assert sum(plan.counts) == 100
+
+
+def test_unknown_kind():
+    with pytest.raises(ValueError):
+        ReadPlan([('a', 'string')])
+
+
+def test_parse_errors():
+    plan = ReadPlan(['a', 'b'])
+    with pytest.raises(ValueError):
+        plan.parse(['TYPE ...\r\n[1.5]\r\n>'])
+    with pytest.raises(ValueError):
+        plan.parse(['TYPE ...\r\n(P1000) Variable is not defined.\r\n>'])
+
+
+def test_read_many(sim):
+    session = pykrcc(ip=sim.host, port=sim.port)
+    try:
+        plan = ReadPlan(QUERIES)
+        code, values = session.read_many(plan)
+        assert code == 0
+        _check(values)
+        assert sim.commands[-1] == plan.commands[0]
+        code, response = session.read_many(['a', 'undefined'])
+        assert code == -3 and 'not defined' in response
+    finally:
+        session.disconnect()
+
+
+def test_async_read_many(sim):
+    async def run():
+        session = AsyncKRCC(ip=sim.host, port=sim.port)
+        assert await session.connect() == 0
+        try:
+            return await session.read_many(QUERIES)
+        finally:
+            await session.disconnect()
+
+    code, values = asyncio.run(run())
+    assert code == 0
+    _check(values)
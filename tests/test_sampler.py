@@ -0,0 +1,70 @@
+import time
+
+import pytest
+
+from pykrcc.pykrcc import pykrcc
+from pykrcc.sampler import StateSampler
+from pykrcc.simulator import ControllerSimulator
+
+np = pytest.importorskip('numpy')
+
+
+@pytest.fixture
+def sim():
+    with ControllerSimulator() as sim:
+        sim.variables['speed'] = 0.0
+        sim.signals[3] = True
+        sim.poses.update({'here': [1, 2, 3, 4, 5, 6], '#here': [10, 20, 30, 40, 50, 60]})
+        yield sim
+
+
+@pytest.fixture
+def session(sim):
+    session = pykrcc(ip=sim.host, port=sim.port)
+    assert session.IsConnected
+    yield session
+    session.disconnect()
+
+
+def test_sample_values(sim, session):
+    sampler = StateSampler(session, signals=[3, 4], variables=['speed'], joints='#HERE')
+    assert sampler.sample()
+    samples = sampler.snapshot()
+    assert samples.pose.tolist() == [[1, 2, 3, 4, 5, 6]]
+    assert samples.joints.tolist() == [[10, 20, 30, 40, 50, 60]]
+    assert samples.signals.tolist() == [[True, False]]
+    assert samples.values.tolist() == [[0.0]]
+
+
+def test_ring_keeps_the_last_samples_in_order(sim, session):
+    sampler = StateSampler(session, variables=['speed'], pose=None, capacity=4, spare=2)
+    for i in range(11):
+        sim.variables['speed'] = float(i)
+        assert sampler.sample()
+    assert sampler.snapshot().values[:, 0].tolist() == [7, 8, 9, 10]
+    last = sampler.snapshot(2)
+    assert last.values[:, 0].tolist() == [9, 10]
+    assert np.all(np.diff(sampler.snapshot().time) >= 0)
+    # A snapshot stays intact while the next spare samples are written
+    view = sampler.snapshot()
+    for i in range(11, 13):
+        sim.variables['speed'] = float(i)
+        sampler.sample()
+    assert view.values[:, 0].tolist() == [7, 8, 9, 10]
+
+
+def test_failed_read(session):
+    sampler = StateSampler(session, variables=['undefined'], pose=None)
+    assert not sampler.sample()
+    assert (sampler.Count, sampler.Errors) == (0, 1)
+    assert len(sampler.snapshot().time) == 0
+
+
+def test_background_sampling(session):
+    with StateSampler(session, rate=50) as sampler:
+        assert sampler.running
+        deadline = time.monotonic() + 5
+        while sampler.Count < 3 and time.monotonic() < deadline:
+            time.sleep(0.02)
+    assert not sampler.running
+    assert sampler.Count >= 3
@@ -0,0 +1,76 @@
+import threading
+
+import pytest
+
+from pykrcc.pykrcc import pykrcc
+from pykrcc.shared import PRIORITY_BULK, PRIORITY_INTERACTIVE, SharedSession
+from pykrcc.simulator import ControllerSimulator
+
+
+def _blocker(shared: SharedSession) -> threading.Event:
+    """
+    Occupies the worker until the returned event is set.
+    """
+    started = threading.Event()
+    release = threading.Event()
+
+    def operation(session):
+        started.set()
+        release.wait(5)
+
+    shared.submit(operation)
+    assert started.wait(5)
+    return release
+
+
+def test_requests_run_by_priority():
+    order = []
+    with SharedSession(None) as shared:
+        release = _blocker(shared)
+        futures = [shared.submit(lambda s, name=name: order.append(name), priority)
+                   for name, priority in [('bulk', PRIORITY_BULK), ('first', PRIORITY_INTERACTIVE),
+                                          ('second', PRIORITY_INTERACTIVE)]]
+        assert shared.pending() == 3
+        release.set()
+        for future in futures:
+            future.result(5)
+    assert order == ['first', 'second', 'bulk']
+
+
+def test_errors_reach_the_future():
+    with SharedSession(None) as shared:
+        future = shared.submit(lambda session: 1 / 0)
+        with pytest.raises(ZeroDivisionError):
+            future.result(5)
+        assert shared.submit(lambda session: 'still running').result(5) == 'still running'
+
+
+def test_close_cancels_waiting_requests():
+    shared = SharedSession(None)
+    release = _blocker(shared)
+    waiting = shared.submit(lambda session: 'never')
+    threading.Timer(0.1, release.set).start()
+    shared.close(cancel=True)
+    assert waiting.cancelled()
+    with pytest.raises(RuntimeError):
+        shared.submit(lambda session: None)
+
+
+def test_commands_from_many_threads():
+    with ControllerSimulator() as sim:
+        sim.variables['a'] = 1.5
+        session = pykrcc(ip=sim.host, port=sim.port)
+        try:
+            with SharedSession(session) as shared:
+                futures = []
+                threads = [threading.Thread(target=lambda: futures.append(shared.command('id'))) for _ in range(8)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                reads = shared.read_many(['a'])
+                assert all(f.result(5)[0] == 0 and 'Version 0.1' in f.result(5)[1] for f in futures)
+                assert reads.result(5) == (0, {'a': 1.5})
+            assert sim.commands.count('id') == 8
+        finally:
+            session.disconnect()
@@ -0,0 +1,64 @@
+import pytest
+
+from pykrcc.pykrcc import pykrcc
+from pykrcc.simulator import ControllerSimulator
+
+P1 = '.PROGRAM p1()\n  HOME\n.END\n'
+P2 = '.PROGRAM p2()\n  JMOVE #a\n.END\n'
+P2_CHANGED = '.PROGRAM p2()\n  JMOVE #b\n.END\n'
+P3 = '.PROGRAM p3()\n  LMOVE b\n.END\n'
+REALS = '.REALS\nspeed = 10\n.END\n'
+
+
+@pytest.fixture
+def sim():
+    with ControllerSimulator() as sim:
+        sim.store(P1 + P2)
+        yield sim
+
+
+@pytest.fixture
+def session(sim):
+    session = pykrcc(ip=sim.host, port=sim.port)
+    session.progress = lambda val, total: None
+    assert session.IsConnected
+    yield session
+    session.disconnect()
+
+
+def test_only_changed_units_are_loaded(sim, session, tmp_path):
+    fname = tmp_path / 'cell.as'
+    # Indentation and CRLF line breaks don't make a program differ
+    fname.write_bytes((P1.replace('  HOME', '    HOME') + P2_CHANGED + P3 + REALS).replace('\n', '\r\n').encode())
+    cache = str(tmp_path / 'sync.json')
+    code, report = session.sync(str(fname), cache=cache)
+    assert code == 0
+    assert report.unchanged == ['p1']
+    assert report.loaded == ['p2', 'p3', '.REALS speed']
+    assert 0 < report.bytes_loaded < report.bytes_total
+    assert sim.programs['p2'].replace('\r\n', '\n') == P2_CHANGED
+    assert 'p3' in sim.programs
+
+    code, report = session.sync(str(fname), cache=cache)
+    assert code == 0
+    assert report.loaded == []
+    assert report.bytes_avoided == report.bytes_total
+
+
+def test_cache_without_fetch(sim, session, tmp_path):
+    fname = tmp_path / 'cell.as'
+    fname.write_text(P1 + P2)
+    cache = str(tmp_path / 'sync.json')
+    # Without the cache every unit is loaded
+    code, report = session.sync(str(fname), cache=cache, fetch=False)
+    assert (code, report.loaded) == (0, ['p1', 'p2'])
+    saves = len([c for c in sim.commands if c.startswith('save')])
+    code, report = session.sync(str(fname), cache=cache, fetch=False)
+    assert (code, report.loaded, report.unchanged) == (0, [], ['p1', 'p2'])
+    assert len([c for c in sim.commands if c.startswith('save')]) == saves
+
+
+def test_missing_file(session, tmp_path):
+    code, report = session.sync(str(tmp_path / 'missing.as'))
+    assert code == -3
+    assert report.loaded == []
@@ -0,0 +1,111 @@
+import socket
+import threading
+
+from pykrcc.matcher import TerminatorMatcher
+from pykrcc.pykrcc import AS_TERMINATORS, AS_REPLIES, CMD_TERMINATORS
+from pykrcc.telnet import Telnet, TelnetParser, IAC, DO, DONT, WILL, SB, SE, ECHO, TTYPE
+
+
+def test_parser_strips_commands():
+    commands = []
+    parser = TelnetParser(lambda cmd, opt: commands.append((cmd, opt)))
+    parser.feed(b'login:' + IAC + DO + ECHO + b' as' + IAC + WILL + TTYPE + b'\r\n')
+    assert bytes(parser.cooked) == b'login: as\r\n'
+    assert commands == [(DO, ECHO), (WILL, TTYPE)]
+
+
+def test_parser_commands_split_across_feeds():
+    commands = []
+    parser = TelnetParser(lambda cmd, opt: commands.append((cmd, opt)))
+    for chunk in (b'ab' + IAC, DONT, ECHO + b'cd' + IAC, IAC + b'ef'):
+        parser.feed(chunk)
+    assert bytes(parser.cooked) == b'abcd' + IAC + b'ef'
+    assert commands == [(DONT, ECHO)]
+
+
+def test_parser_drops_suboption_data():
+    parser = TelnetParser()
+    parser.feed(b'a' + IAC + SB + TTYPE + b'\x01' + IAC + SE + b'b')
+    assert bytes(parser.cooked) == b'ab'
+
+
+def test_parser_valid_length():
+    parser = TelnetParser()
+    parser.feed(bytearray(b'abcdef'), 3)
+    assert bytes(parser.cooked) == b'abc'
+
+
+def test_matcher_leftmost_terminator_wins():
+    matcher = TerminatorMatcher(CMD_TERMINATORS)
+    data = b'line\r\nPress SPACE key to continue.\r\n>'
+    index, start, end = matcher.search(data)
+    assert CMD_TERMINATORS[index] == b'Press SPACE key to continue.'
+    assert data[start:end] == CMD_TERMINATORS[index]
+    assert matcher.search(b'no terminator') is None
+
+
+def test_matcher_force_load_and_press_enter_are_separate():
+    matcher = TerminatorMatcher(AS_TERMINATORS)
+    force = matcher.search(b'\r\nForce load')
+    enter = matcher.search(b'\r\nPress ENTER.')
+    assert force is not None and enter is not None
+    assert AS_TERMINATORS[force[0]] == b'Force load'
+    assert AS_TERMINATORS[enter[0]] == b'Press ENTER.'
+    assert AS_REPLIES[force[0]] == b'9\r\n'
+    assert AS_REPLIES[enter[0]] == b'\r\n'
+
+
+def test_matcher_resume_keeps_partial_terminator():
+    matcher = TerminatorMatcher(AS_TERMINATORS)
+    data = bytearray(b'xxxxForce lo')
+    assert matcher.search(data) is None
+    pos = matcher.resume(len(data))
+    data += b'ad'
+    index, _, end = matcher.search(data, pos)
+    assert AS_TERMINATORS[index] == b'Force load'
+    assert end == len(data)
+
+
+def _telnet_pair():
+    client, server = socket.socketpair()
+    telnet = Telnet(connect=lambda address, timeout: client)
+    telnet.open('localhost')
+    return telnet, server
+
+
+def test_expect_terminator_split_across_reads():
+    telnet, server = _telnet_pair()
+    try:
+        server.sendall(b'Loading...Force lo')
+        threading.Timer(0.05, server.sendall, (b'ad\r\nPress ENT',)).start()
+        index, terminator, data = telnet.expect(TerminatorMatcher(AS_TERMINATORS), 2)
+        assert terminator == b'Force load'
+        assert data == b'Loading...Force load'
+        threading.Timer(0.05, server.sendall, (b'ER.',)).start()
+        index, terminator, data = telnet.expect(TerminatorMatcher(AS_TERMINATORS), 2)
+        assert terminator == b'Press ENTER.'
+        assert data == b'\r\nPress ENTER.'
+    finally:
+        telnet.close()
+        server.close()
+
+
+def test_expect_timeout_returns_the_data():
+    telnet, server = _telnet_pair()
+    try:
+        server.sendall(b'partial')
+        assert telnet.expect([b'>'], 0.1) == (-1, None, b'partial')
+    finally:
+        telnet.close()
+        server.close()
+
+
+def test_read_until_answers_negotiation():
+    telnet, server = _telnet_pair()
+    try:
+        server.sendall(IAC + DO + ECHO + b'login: ')
+        assert telnet.read_until(b'login: ', 2) == b'login: '
+        assert server.recv(16) == IAC + bytes([252]) + ECHO
+    finally:
+        telnet.close()
+        server.close()
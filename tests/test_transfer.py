@@ -0,0 +1,217 @@
+import asyncio
+import itertools
+
+import pytest
+
+from pykrcc import simulator
+from pykrcc.asynckrcc import AsyncKRCC
+from pykrcc.pykrcc import pykrcc
+from pykrcc.simulator import ControllerSimulator
+
+SOURCE = ''.join(f'.PROGRAM p{i}()\n' + ''.join(f'  POINT a{j} = b{j}\n' for j in range(40)) + '.END\n'
+                 for i in range(8))
+
+
+@pytest.fixture
+def sim():
+    with ControllerSimulator() as sim:
+        yield sim
+
+
+def _blocks_size(sim) -> int:
+    # Every block carries the line break which ends the load record
+    return sum(sim.load_blocks) - 2 * len(sim.load_blocks)
+
+
+def _connect(sim, **kwargs) -> pykrcc:
+    session = pykrcc(ip=sim.host, port=sim.port, **kwargs)
+    session.progress = lambda val, total: None
+    assert session.IsConnected
+    return session
+
+
+def _stall_after(monkeypatch, sim, replies: int) -> None:
+    """
+    Stalls every reply of the simulator after the given number of replies.
+    """
+    counter = itertools.count()
+    monkeypatch.setattr(simulator.random, 'random', lambda: 1.0 if next(counter) < replies else 0.0)
+    sim.error_mode = 'stall'
+    sim.error_rate = 0.5
+
+
+def test_command(sim):
+    session = _connect(sim)
+    try:
+        code, response = session.command('id')
+        assert code == 0
+        assert 'Version 0.1' in response
+    finally:
+        session.disconnect()
+
+
+def test_command_timeout(sim, monkeypatch):
+    sim.stall_time = 2
+    session = _connect(sim)
+    try:
+        _stall_after(monkeypatch, sim, 0)
+        assert session.command('id', 0.3) == (-1, 'Timeout while reading')
+    finally:
+        session.disconnect()
+
+
+def test_async_command_timeout(sim, monkeypatch):
+    sim.stall_time = 2
+
+    async def run():
+        session = AsyncKRCC(ip=sim.host, port=sim.port)
+        assert await session.connect() == 0
+        try:
+            _stall_after(monkeypatch, sim, 0)
+            return await session.command('id', 0.3)
+        finally:
+            await session.disconnect()
+
+    assert asyncio.run(run()) == (-1, 'Timeout while reading')
+
+
+def test_save_load_round_trip(sim, tmp_path):
+    session = _connect(sim)
+    try:
+        assert session.load(SOURCE) == 0
+        assert sorted(sim.programs) == [f'p{i}' for i in range(8)]
+        fname = tmp_path / 'saved.as'
+        assert session.save(str(fname)) == 0
+        assert fname.read_text() == SOURCE
+        assert '\n'.join(session.iter_save('p3')) + '\n' == SOURCE.split('.END\n')[3] + '.END\n'
+    finally:
+        session.disconnect()
+
+
+def test_save_frame_ending_in_e(sim):
+    # The first frame ends inside the line, right after '  HOME'
+    sim.split_lines = False
+    sim.frame_size = 20
+    # Every frame arrives in a read of its own
+    sim.latency = 0.01
+    sim.store('.PROGRAM a()\r\n  HOME\r\n.END\r\n')
+    session = _connect(sim)
+    try:
+        assert list(session.iter_save()) == ['.PROGRAM a()', '  HOME', '.END']
+        assert session.command('id')[0] == 0
+    finally:
+        session.disconnect()
+
+
+def test_async_save_frame_ending_in_e(sim):
+    sim.split_lines = False
+    sim.frame_size = 20
+    # Every frame arrives in a read of its own
+    sim.latency = 0.01
+    sim.store('.PROGRAM a()\r\n  HOME\r\n.END\r\n')
+
+    async def run():
+        session = AsyncKRCC(ip=sim.host, port=sim.port)
+        assert await session.connect() == 0
+        try:
+            return [line async for line in session.iter_save()]
+        finally:
+            await session.disconnect()
+
+    assert asyncio.run(run()) == ['.PROGRAM a()', '  HOME', '.END']
+
+
+@pytest.mark.parametrize('kind', ['path', 'crlf', 'bytes', 'lines'])
+def test_load_sources(sim, tmp_path, kind):
+    fname = tmp_path / 'source.as'
+    if kind == 'path':
+        fname.write_text(SOURCE)
+        source = fname
+    elif kind == 'crlf':
+        fname.write_bytes(SOURCE.replace('\n', '\r\n').encode())
+        source = str(fname)
+    elif kind == 'bytes':
+        source = SOURCE.encode()
+    else:
+        source = SOURCE.splitlines()
+    session = _connect(sim)
+    progress = []
+    session.progress = lambda val, total: progress.append((val, total))
+    try:
+        assert session.load(source) == 0
+        assert '\n'.join(session.iter_save()) + '\n' == SOURCE
+        size = len(SOURCE.replace('\n', '\r\n')) if kind == 'crlf' else len(SOURCE)
+        assert progress[-1] == (size, size)
+        assert all(total == (None if kind == 'lines' else size) for val, total in progress[:-1])
+    finally:
+        session.disconnect()
+
+
+def test_load_without_block_ack(sim):
+    sim.block_ack = False
+    session = _connect(sim)
+    session.BlockPace = 0.01
+    try:
+        assert session.load(SOURCE) == 0
+        assert _blocks_size(sim) == len(SOURCE)
+        assert len(sim.programs) == 8
+    finally:
+        session.disconnect()
+
+
+def test_async_load_without_block_ack(sim):
+    sim.block_ack = False
+
+    async def run():
+        session = AsyncKRCC(ip=sim.host, port=sim.port)
+        assert await session.connect() == 0
+        session.progress = lambda val, total: None
+        session.BlockPace = 0.01
+        try:
+            return await session.load(SOURCE)
+        finally:
+            await session.disconnect()
+
+    assert asyncio.run(run()) == 0
+    assert _blocks_size(sim) == len(SOURCE)
+    assert len(sim.programs) == 8
+
+
+def test_save_stalled_in_the_middle(sim, tmp_path, monkeypatch):
+    sim.frame_size = 64
+    sim.stall_time = 2
+    sim.store(SOURCE)
+    session = _connect(sim, timeout=1)
+    try:
+        # Echo, header and two data frames arrive, then the controller stalls
+        _stall_after(monkeypatch, sim, 4)
+        assert session.save(str(tmp_path / 'saved.as')) == -1
+    finally:
+        session.disconnect()
+
+
+def test_iter_save_stalled_raises(sim, monkeypatch):
+    sim.frame_size = 64
+    sim.stall_time = 2
+    sim.store(SOURCE)
+    session = _connect(sim, timeout=1)
+    try:
+        _stall_after(monkeypatch, sim, 4)
+        with pytest.raises(TimeoutError):
+            for line in session.iter_save():
+                pass
+    finally:
+        session.disconnect()
+
+
+def test_load_end_not_received(sim, monkeypatch):
+    sim.block_ack = False
+    sim.stall_time = 2
+    session = _connect(sim, timeout=1)
+    session.BlockPace = 0.01
+    try:
+        # Echo, 'Loading...' and the start acknowledgement arrive, the end record stalls
+        _stall_after(monkeypatch, sim, 3)
+        assert session.load(SOURCE) == -1
+    finally:
+        session.disconnect()
@@ -0,0 +1,73 @@
+import pytest
+
+from pykrcc.pykrcc import pykrcc
+from pykrcc.simulator import ControllerSimulator
+from pykrcc.wire import CONNECT, RECEIVED, SENT, WireRecorder, WireReplay, read_capture
+
+SOURCE = '.PROGRAM a()\n  HOME\n.END\n'
+
+
+def _session(sim, transport) -> pykrcc:
+    session = pykrcc(ip=sim.host, port=sim.port, transport=transport)
+    session.progress = lambda val, total: None
+    assert session.IsConnected
+    return session
+
+
+@pytest.fixture
+def capture(tmp_path):
+    fname = str(tmp_path / 'session.wire')
+    with ControllerSimulator() as sim, WireRecorder(fname) as recorder:
+        session = _session(sim, recorder)
+        try:
+            assert session.command('id')[0] == 0
+            assert session.load(SOURCE) == 0
+            assert list(session.iter_save()) == SOURCE.splitlines()
+        finally:
+            session.disconnect()
+    return fname, sim
+
+
+def test_capture_holds_both_directions(capture):
+    fname, sim = capture
+    records = read_capture(fname)
+    assert records[0] == (records[0][0], CONNECT, f'{sim.host}:{sim.port}'.encode())
+    assert b'id\r\n' in b''.join(data for _, d, data in records if d == SENT)
+    assert b'Version 0.1' in b''.join(data for _, d, data in records if d == RECEIVED)
+    times = [t for t, _, _ in records]
+    assert times == sorted(times)
+
+
+def test_replay_without_controller(capture):
+    fname, sim = capture
+    replay = WireReplay(fname)
+    session = _session(sim, replay)
+    try:
+        code, response = session.command('id')
+        assert code == 0 and 'Version 0.1' in response
+        assert session.load(SOURCE) == 0
+        assert list(session.iter_save()) == SOURCE.splitlines()
+    finally:
+        session.disconnect()
+    replay.join(5)
+    assert replay.mismatch() == -1
+    with pytest.raises(ConnectionRefusedError):
+        replay(('127.0.0.1', 23))
+
+
+def test_replay_reports_a_different_client(capture):
+    fname, sim = capture
+    replay = WireReplay(fname, timeout=0.5)
+    session = _session(sim, replay)
+    session.command('id', 1)
+    session.disconnect()
+    replay.join(5)
+    assert replay.mismatch() >= 0
+    assert replay.expected().startswith(bytes(replay.sent[0]))
+
+
+def test_not_a_capture(tmp_path):
+    fname = tmp_path / 'other.bin'
+    fname.write_bytes(b'data')
+    with pytest.raises(ValueError):
+        read_capture(str(fname))